@@ -0,0 +1,131 @@
+"""Shared fixtures of the benchmark suite.
+
+Run with ``make bench`` or ``pytest benchmarks``. All measurements are collected
+in one JSON document written at the end of the session, by default to
+``bench_results.json`` or to the file given by ``--bench-output``.
+"""
+
+import json
+import platform
+import statistics
+import sys
+import time
+
+import pytest
+
+from .mockserver import RESULT as STUB_RESULT, MockServer
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--bench-output",
+        default="bench_results.json",
+        help="File to write benchmark results to as JSON.",
+    )
+    parser.addoption(
+        "--bench-repeat",
+        type=int,
+        default=5,
+        help="Number of repetitions per measurement.",
+    )
+
+
+def summarize(samples):
+    """Summary statistics of a list of durations in seconds."""
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "min": samples[0],
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "max": samples[-1],
+        "p99": samples[min(len(samples) - 1, int(0.99 * len(samples)))],
+    }
+
+
+class Report:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = {}
+
+    def add(self, name, **values):
+        self.results[name] = values
+
+    def document(self):
+        return {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "results": self.results,
+        }
+
+
+@pytest.fixture(scope="session")
+def bench_report(request):
+    report = Report(request.config.getoption("--bench-repeat"))
+    yield report
+    with open(request.config.getoption("--bench-output"), "w") as fh:
+        json.dump(report.document(), fh, indent=2, sort_keys=True)
+
+
+class StubResponse:
+    status_code = 200
+    headers = {}
+
+    def json(self):
+        return STUB_RESULT
+
+    def iter_content(self, chunk_size=1):
+        yield json.dumps(STUB_RESULT).encode("utf8")
+
+    def close(self):
+        pass
+
+
+class StubClient:
+    """Answers every request immediately with `STUB_RESULT`."""
+
+    def post(self, url, **kwargs):
+        return StubResponse()
+
+    get = post
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    """Replaces the HTTP layer, so measurements do not depend on the network."""
+    from leruli import internal
+
+    monkeypatch.setattr(internal, "client", StubClient())
+    internal.disable_cache()
+    yield
+    monkeypatch.setattr(internal, "_cache_configured", False)
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """Starts local mock API servers and points the client at the last one started.
+
+    Client side rate limits are lifted and the cache is disabled, so the
+    measurements reflect the HTTP path alone.
+    """
+    from leruli import internal, ratelimit
+
+    servers = []
+
+    def start(**options):
+        server = MockServer(**options).start()
+        servers.append(server)
+        monkeypatch.setattr(internal, "BASEURL", server.url)
+        monkeypatch.setattr(internal, "client", internal.Client())
+        return server
+
+    monkeypatch.setattr(internal, "_breakers", {})
+    monkeypatch.setattr(ratelimit, "_limiters", {})
+    internal.disable_cache()
+    yield start
+    monkeypatch.setattr(internal, "_cache_configured", False)
+    internal.client.close()
+    for server in servers:
+        server.stop()
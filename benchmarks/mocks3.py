@@ -0,0 +1,344 @@
+"""Local S3 compatible stand-in, for benchmarks of the submit pipeline.
+
+Implements the subset of the S3 protocol used by the client through minio and
+aiobotocore: buckets, objects, multipart uploads, object listings and batch
+deletes, with path-style addressing. Signatures are not checked. Objects are
+kept in memory.
+
+Use it in-process::
+
+    with MockS3() as s3:
+        os.environ["LERULI_S3_SERVER"] = s3.url
+
+or as a subprocess::
+
+    python -m benchmarks.mocks3 --port 9000
+"""
+
+import argparse
+import collections
+import hashlib
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape, unescape
+
+NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class MockS3:
+    """Threaded HTTP server answering like an S3 object store.
+
+    Parameters
+    ----------
+    port : int, optional
+        Port to listen on, by default a free one.
+    latency : float, optional
+        Seconds every response is delayed by.
+    capacity : int, optional
+        Requests handled at once, further ones queue like at a weak server.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0, capacity: int = None):
+        self.latency = latency
+        self.capacity = threading.BoundedSemaphore(capacity) if capacity else None
+        self.buckets = {}
+        self.requests = collections.Counter()
+        self.bytes_received = 0
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+        handler = type("Handler", (_Handler,), {"mock": self})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stored_bytes(self):
+        """Total size of all stored objects."""
+        with self._lock:
+            return sum(
+                len(data)
+                for objects in self.buckets.values()
+                for data in objects.values()
+            )
+
+    def handle(self, method: str, path: str, query: dict, body: bytes):
+        """Status code, headers and body answering a request."""
+        bucket, _, key = urllib.parse.unquote(path.lstrip("/")).partition("/")
+        operation = f"{method} {'object' if key else 'bucket' if bucket else 'service'}"
+        if "uploads" in query or "uploadId" in query:
+            operation += " multipart"
+        with self._lock:
+            self.requests[operation] += 1
+            self.bytes_received += len(body)
+
+        if not bucket:
+            return 200, {}, _list_buckets(self.buckets)
+        if bucket not in self.buckets and not (method == "PUT" and not key):
+            return _error(404, "NoSuchBucket")
+        if not key:
+            return self._bucket(method, bucket, query, body)
+        return self._object(method, bucket, key, query, body)
+
+    def _bucket(self, method, bucket, query, body=b""):
+        if method == "PUT":
+            with self._lock:
+                if bucket in self.buckets:
+                    return _error(409, "BucketAlreadyOwnedByYou")
+                self.buckets[bucket] = {}
+            return 200, {"Location": f"/{bucket}"}, b""
+        if method == "HEAD":
+            return 200, {}, b""
+        if method == "DELETE":
+            with self._lock:
+                if self.buckets[bucket]:
+                    return _error(409, "BucketNotEmpty")
+                del self.buckets[bucket]
+            return 204, {}, b""
+        if method == "POST" and "delete" in query:
+            keys = [
+                unescape(_)
+                for _ in re.findall(r"<Key>(.*?)</Key>", body.decode("utf8"))
+            ]
+            with self._lock:
+                for key in keys:
+                    self.buckets[bucket].pop(key, None)
+            deleted = "".join(
+                f"<Deleted><Key>{escape(_)}</Key></Deleted>" for _ in keys
+            )
+            return 200, {}, _xml("DeleteResult", deleted)
+        if "location" in query:
+            return 200, {}, _xml("LocationConstraint", "")
+        if method == "GET":
+            return 200, {}, self._list_objects(bucket, query)
+        return _error(405, "MethodNotAllowed")
+
+    def _object(self, method, bucket, key, query, body):
+        objects = self.buckets[bucket]
+        if method == "POST" and "uploads" in query:
+            upload = uuid.uuid4().hex
+            with self._lock:
+                self._uploads[upload] = {}
+            return (
+                200,
+                {},
+                _xml(
+                    "InitiateMultipartUploadResult",
+                    f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><UploadId>{upload}</UploadId>",
+                ),
+            )
+        if method == "PUT" and "uploadId" in query:
+            with self._lock:
+                if query["uploadId"] not in self._uploads:
+                    return _error(404, "NoSuchUpload")
+                self._uploads[query["uploadId"]][int(query["partNumber"])] = body
+            return 200, {"ETag": _etag(body)}, b""
+        if method == "POST" and "uploadId" in query:
+            with self._lock:
+                parts = self._uploads.pop(query["uploadId"], None)
+            if parts is None:
+                return _error(404, "NoSuchUpload")
+            data = b"".join(parts[_] for _ in sorted(parts))
+            with self._lock:
+                objects[key] = data
+            etag = _etag(data)
+            return (
+                200,
+                {},
+                _xml(
+                    "CompleteMultipartUploadResult",
+                    f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><ETag>{escape(etag)}</ETag>",
+                ),
+            )
+        if method == "DELETE" and "uploadId" in query:
+            with self._lock:
+                self._uploads.pop(query["uploadId"], None)
+            return 204, {}, b""
+        if method == "PUT":
+            with self._lock:
+                objects[key] = body
+            return 200, {"ETag": _etag(body)}, b""
+        if method == "DELETE":
+            with self._lock:
+                objects.pop(key, None)
+            return 204, {}, b""
+        if key not in objects:
+            return _error(404, "NoSuchKey")
+        data = objects[key]
+        headers = {"ETag": _etag(data), "Content-Type": "binary/octet-stream"}
+        if method == "HEAD":
+            headers["Content-Length"] = str(len(data))
+            return 200, headers, None
+        return 200, headers, data
+
+    def _list_objects(self, bucket, query):
+        prefix = query.get("prefix", "")
+        delimiter = query.get("delimiter", "")
+        with self._lock:
+            keys = sorted(_ for _ in self.buckets[bucket] if _.startswith(prefix))
+            sizes = {_: len(self.buckets[bucket][_]) for _ in keys}
+        contents, prefixes = [], []
+        for key in keys:
+            if delimiter and delimiter in key[len(prefix) :]:
+                common = key[: key.index(delimiter, len(prefix)) + len(delimiter)]
+                if common not in prefixes:
+                    prefixes.append(common)
+                continue
+            contents.append(
+                f"<Contents><Key>{escape(key)}</Key><Size>{sizes[key]}</Size>"
+                f"<LastModified>{time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())}</LastModified>"
+                "<ETag>&quot;0&quot;</ETag><StorageClass>STANDARD</StorageClass></Contents>"
+            )
+        body = (
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+            f"<KeyCount>{len(contents) + len(prefixes)}</KeyCount><MaxKeys>1000000</MaxKeys>"
+            f"<Delimiter>{escape(delimiter)}</Delimiter><IsTruncated>false</IsTruncated>"
+            + "".join(contents)
+            + "".join(
+                f"<CommonPrefixes><Prefix>{escape(_)}</Prefix></CommonPrefixes>"
+                for _ in prefixes
+            )
+        )
+        return _xml("ListBucketResult", body)
+
+
+def _etag(data: bytes):
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def _xml(root: str, body: str):
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{NAMESPACE}">{body}</{root}>'
+    ).encode("utf8")
+
+
+def _error(status: int, code: str):
+    body = f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code><Message>{code}</Message></Error>'
+    return status, {}, body.encode("utf8")
+
+
+def _list_buckets(buckets):
+    entries = "".join(
+        f"<Bucket><Name>{escape(_)}</Name><CreationDate>2022-01-01T00:00:00.000Z</CreationDate></Bucket>"
+        for _ in sorted(buckets)
+    )
+    return _xml(
+        "ListAllMyBucketsResult",
+        f"<Owner><ID>mock</ID></Owner><Buckets>{entries}</Buckets>",
+    )
+
+
+def _decode_aws_chunked(body: bytes):
+    """Payload of a body in the aws-chunked encoding used for streaming uploads."""
+    data, offset = [], 0
+    while True:
+        end = body.index(b"\r\n", offset)
+        size = int(body[offset:end].split(b";")[0], 16)
+        if size == 0:
+            return b"".join(data)
+        data.append(body[end + 2 : end + 2 + size])
+        offset = end + 2 + size + 2
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    mock = None
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    # trailers end with an empty line
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            body = b"".join(chunks)
+        else:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+        if "aws-chunked" in self.headers.get(
+            "Content-Encoding", ""
+        ) or self.headers.get("x-amz-content-sha256", "").startswith("STREAMING-"):
+            body = _decode_aws_chunked(body)
+        return body
+
+    def _respond(self):
+        body = self._read_body()
+        if self.mock.capacity is not None:
+            self.mock.capacity.acquire()
+        try:
+            if self.mock.latency:
+                time.sleep(self.mock.latency)
+            url = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+            status, headers, data = self.mock.handle(
+                self.command, url.path, query, body
+            )
+        finally:
+            if self.mock.capacity is not None:
+                self.mock.capacity.release()
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if "Content-Length" not in headers:
+            self.send_header("Content-Length", str(len(data or b"")))
+        if data and "Content-Type" not in headers:
+            self.send_header("Content-Type", "application/xml")
+        self.end_headers()
+        if data and self.command != "HEAD":
+            self.wfile.write(data)
+
+    do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--capacity", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockS3(args.port, args.latency, args.capacity)
+    print(f"Serving mock S3 at {server.url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""Local stand-in for the Leruli API, for benchmarks without network access.
+
+The server implements the endpoints used by the client, including delayed
+(202) results, ``result/{token}`` and the task endpoints, with adjustable
+latency, throughput and failure rates. Use it in-process::
+
+    with MockServer(latency=0.01, delay_rate=0.5) as server:
+        internal.BASEURL = server.url
+
+or as a subprocess and point the client at it via ``LERULI_BASEURL``::
+
+    python -m benchmarks.mockserver --port 8765 --latency 0.01
+    LERULI_BASEURL=http://127.0.0.1:8765 leruli graph-to-logp CC
+"""
+
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# superset of the fields the client reads from API results
+RESULT = {
+    "reference": "stub",
+    "formula": "C2H6",
+    "graph": "CC",
+    "name": "ethane",
+    "bp": -89.0,
+    "mp": -182.8,
+    "logp": 1.8,
+    "geometry": "2\n\nC 0 0 0\nC 0 0 1.5",
+    "molecules": [{"name": "ethane", "smiles": "CC"}],
+    "data": [{"cores": 1, "time": 1}],
+    "image": "",
+    "solvation_energies": {"298": 1.0},
+}
+
+
+class MockServer:
+    """Threaded HTTP server answering like the Leruli API.
+
+    Parameters
+    ----------
+    port : int, optional
+        Port to listen on, by default a free one.
+    latency : float, optional
+        Seconds every response is delayed by.
+    time_to_result : float, optional
+        Seconds until a delayed result becomes available.
+    delay_rate : float, optional
+        Fraction of property requests answered with a delayed (202) result.
+    error_rate : float, optional
+        Fraction of requests answered with status 500. Bulk submissions fail per job instead.
+    max_rate : float, optional
+        Requests per second accepted before answering with 429, unlimited by default.
+    molecules : int, optional
+        Number of molecules returned by ``formula-to-graphs``.
+    seed : int, optional
+        Seed of the random failure and delay decisions.
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0,
+        time_to_result: float = 0.05,
+        delay_rate: float = 0,
+        error_rate: float = 0,
+        max_rate: float = None,
+        molecules: int = 1,
+        seed: int = 42,
+    ):
+        self.latency = latency
+        self.time_to_result = time_to_result
+        self.delay_rate = delay_rate
+        self.error_rate = error_rate
+        self.max_rate = max_rate
+        self.molecules = molecules
+        self.requests = collections.Counter()
+        self.jobs = {}
+        self._random = random.Random(seed)
+        self._results = {}
+        self._lock = threading.Lock()
+        self._tokens = max_rate or 0
+        self._updated = time.monotonic()
+
+        handler = type("Handler", (_Handler,), {"mock": self})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _chance(self, rate: float):
+        with self._lock:
+            return self._random.random() < rate
+
+    def _admit(self):
+        """Token bucket of the server side rate limit."""
+        if self.max_rate is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._tokens + (now - self._updated) * self.max_rate, self.max_rate
+            )
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _delayed(self, result):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._results[token] = (time.monotonic() + self.time_to_result, result)
+        return 202, {"token": token, "time_to_result": self.time_to_result}
+
+    def handle(self, method: str, path: str, payload):
+        """Status code and JSON document answering a request."""
+        parts = path.strip("/").split("/")
+        endpoint = "/".join(parts[1:])
+        if endpoint.startswith("result/"):
+            endpoint = "result"
+        with self._lock:
+            self.requests[endpoint] += 1
+
+        if not self._admit():
+            return 429, {"detail": "Too many requests"}
+        if endpoint != "bulk/task-submit" and self._chance(self.error_rate):
+            return 500, {"detail": "Injected failure"}
+
+        if endpoint == "result":
+            with self._lock:
+                ready, result = self._results.get(parts[-1], (None, None))
+            if ready is None:
+                return 404, {"detail": "No such token"}
+            remaining = ready - time.monotonic()
+            if remaining > 0:
+                return 202, {"token": parts[-1], "time_to_result": remaining}
+            with self._lock:
+                del self._results[parts[-1]]
+            return 200, result
+        if endpoint == "task-submit":
+            return 200, self._submit(payload)
+        if endpoint == "bulk/task-submit":
+            results = []
+            for job in payload:
+                if self._chance(self.error_rate):
+                    results.append({"status": 500, "data": None})
+                else:
+                    results.append({"status": 200, "data": self._submit(job)})
+            return 200, results
+        if endpoint in ("task-status", "task-cancel"):
+            if payload.get("jobid") not in self.jobs:
+                return 404, {"detail": "No such job"}
+            if endpoint == "task-cancel":
+                self.jobs[payload["jobid"]] = "cancelled"
+            return 200, {"status": self.jobs[payload["jobid"]]}
+        if endpoint == "group-token":
+            return 200, "mockgroup"
+        if method != "POST" or len(parts) != 2:
+            return 404, {"detail": "Not found"}
+
+        result = RESULT
+        if endpoint == "formula-to-graphs" and self.molecules != 1:
+            result = dict(RESULT)
+            result["molecules"] = [
+                {"name": f"isomer {_}", "smiles": "C" * (_ % 50 + 1)}
+                for _ in range(self.molecules)
+            ]
+        if self._chance(self.delay_rate):
+            return self._delayed(result)
+        return 200, result
+
+    def _submit(self, job: dict):
+        jobid = uuid.uuid4().hex
+        with self._lock:
+            self.jobs[jobid] = "pending"
+        return jobid
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, so the client connection pool is exercised as in production
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    mock = None
+
+    def _respond(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            payload = None
+        if self.mock.latency:
+            time.sleep(self.mock.latency)
+        status, document = self.mock.handle(method, self.path.split("?")[0], payload)
+
+        data = json.dumps(document).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond("GET")
+
+    def do_POST(self):
+        self._respond("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--time-to-result", type=float, default=0.05)
+    parser.add_argument("--delay-rate", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--max-rate", type=float, default=None)
+    parser.add_argument("--molecules", type=int, default=1)
+    args = parser.parse_args()
+
+    server = MockServer(
+        args.port,
+        args.latency,
+        args.time_to_result,
+        args.delay_rate,
+        args.error_rate,
+        args.max_rate,
+        args.molecules,
+    )
+    print(f"Serving mock API at {server.url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Throughput and latency of API calls against the local mock server."""
+
+import asyncio
+import concurrent.futures
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import leruli
+from leruli import internal, task
+
+from .conftest import summarize
+
+# mock server settings per scenario
+SCENARIOS = {
+    "immediate": {},
+    "latency": {"latency": 0.005},
+    "delayed": {"delay_rate": 1, "time_to_result": 0.02},
+    "errors": {"error_rate": 0.05},
+}
+
+
+async def _bulk_submit(cases):
+    """All cases through `bulk/task-submit`, in concurrent batches as `task_submit_many` sends them."""
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        return await asyncio.gather(
+            *[
+                task._task_submit_many_API(session, cases[_ : _ + task.BATCH_SIZE])
+                for _ in range(0, len(cases), task.BATCH_SIZE)
+            ]
+        )
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _record(bench_report, name, samples, elapsed, requests, **extra):
+    stats = summarize(samples)
+    bench_report.add(
+        name,
+        calls_per_second=len(samples) / elapsed,
+        requests_per_second=requests / elapsed,
+        p50=stats["median"],
+        p99=stats["p99"],
+        latency=stats,
+        **extra,
+    )
+
+
+@pytest.mark.parametrize("scenario", list(SCENARIOS))
+def test_single_calls(scenario, mock_api, bench_report):
+    """Sequential blocking calls, one distinct graph each."""
+    server = mock_api(**SCENARIOS[scenario])
+    calls = 100 * bench_report.repeat
+    start = time.perf_counter()
+    samples = [_timed(leruli.graph_to_logP, "C" * (_ + 1)) for _ in range(calls)]
+    elapsed = time.perf_counter() - start
+    _record(
+        bench_report,
+        f"api_single_{scenario}",
+        samples,
+        elapsed,
+        sum(server.requests.values()),
+    )
+
+
+@pytest.mark.parametrize("scenario", list(SCENARIOS))
+def test_concurrent_calls(scenario, mock_api, bench_report):
+    """Blocking calls issued from 16 threads sharing the connection pool."""
+    server = mock_api(**SCENARIOS[scenario])
+    calls = 200 * bench_report.repeat
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(16) as executor:
+        samples = list(
+            executor.map(
+                lambda _: _timed(leruli.graph_to_logP, "C" * (_ + 1)), range(calls)
+            )
+        )
+    elapsed = time.perf_counter() - start
+    _record(
+        bench_report,
+        f"api_concurrent_{scenario}",
+        samples,
+        elapsed,
+        sum(server.requests.values()),
+    )
+
+
+@pytest.mark.parametrize("scenario", ["immediate", "latency", "delayed"])
+def test_batch_calls(scenario, mock_api, bench_report):
+    """`graph_to_properties` over many graphs, latency per chunk of rows."""
+    server = mock_api(**SCENARIOS[scenario])
+    graphs = ["C" * (_ + 1) for _ in range(200 * bench_report.repeat)]
+    start = time.perf_counter()
+    samples = []
+    for offset in range(0, len(graphs), 100):
+        samples.append(
+            _timed(
+                leruli.graph_to_properties,
+                graphs[offset : offset + 100],
+                ["logP", "bp"],
+            )
+        )
+    elapsed = time.perf_counter() - start
+    _record(
+        bench_report,
+        f"api_batch_{scenario}",
+        samples,
+        elapsed,
+        sum(server.requests.values()),
+        rows_per_second=len(graphs) / elapsed,
+    )
+
+
+@pytest.mark.parametrize("scenario", ["immediate", "latency", "errors"])
+def test_submits(scenario, mock_api, bench_report, tmp_path, monkeypatch):
+    """Single `task-submit` calls and `bulk/task-submit` in batches of 50."""
+    monkeypatch.setenv("LERULI_API_SECRET", "benchmark")
+    server = mock_api(**SCENARIOS[scenario])
+    jobs = 50 * bench_report.repeat
+    payload = {"secret": "benchmark", "bucketid": "bucket", "codeversion": "c:1"}
+
+    samples = [
+        _timed(
+            internal.client.post,
+            f"{internal.BASEURL}/v22_1/task-submit",
+            json=payload,
+            retries=0,
+        )
+        for _ in range(jobs)
+    ]
+    elapsed = sum(samples)
+    _record(bench_report, f"api_submit_{scenario}", samples, elapsed, jobs)
+
+    cases = []
+    for _ in range(jobs * 4):
+        directory = tmp_path / str(_)
+        directory.mkdir()
+        cases.append((payload, str(directory)))
+    requests = sum(server.requests.values())
+    start = time.perf_counter()
+    failed = asyncio.run(_bulk_submit(cases))
+    elapsed = time.perf_counter() - start
+    bench_report.add(
+        f"api_bulk_submit_{scenario}",
+        jobs_per_second=len(cases) / elapsed,
+        requests_per_second=(sum(server.requests.values()) - requests) / elapsed,
+        failed=sum(len(_) for _ in failed),
+    )
+
+
+def test_cli_subprocess(mock_api, bench_report, tmp_path):
+    """Batch mode of the command line interface, pointed at the server via LERULI_BASEURL."""
+    server = mock_api(latency=0.001)
+    inputs = tmp_path / "graphs.txt"
+    inputs.write_text("\n".join("C" * (_ + 1) for _ in range(500)))
+    env = dict(os.environ, LERULI_BASEURL=server.url, LERULI_RATELIMIT_PROPERTIES="0")
+    samples = []
+    for _ in range(bench_report.repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "leruli.cli", "--no-cache", "graph-to-logp"]
+            + ["--batch", str(inputs), "--jobs", "16"],
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        samples.append(time.perf_counter() - start)
+    stats = summarize(samples)
+    bench_report.add("api_cli_batch", wall=stats, rows_per_second=500 / stats["median"])
@@ -0,0 +1,63 @@
+"""Archive throughput and ratio of the compression codecs on typical job directories."""
+
+import tarfile
+import time
+
+import pytest
+
+from leruli import archive
+
+from .conftest import summarize
+from .workload import make_tree
+
+CODECS = ["gzip:1", "gzip:6", "gzip:9", "store", "zstd:3", "zstd:10"]
+
+
+class Sink:
+    """Counts the bytes written instead of keeping them."""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+
+def _baseline(directory, fileobj):
+    # single threaded tar.gz as written before the codecs were added
+    with tarfile.open(fileobj=fileobj, mode="w:gz") as tar:
+        tar.add(directory, arcname=".")
+
+
+@pytest.fixture(scope="module")
+def job_directory(tmp_path_factory):
+    root = tmp_path_factory.mktemp("compression")
+    directories, size = make_tree(str(root), "huge")
+    return directories[0], size // len(directories)
+
+
+@pytest.mark.parametrize("codec", ["baseline"] + CODECS)
+def test_compression(codec, job_directory, bench_report):
+    if codec.startswith("zstd"):
+        pytest.importorskip("zstandard")
+    directory, size = job_directory
+    samples = []
+    for _ in range(bench_report.repeat):
+        sink = Sink()
+        start = time.perf_counter()
+        if codec == "baseline":
+            _baseline(directory, sink)
+        else:
+            archive.write(sink, directory, ["./run"], codec)
+        samples.append(time.perf_counter() - start)
+    stats = summarize(samples)
+    bench_report.add(
+        f"compression_{codec}",
+        input_bytes=size,
+        output_bytes=sink.size,
+        ratio=sink.size / size,
+        megabytes_per_second=size / stats["median"] / 2**20,
+        threads=archive.THREADS,
+        seconds=stats,
+    )
@@ -0,0 +1,136 @@
+"""Startup time of ``import leruli`` and the ``leruli`` command line interface."""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from leruli import cli
+
+from .conftest import summarize
+
+# example arguments for every command which queries the API
+INVOCATIONS = {
+    "canonical-formula": ["C2H6"],
+    "canonical-graph": ["CC"],
+    "formula-to-cost": ["C2H6", "def2-TZVP"],
+    "formula-to-graphs": ["C2H6"],
+    "graph-to-boiling-point": ["CC"],
+    "graph-to-formula": ["CC"],
+    "graph-to-geometry": ["CC"],
+    "graph-to-image": ["CC", os.path.join(tempfile.gettempdir(), "leruli-bench.svg")],
+    "graph-to-logd": ["CC"],
+    "graph-to-logp": ["CC"],
+    "graph-to-melting-point": ["CC"],
+    "graph-to-name": ["CC"],
+    "graph-to-pka": ["CC"],
+    "graph-to-solvation-energy": ["--quiet", "CC", "water", "298"],
+    "name-to-graph": ["ethane"],
+}
+
+SCENARIOS = {
+    "python": "pass",
+    "import_leruli": "import leruli",
+    "import_internal": "import leruli.internal",
+    "cli_help": "import sys; sys.argv = ['leruli', '--help']\nfrom leruli.cli import main\ntry:\n    main()\nexcept SystemExit:\n    pass",
+}
+
+
+def _run(code, env=None, args=()):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *args, "-c", code],
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    return time.perf_counter() - start
+
+
+@pytest.mark.parametrize("scenario", list(SCENARIOS))
+def test_interpreter_startup(scenario, bench_report):
+    """Wall time of a fresh interpreter, without (cold) and with (warm) bytecode cache."""
+    code = SCENARIOS[scenario]
+    cold = []
+    for _ in range(bench_report.repeat):
+        with tempfile.TemporaryDirectory() as pycache:
+            env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache)
+            cold.append(_run(code, env))
+    _run(code)
+    warm = [_run(code) for _ in range(bench_report.repeat)]
+    bench_report.add(
+        f"startup.{scenario}", cold=summarize(cold), warm=summarize(warm), unit="s"
+    )
+
+
+def _importtime(code):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    ).stderr
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = {"self": int(own), "cumulative": int(cumulative)}
+    return modules
+
+
+@pytest.mark.parametrize("scenario", ["import_leruli", "import_internal", "cli_help"])
+def test_import_breakdown(scenario, bench_report):
+    """Per-module import time as reported by ``python -X importtime``, in microseconds."""
+    modules = _importtime(SCENARIOS[scenario])
+    top = sorted(modules.items(), key=lambda _: -_[1]["cumulative"])[:20]
+    bench_report.add(
+        f"importtime.{scenario}",
+        unit="us",
+        total=sum(_["self"] for _ in modules.values()),
+        leruli={k: v for k, v in modules.items() if k.startswith("leruli")},
+        top=dict(top),
+    )
+
+
+def _dispatch(args, repeat):
+    runner = CliRunner()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = runner.invoke(cli.cli, args, catch_exceptions=False)
+        samples.append(time.perf_counter() - start)
+        assert result.exit_code == 0, result.output
+    return summarize(samples)
+
+
+@pytest.mark.parametrize("command", sorted(cli.cli.commands))
+def test_dispatch_help(command, bench_report):
+    """Time for click to resolve a command and render its help."""
+    bench_report.add(
+        f"dispatch.help.{command}",
+        unit="s",
+        **_dispatch([command, "--help"], bench_report.repeat),
+    )
+
+
+@pytest.mark.parametrize("command", sorted(INVOCATIONS))
+def test_dispatch_invocation(command, stub_api, bench_report):
+    """Time from command line to printed result, with the HTTP layer stubbed out."""
+    bench_report.add(
+        f"dispatch.invoke.{command}",
+        unit="s",
+        **_dispatch([command, *INVOCATIONS[command]], bench_report.repeat),
+    )
+
+
+def test_all_commands_covered():
+    """Fails when a command is added to the CLI without a benchmark invocation."""
+    tasks = {_ for _ in cli.cli.commands if _.startswith(("task-", "cache-"))}
+    assert set(cli.cli.commands) - tasks == set(INVOCATIONS)
@@ -0,0 +1,243 @@
+"""End-to-end throughput of `task_submit_many` against local API and S3 servers."""
+
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+from .conftest import summarize
+from .mocks3 import MockS3
+from .workload import LAYOUTS, edit_tree, make_tree, reset_tree
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def mock_s3():
+    with MockS3() as server:
+        yield server
+
+
+def _environment(api, mock_s3):
+    return dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        LERULI_BASEURL=api.url,
+        LERULI_API_SECRET="benchmark",
+        LERULI_S3_SERVER=mock_s3.url,
+        LERULI_S3_ACCESS="benchmark",
+        LERULI_S3_SECRET="benchmark",
+    )
+
+
+def _run(root, env, *flags):
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.workload", str(root), *flags],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    ).stdout
+    result = json.loads(out)
+    assert result["failed"] == 0
+    return result
+
+
+@pytest.mark.parametrize(
+    "layout, dedup", [(_, False) for _ in LAYOUTS] + [("shared", True)]
+)
+def test_submit_many(layout, dedup, mock_api, mock_s3, bench_report, tmp_path):
+    """Wall time, throughput, upload volume and peak memory of the full submit path."""
+    api = mock_api()
+    directories, size = make_tree(str(tmp_path), layout)
+    env = _environment(api, mock_s3)
+
+    runs = []
+    for _ in range(bench_report.repeat):
+        reset_tree(directories)
+        received = mock_s3.bytes_received
+        result = _run(tmp_path, env, *(["--dedup"] if dedup else []))
+        result["uploaded"] = mock_s3.bytes_received - received
+        runs.append(result)
+
+    seconds = summarize([_["seconds"] for _ in runs])
+    bench_report.add(
+        f"submit_many_{layout}{'_dedup' if dedup else ''}",
+        jobs=len(directories),
+        input_bytes=size,
+        uploaded_bytes=runs[-1]["uploaded"],
+        jobs_per_second=len(directories) / seconds["median"],
+        bytes_per_second=size / seconds["median"],
+        first_queued=summarize([_["first_queued"] for _ in runs])["median"],
+        peak_rss_mb=max(_["peak_rss_mb"] for _ in runs),
+        seconds=seconds,
+        stages={
+            stage: {
+                key: summarize([_["stages"][stage][key] for _ in runs])["median"]
+                for key in ("busy", "total", "p95")
+            }
+            for stage in runs[0]["stages"]
+        },
+        s3_requests=dict(mock_s3.requests),
+    )
+
+
+@pytest.mark.parametrize("layout", ["mixed", "huge"])
+def test_resubmit_many(layout, mock_api, mock_s3, bench_report, tmp_path):
+    """Upload volume and wall time of resubmitting directories after a small edit."""
+    api = mock_api()
+    directories, size = make_tree(str(tmp_path), layout)
+    env = _environment(api, mock_s3)
+    _run(tmp_path, env, "--dedup")
+
+    runs = []
+    for _ in range(bench_report.repeat):
+        edit_tree(directories)
+        received = mock_s3.bytes_received
+        result = _run(tmp_path, env, "--resubmit")
+        result["uploaded"] = mock_s3.bytes_received - received
+        runs.append(result)
+
+    seconds = summarize([_["seconds"] for _ in runs])
+    bench_report.add(
+        f"resubmit_many_{layout}",
+        jobs=len(directories),
+        input_bytes=size,
+        uploaded_bytes=runs[-1]["uploaded"],
+        seconds=seconds,
+        s3_requests=dict(mock_s3.requests),
+    )
+
+
+@pytest.mark.parametrize("bucket", [None, "jobs-benchmark"])
+def test_storage_layout(bucket, mock_api, mock_s3, bench_report, tmp_path, monkeypatch):
+    """Submitting and pruning with one bucket per job or prefixes of a shared bucket."""
+    from leruli import task
+
+    api = mock_api()
+    directories, size = make_tree(str(tmp_path), "tiny")
+    env = _environment(api, mock_s3)
+    result = _run(tmp_path, env, *(["--bucket", bucket] if bucket else []))
+    submitted = dict(mock_s3.requests)
+
+    for name in ("LERULI_S3_SERVER", "LERULI_S3_ACCESS", "LERULI_S3_SECRET"):
+        monkeypatch.setenv(name, env[name])
+    mock_s3.requests.clear()
+    start = time.perf_counter()
+    for directory in directories:
+        with open(os.path.join(directory, "leruli.bucket")) as fh:
+            task.task_prune(fh.read().strip())
+    pruned = time.perf_counter() - start
+    assert mock_s3.stored_bytes() == 0
+
+    bench_report.add(
+        f"storage_layout_{'shared' if bucket else 'per_job'}",
+        jobs=len(directories),
+        submit_seconds=result["seconds"],
+        jobs_per_second=len(directories) / result["seconds"],
+        bucket_busy=result["stages"]["bucket"]["busy"],
+        prune_seconds=pruned,
+        submit_requests=submitted,
+        prune_requests=dict(mock_s3.requests),
+    )
+
+
+@pytest.mark.parametrize(
+    "server, flags",
+    [
+        ("fast", []),
+        ("weak", []),
+        ("weak", ["--max-uploads", "4"]),
+        ("weak", ["--processes", "5", "--max-uploads", "1000"]),
+    ],
+)
+def test_upload_concurrency(server, flags, mock_api, bench_report, tmp_path):
+    """Throughput of the adaptive upload concurrency against fast and weak S3 servers."""
+    api = mock_api()
+    directories, size = make_tree(str(tmp_path), "tiny")
+    options = {"fast": {}, "weak": {"latency": 0.02, "capacity": 4}}[server]
+    with MockS3(**options) as s3:
+        result = _run(tmp_path, _environment(api, s3), *flags)
+
+    bench_report.add(
+        f"upload_concurrency_{server}{''.join(flags).replace('--', '_')}",
+        jobs=len(directories),
+        seconds=result["seconds"],
+        jobs_per_second=len(directories) / result["seconds"],
+        upload_p95=result["stages"]["upload"]["p95"],
+    )
+
+
+def test_resume_after_crash(mock_api, mock_s3, bench_report, tmp_path):
+    """Killing a batch submission half way and resuming it from its journal."""
+    from leruli import task
+
+    api = mock_api()
+    root = tmp_path / "jobs"
+    directories, size = make_tree(str(root), "tiny")
+    env = _environment(api, mock_s3)
+    journal = str(tmp_path / "journal.sqlite")
+    command = [sys.executable, "-m", "benchmarks.workload", str(root)]
+    command += ["--journal", journal]
+
+    # the workers die with their process group, as on Ctrl-C or out of memory
+    process = subprocess.Popen(
+        command,
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    queued = []
+    while len(queued) < len(directories) // 2 and process.poll() is None:
+        time.sleep(0.05)
+        queued = [_ for _ in directories if os.path.exists(f"{_}/leruli.job")]
+    os.killpg(process.pid, signal.SIGKILL)
+    process.wait()
+    submitted, received = len(api.jobs), mock_s3.bytes_received
+    with sqlite3.connect(journal) as db:
+        states = dict(db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+
+    out = subprocess.run(
+        command,
+        cwd=ROOT,
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    ).stdout
+    result = json.loads(out)
+
+    # only jobs whose submission was cut off are not submitted again
+    missing = [_ for _ in directories if not os.path.exists(f"{_}/leruli.job")]
+    assert result["failed"] == len(missing)
+    assert len(missing) <= 2 * task.SUBMIT_CONCURRENCY * task.BATCH_SIZE
+    assert len(directories) - len(missing) <= len(api.jobs) <= len(directories)
+    recorded = set()
+    for directory in directories:
+        if directory not in missing:
+            with open(f"{directory}/leruli.bucket") as fh:
+                recorded.add(fh.read().strip())
+    assert recorded <= set(mock_s3.buckets)
+    assert len(set(mock_s3.buckets) - recorded) <= len(missing)
+    assert not os.path.exists(journal) or missing
+
+    bench_report.add(
+        "resume_after_crash",
+        jobs=len(directories),
+        queued_before_crash=len(queued),
+        submitted_before_crash=submitted,
+        accepted_without_handle=len(api.jobs) - (len(directories) - len(missing)),
+        not_resumed=len(missing),
+        resume_seconds=result["seconds"],
+        resume_uploaded_bytes=mock_s3.bytes_received - received,
+        orphaned_buckets=len(set(mock_s3.buckets) - recorded),
+        journal_at_crash=states,
+    )
@@ -0,0 +1,162 @@
+"""Synthetic job trees and a measured run of the submit pipeline.
+
+The trees mimic typical inputs: many tiny directories, a few huge ones, a
+mix of both or a parameter scan sharing large input files. Half of every file
+compresses well (text output), the other half not at all (binary data).
+
+``python -m benchmarks.workload ROOT [--dedup] [--resubmit] [--bucket NAME]
+[--processes N] [--max-uploads N] [--journal PATH]`` submits all subdirectories of ROOT with
+`task_submit_many` and prints the measurements as JSON. It is meant to run
+in a fresh process, so peak memory is not skewed by earlier runs. The API and
+S3 servers are taken from the usual environment variables.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+# directories as (count, files per directory, bytes per file)
+LAYOUTS = {
+    "tiny": [(400, 3, 1024)],
+    "huge": [(2, 4, 4 * 2**20)],
+    "mixed": [(200, 3, 1024), (20, 5, 128 * 2**10), (1, 4, 4 * 2**20)],
+    "shared": [(100, 2, 1024)],
+}
+# files identical in every directory of a layout, as (count, bytes per file)
+SHARED = {"shared": (2, 2 * 2**20)}
+
+
+def _content(rng: random.Random, size: int):
+    text = b"".join(
+        b"  %4d  %12.8f  %12.8f  %12.8f\n"
+        % (_, rng.random(), rng.random(), rng.random())
+        for _ in range(size // 2 // 48 + 1)
+    )[: size // 2]
+    return text + rng.getrandbits(8 * (size - len(text))).to_bytes(
+        size - len(text), "little"
+    )
+
+
+def make_tree(root: str, layout: str, seed: int = 42):
+    """Creates the job directories of a layout below `root`.
+
+    Returns
+    -------
+    tuple[list[str], int]
+        Job directories and their total size in bytes.
+    """
+    rng = random.Random(seed)
+    shared_count, shared_size = SHARED.get(layout, (0, 0))
+    shared = [_content(rng, shared_size) for _ in range(shared_count)]
+    directories, total = [], 0
+    for count, files, size in LAYOUTS[layout]:
+        for _ in range(count):
+            directory = os.path.join(root, f"job-{len(directories):06d}")
+            os.makedirs(directory)
+            for index in range(files):
+                with open(os.path.join(directory, f"file{index}.dat"), "wb") as fh:
+                    fh.write(_content(rng, size))
+            for index, content in enumerate(shared):
+                with open(os.path.join(directory, f"shared{index}.dat"), "wb") as fh:
+                    fh.write(content)
+            directories.append(directory)
+            total += files * size + shared_count * shared_size
+    return directories, total
+
+
+def reset_tree(directories):
+    """Removes the local job handles, so the directories can be submitted again."""
+    for directory in directories:
+        for handle in ("leruli.job", "leruli.bucket", "leruli.state"):
+            path = os.path.join(directory, handle)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def edit_tree(directories, size: int = 100):
+    """Appends to the first file of every directory, as a small fix of an input."""
+    for directory in directories:
+        with open(os.path.join(directory, "file0.dat"), "ab") as fh:
+            fh.write(b"#" * size)
+
+
+def run(
+    root: str,
+    dedup: bool = False,
+    resubmit: bool = False,
+    bucket: str = None,
+    processes: int = None,
+    max_uploads: int = None,
+    journal: str = None,
+):
+    """Submits all job directories below `root` and measures the pipeline."""
+    from leruli import profiling, task
+
+    directories = sorted(
+        os.path.join(root, _)
+        for _ in os.listdir(root)
+        if os.path.isdir(os.path.join(root, _))
+    )
+    n = len(directories)
+
+    profiling.enable()
+    started = time.time()
+    start = time.perf_counter()
+    failed = task.task_submit_many(
+        directories,
+        ["benchmark"] * n,
+        ["1"] * n,
+        [["./run"]] * n,
+        [1] * n,
+        [4000] * n,
+        [3600] * n,
+        dedup=dedup,
+        resubmit=resubmit,
+        bucket=bucket,
+        processes=processes,
+        max_uploads=max_uploads,
+        journal=journal,
+    )
+    total = time.perf_counter() - start
+    stages = {
+        _["stage"]: {"busy": _["busy"], "total": _["total"], "p95": _["p95"]}
+        for _ in profiling.summary(profiling.take(), total)
+    }
+
+    # the local handle is written as soon as the job is queued
+    queued = [
+        os.path.getmtime(os.path.join(_, "leruli.job"))
+        for _ in directories
+        if os.path.exists(os.path.join(_, "leruli.job"))
+    ]
+
+    # kilobytes on Linux
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return {
+        "jobs": n,
+        "failed": len(failed),
+        "seconds": total,
+        "first_queued": min(queued) - started if queued else None,
+        "peak_rss_mb": peak / 1024,
+        "stages": stages,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root")
+    parser.add_argument("--dedup", action="store_true")
+    parser.add_argument("--resubmit", action="store_true")
+    parser.add_argument("--bucket", default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--max-uploads", type=int, default=None)
+    parser.add_argument("--journal", default=None)
+    args = parser.parse_args()
+    json.dump(run(**vars(args)), sys.stdout)
@@ -3,15 +3,76 @@ __author__ = "leruli.com"
 __email__ = "info@leruli.com"
 __version__ = "22.1.6"
 
-from .misc import *
-from .graph import *
-from .task import *
+import importlib
+
+# public names and their modules, imported on first access to keep startup fast
+_LAZY = {
+    "canonical_formula": "misc",
+    "canonical_graph": "misc",
+    "name_to_graph": "misc",
+    "formula_to_graphs": "misc",
+    "iter_formula_to_graphs": "misc",
+    "formula_to_cost": "misc",
+    "graph_to_image": "graph",
+    "graph_to_solvation_energy": "graph",
+    "graph_to_geometry": "graph",
+    "graph_to_name": "graph",
+    "graph_to_boiling_point": "graph",
+    "graph_to_melting_point": "graph",
+    "graph_to_logP": "graph",
+    "graph_to_logD": "graph",
+    "graph_to_pKa": "graph",
+    "graph_to_formula": "graph",
+    "graph_to_properties": "graph",
+    "iter_graph_to_properties": "graph",
+    "get_s3_client": "internal",
+    "get_api_secret": "internal",
+    "task_submit": "task",
+    "task_submit_many": "task",
+    "task_status": "task",
+    "task_get": "task",
+    "task_cancel": "task",
+    "task_publish_code": "task",
+    "task_list_codes": "task",
+    "task_prune": "task",
+    "AsyncLeruli": "aio",
+}
+_SUBMODULES = {
+    "aio",
+    "cache",
+    "cli",
+    "graph",
+    "internal",
+    "journal",
+    "metrics",
+    "misc",
+    "profiling",
+    "ratelimit",
+    "task",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        module = importlib.import_module(f".{_LAZY[name]}", __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY) | _SUBMODULES)
+
 
 __all__ = [
     "canonical_formula",
     "canonical_graph",
     "name_to_graph",
     "formula_to_graphs",
+    "iter_formula_to_graphs",
     "formula_to_cost",
     "graph_to_image",
     "graph_to_solvation_energy",
@@ -23,6 +84,8 @@ __all__ = [
     "graph_to_logD",
     "graph_to_pKa",
     "graph_to_formula",
+    "graph_to_properties",
+    "iter_graph_to_properties",
     "get_s3_client",
     "get_api_secret",
     "task_submit",
@@ -31,4 +94,5 @@ __all__ = [
     "task_cancel",
     "task_publish_code",
     "task_prune",
+    "AsyncLeruli",
 ]
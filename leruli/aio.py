@@ -0,0 +1,631 @@
+import asyncio
+import functools
+import time
+from typing import List
+import aiohttp
+from . import cache, internal, metrics, ratelimit
+
+
+class AsyncLeruli:
+    """Asynchronous client mirroring the public functions of the `leruli` module.
+
+    All requests share one aiohttp session. Delayed (202) responses are awaited
+    without blocking the event loop and without holding a concurrency slot.
+
+    There is deliberately no counterpart of `leruli.iter_formula_to_graphs`: it
+    parses the result while it is being received, use `formula_to_graphs` or
+    the synchronous function instead.
+
+    Parameters
+    ----------
+    concurrency : int, optional
+        Maximum number of requests in flight at the same time.
+    timeout : float, optional
+        Total timeout in seconds for a single HTTP request.
+
+    Examples
+    --------
+    >>> async with AsyncLeruli() as client:
+    ...     results = await asyncio.gather(*[client.graph_to_logP(_) for _ in graphs])
+    """
+
+    def __init__(self, concurrency: int = 20, timeout: float = 120):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._semaphore = None
+        self._session = None
+        self._inflight = {}
+
+    async def __aenter__(self):
+        self._get_session()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(
+        self, method: str, url: str, endpoint: str = None, retries=3, **kwargs
+    ):
+        """Sends a request with the same retry and circuit breaker policy as `internal.Client`."""
+        session = self._get_session()
+        if endpoint is None:
+            endpoint = url.split("/", 4)[-1]
+        limiter = ratelimit.get_limiter(internal._endpoint_group(endpoint))
+        breaker = internal.circuit_breaker(endpoint)
+        if not breaker.allow():
+            raise internal.CircuitOpenError(
+                f"API endpoint {endpoint} unavailable, retrying in {breaker.retry_after:1.0f}s."
+            )
+
+        try:
+            for attempt in range(retries + 1):
+                status, retry_after, error = None, None, None
+                if limiter is not None:
+                    await limiter.acquire_async()
+                metrics.emit(
+                    "on_request",
+                    method=method,
+                    url=url,
+                    endpoint=endpoint,
+                    attempt=attempt,
+                )
+                metrics.metrics.increment(endpoint, "requests")
+                try:
+                    async with self._semaphore:
+                        start = time.monotonic()
+                        async with session.request(method, url, **kwargs) as res:
+                            status = res.status
+                            internal._record_response(
+                                method, url, endpoint, attempt, status, start
+                            )
+                            retry_after = res.headers.get("Retry-After")
+                            if status not in internal.RETRY_STATUS:
+                                breaker.success()
+                                if status in (200, 202):
+                                    return status, await res.json()
+                                if status == 204 or status >= 500:
+                                    return status, None
+                                # rejected requests carry an error document, as in the sync client
+                                try:
+                                    return status, await res.json(content_type=None)
+                                except ValueError:
+                                    return status, None
+                    if limiter is not None and status in internal.THROTTLE_STATUS:
+                        limiter.throttle()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    error = e
+                    metrics.metrics.increment(endpoint, "errors")
+                    metrics.emit(
+                        "on_error",
+                        method=method,
+                        url=url,
+                        endpoint=endpoint,
+                        attempt=attempt,
+                        error=e,
+                    )
+                if attempt < retries:
+                    metrics.metrics.increment(endpoint, "retries")
+                    await asyncio.sleep(internal._retry_delay(attempt, retry_after))
+        except aiohttp.ClientError:
+            # e.g. a broken response body
+            breaker.failure()
+            raise
+        except BaseException:
+            # e.g. a cancelled call or a failing metrics hook, not the endpoint's fault
+            breaker.release()
+            raise
+
+        # throttling means the service is up
+        if status == 429:
+            breaker.success()
+        else:
+            breaker.failure()
+        if error is not None:
+            raise error
+        return status, None
+
+    async def _base_call(
+        self,
+        endpoint: str,
+        payload: dict,
+        version: str,
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        """Awaitable version of `internal._base_call`. Progress bars are not supported.
+
+        Identical requests issued while one is still in flight await the same result.
+        """
+        # an urgent request does not wait for a regular one
+        key = (cache.ResultCache.key(endpoint, payload, version), urgent)
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                self._call(endpoint, payload, version, urgent)
+            )
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # one cancelled waiter must not cancel the request for all others
+        return await asyncio.shield(future)
+
+    async def _call(self, endpoint: str, payload: dict, version: str, urgent: bool):
+        start = time.monotonic()
+        metrics.metrics.increment(endpoint, "calls")
+        try:
+            url = f"{internal.BASEURL}/{version}/{endpoint}"
+            if urgent is True:
+                url = f"{url}?urgent={urgent}"
+            status, res = await self._request("POST", url, endpoint, json=payload)
+            queued = time.monotonic()
+            metrics.metrics.observe(endpoint, "first_response", queued - start)
+            if status == 202:
+                metrics.metrics.increment(endpoint, "delayed")
+                metrics.metrics.observe(
+                    endpoint, "time_to_result", res["time_to_result"]
+                )
+
+            # wait for delayed responses
+            polls = 0
+            backoff = internal._Poller.MIN_BACKOFF
+            while status == 202:
+                token = res["token"]
+                if res["time_to_result"] > 0:
+                    delay = min(res["time_to_result"], internal._Poller.MAX_INTERVAL)
+                    backoff = internal._Poller.MIN_BACKOFF
+                else:
+                    # overdue, poll again with exponential backoff as the poller does
+                    delay = backoff
+                    backoff = min(2 * backoff, internal._Poller.MAX_INTERVAL)
+                await asyncio.sleep(delay)
+                status, res = await self._request(
+                    "GET", f"{internal.BASEURL}/{version}/result/{token}", endpoint
+                )
+                polls += 1
+                metrics.metrics.increment(endpoint, "polls")
+                metrics.emit(
+                    "on_poll",
+                    endpoint=endpoint,
+                    token=token,
+                    status=status,
+                    polls=polls,
+                )
+                if status != 202:
+                    metrics.metrics.observe(
+                        endpoint, "queue", time.monotonic() - queued
+                    )
+        except internal.CircuitOpenError:
+            metrics.metrics.increment(endpoint, "failed_calls")
+            raise
+        except Exception:
+            metrics.metrics.increment(endpoint, "failed_calls")
+            print(internal.SORRY)
+            raise internal.LeruliInternalError()
+        finally:
+            metrics.metrics.observe(endpoint, "call", time.monotonic() - start)
+
+        # Internal error?
+        if str(status).startswith("5"):
+            metrics.metrics.increment(endpoint, "failed_calls")
+            print(internal.SORRY)
+            raise internal.LeruliInternalError()
+
+        # No content?
+        if status == 204:
+            return None
+        return res
+
+    async def _to_thread(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args))
+
+    async def canonical_formula(
+        self,
+        formula: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"formula": formula}
+        return await self._base_call(
+            "canonical-formula", payload, version, urgent, progress
+        )
+
+    async def canonical_graph(
+        self,
+        graph: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"graph": graph}
+        return await self._base_call(
+            "canonical-graph", payload, version, urgent, progress
+        )
+
+    async def name_to_graph(
+        self,
+        name: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"name": name}
+        return await self._base_call(
+            "name-to-graph", payload, version, urgent, progress
+        )
+
+    async def formula_to_graphs(
+        self,
+        formula: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"formula": formula}
+        return await self._base_call(
+            "formula-to-graphs", payload, version, urgent, progress
+        )
+
+    async def formula_to_cost(
+        self,
+        formula: str,
+        basisset: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"formula": formula, "basisset": basisset}
+        return await self._base_call(
+            "formula-to-cost", payload, version, urgent, progress
+        )
+
+    async def graph_to_image(
+        self,
+        graph: str,
+        format: str,
+        angle: int,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"graph": graph, "format": format, "angle": angle}
+        return await self._base_call(
+            "graph-to-image", payload, version, urgent, progress
+        )
+
+    async def graph_to_solvation_energy(
+        self,
+        graph: str,
+        solventname: str,
+        temperatures: List[float],
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"graph": graph, "solvent": solventname, "temperatures": temperatures}
+        return await self._base_call(
+            "graph-to-solvation-energy", payload, version, urgent, progress
+        )
+
+    async def graph_to_geometry(
+        self,
+        graph: str,
+        format: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"graph": graph, "format": format}
+        return await self._base_call(
+            "graph-to-geometry", payload, version, urgent, progress
+        )
+
+    async def graph_to_name(
+        self,
+        graph: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"graph": graph}
+        return await self._base_call(
+            "graph-to-name", payload, version, urgent, progress
+        )
+
+    async def graph_to_boiling_point(
+        self,
+        graph: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"graph": graph}
+        return await self._base_call(
+            "graph-to-boiling-point", payload, version, urgent, progress
+        )
+
+    async def graph_to_melting_point(
+        self,
+        graph: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"graph": graph}
+        return await self._base_call(
+            "graph-to-melting-point", payload, version, urgent, progress
+        )
+
+    async def graph_to_logP(
+        self,
+        graph: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"graph": graph}
+        return await self._base_call(
+            "graph-to-logP", payload, version, urgent, progress
+        )
+
+    async def graph_to_logD(
+        self,
+        graph: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"graph": graph}
+        return await self._base_call(
+            "graph-to-logD", payload, version, urgent, progress
+        )
+
+    async def graph_to_pKa(
+        self,
+        graph: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"graph": graph}
+        return await self._base_call("graph-to-pKa", payload, version, urgent, progress)
+
+    async def graph_to_formula(
+        self,
+        graph: str,
+        version: str = "latest",
+        urgent: bool = False,
+        progress: bool = False,
+    ):
+        payload = {"graph": graph}
+        return await self._base_call(
+            "graph-to-formula", payload, version, urgent, progress
+        )
+
+    async def _property_values(self, graphs, properties, version, urgent):
+        from . import graph
+
+        async def value(smiles, prop):
+            endpoint, key = graph._PROPERTIES[prop]
+            result = await self._base_call(endpoint, {"graph": smiles}, version, urgent)
+            if result is None or key is None:
+                return result
+            return result[key]
+
+        rows = await asyncio.gather(
+            *(
+                asyncio.gather(
+                    *(value(_, prop) for prop in properties), return_exceptions=True
+                )
+                for _ in graphs
+            )
+        )
+        columns = {prop: [] for prop in properties}
+        columns["graph"] = list(graphs)
+        columns["error"] = []
+        for row in rows:
+            for prop, result in zip(properties, row):
+                columns[prop].append(None if isinstance(result, Exception) else result)
+            columns["error"].append(any(isinstance(_, Exception) for _ in row))
+        return columns
+
+    async def _canonicalize(self, graphs, version, urgent):
+        known = internal.get_canonical_map()
+        canonicals = known.get_many(graphs, version)
+        missing = [_ for _ in graphs if _ not in canonicals]
+        results = await asyncio.gather(
+            *(
+                self._base_call("canonical-graph", {"graph": _}, version, urgent)
+                for _ in missing
+            ),
+            return_exceptions=True,
+        )
+        new = {
+            smiles: result["graph"]
+            for smiles, result in zip(missing, results)
+            if isinstance(result, dict)
+        }
+        known.put_many(new, version)
+        canonicals.update(new)
+        return canonicals
+
+    async def _property_values_deduplicated(self, graphs, properties, version, urgent):
+        canonicals = await self._canonicalize(
+            list(dict.fromkeys(graphs)), version, urgent
+        )
+        unique = list(dict.fromkeys(canonicals.values()))
+        results = await self._property_values(unique, properties, version, urgent)
+        rows = {smiles: row for row, smiles in enumerate(unique)}
+
+        columns = {prop: [] for prop in properties}
+        columns["graph"] = list(graphs)
+        columns["error"] = []
+        for smiles in graphs:
+            row = rows.get(canonicals.get(smiles))
+            for prop in properties:
+                columns[prop].append(None if row is None else results[prop][row])
+            columns["error"].append(True if row is None else results["error"][row])
+        return columns
+
+    async def iter_graph_to_properties(
+        self,
+        graphs,
+        properties: List[str],
+        version: str = "latest",
+        urgent: bool = False,
+        chunksize: int = 1000,
+        deduplicate: bool = False,
+    ):
+        """Asynchronous generator version of `leruli.iter_graph_to_properties`.
+
+        `graphs` may be an iterable or an asynchronous iterable. Requests are
+        limited by the concurrency of the client.
+        """
+        from . import graph
+
+        unknown = set(properties) - set(graph._PROPERTIES)
+        if len(unknown) > 0:
+            raise ValueError(
+                f"Unknown properties {', '.join(sorted(unknown))}. Choose from {', '.join(graph._PROPERTIES)}."
+            )
+
+        async def chunks():
+            chunk = []
+            if hasattr(graphs, "__aiter__"):
+                async for smiles in graphs:
+                    chunk.append(smiles)
+                    if len(chunk) == chunksize:
+                        yield chunk
+                        chunk = []
+            else:
+                for smiles in graphs:
+                    chunk.append(smiles)
+                    if len(chunk) == chunksize:
+                        yield chunk
+                        chunk = []
+            if len(chunk) > 0:
+                yield chunk
+
+        async for chunk in chunks():
+            if deduplicate:
+                yield await self._property_values_deduplicated(
+                    chunk, properties, version, urgent
+                )
+            else:
+                yield await self._property_values(chunk, properties, version, urgent)
+
+    async def graph_to_properties(
+        self,
+        graphs,
+        properties: List[str],
+        version: str = "latest",
+        urgent: bool = False,
+        deduplicate: bool = False,
+    ):
+        """Awaitable version of `leruli.graph_to_properties`."""
+        columns = {prop: [] for prop in ["graph"] + list(properties) + ["error"]}
+        async for chunk in self.iter_graph_to_properties(
+            graphs, properties, version, urgent, deduplicate=deduplicate
+        ):
+            for name, values in chunk.items():
+                columns[name].extend(values)
+        return columns
+
+    async def get_s3_client(self):
+        return internal.get_s3_client()
+
+    async def get_api_secret(self):
+        return internal.get_api_secret()
+
+    async def task_submit(
+        self,
+        directory: str,
+        code: str,
+        version: str,
+        command: str,
+        cores: int = 1,
+        memorymb: int = 4000,
+        timeseconds: int = 24 * 60 * 60,
+        compression: str = None,
+        dedup: bool = False,
+        resubmit: bool = False,
+        bucket: str = None,
+    ):
+        from . import task
+
+        return await self._to_thread(
+            task.task_submit,
+            directory,
+            code,
+            version,
+            command,
+            cores,
+            memorymb,
+            timeseconds,
+            compression,
+            dedup,
+            resubmit,
+            bucket,
+        )
+
+    async def task_status(self, jobid: str):
+        api_secret = internal.get_api_secret()
+        if api_secret is None:
+            return
+
+        payload = {
+            "secret": api_secret,
+            "jobid": jobid,
+        }
+        status, res = await self._request(
+            "POST", f"{internal.BASEURL}/v22_1/task-status", json=payload
+        )
+        if status == 200:
+            return res
+        if status == 404:
+            raise ValueError("No such job")
+
+    async def task_get(self, directory: str, bucket: str):
+        from . import task
+
+        return await self._to_thread(task.task_get, directory, bucket)
+
+    async def task_cancel(self, jobid: str):
+        api_secret = internal.get_api_secret()
+        if api_secret is None:
+            return
+
+        payload = {
+            "secret": api_secret,
+            "jobid": jobid,
+        }
+        session = self._get_session()
+        async with self._semaphore:
+            async with session.post(
+                f"{internal.BASEURL}/v22_1/task-cancel", json=payload
+            ) as res:
+                return await res.json()
+
+    async def task_publish_code(self, code: str, version: str):
+        from . import task
+
+        return await self._to_thread(task.task_publish_code, code, version)
+
+    async def task_prune(self, bucket: str):
+        from . import task
+
+        return await self._to_thread(task.task_prune, bucket)
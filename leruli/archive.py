@@ -0,0 +1,428 @@
+import collections
+import concurrent.futures
+import io
+import os
+import struct
+import tarfile
+import threading
+import time
+import zlib
+
+from . import profiling
+
+# size of the parts archives are uploaded in, S3 requires at least 5 MiB
+PART_SIZE = int(os.getenv("LERULI_PART_SIZE", 8 * 2**20))
+# codec and level, e.g. gzip, gzip:9, zstd:3 or store
+COMPRESSION = os.getenv("LERULI_COMPRESSION", "gzip:6")
+# compression threads per process, all cores by default
+THREADS = int(os.getenv("LERULI_COMPRESSION_THREADS", 0)) or os.cpu_count() or 1
+# uncompressed bytes compressed at once by one thread
+BLOCK_SIZE = 2**20
+# local handles of a submitted job directory, not part of the job
+HANDLES = ("leruli.job", "leruli.bucket", "leruli.bucket.previous", "leruli.state")
+# blocks compressing worse than this on a sample are stored as-is
+INCOMPRESSIBLE = 0.95
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def configure(compression: str = None, threads: int = None):
+    """Changes the default codec and the number of compression threads of this process."""
+    global COMPRESSION, THREADS, _executor
+    if compression is not None:
+        codec(compression)
+        COMPRESSION = compression
+    if threads is not None:
+        with _executor_lock:
+            THREADS = threads
+            _executor = None
+
+
+def codec(compression: str = None):
+    """Codec name and level of a compression setting like ``gzip:9``."""
+    name, _, level = (compression or COMPRESSION).partition(":")
+    if name == "store":
+        return "gzip", 0
+    if name == "gzip":
+        return name, int(level or 6)
+    if name == "zstd":
+        return name, int(level or 3)
+    raise ValueError(f"Unknown compression {compression}, use gzip, zstd or store.")
+
+
+def filename(compression: str = None):
+    """Name of the job archive, which tells the queue how to unpack it."""
+    if codec(compression)[0] == "zstd":
+        return "run.tar.zst"
+    return "run.tgz"
+
+
+def _compression_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        # threads do not survive fork
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                THREADS, thread_name_prefix="leruli-compress"
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _deflate(block: bytes, level: int, zdict: bytes):
+    if level > 0 and len(block) > 16384:
+        # skip the work for data which does not compress, e.g. wavefunctions
+        sample = block[:16384]
+        if len(zlib.compress(sample, 1)) > INCOMPRESSIBLE * len(sample):
+            level = 0
+    if level > 0 and zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class GzipWriter:
+    """Multi-threaded gzip compression into a single gzip member, like pigz.
+
+    The input is split into blocks which are deflated in parallel, each primed
+    with the end of the previous block, and joined into one deflate stream.
+    Blocks which do not compress on a sample are stored uncompressed. The
+    output is a regular gzip file.
+    """
+
+    def __init__(self, fileobj, level: int = 6):
+        self.fileobj = fileobj
+        self.level = level
+        self._executor = _compression_executor()
+        self._pending = collections.deque()
+        self._buffer = bytearray()
+        self._previous = b""
+        self._crc = 0
+        self._size = 0
+        header = struct.pack("<BBBBLBB", 0x1F, 0x8B, 8, 0, int(time.time()), 0, 255)
+        self.fileobj.write(header)
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:BLOCK_SIZE]))
+            del self._buffer[:BLOCK_SIZE]
+        return len(data)
+
+    def _submit(self, block: bytes):
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+        self._pending.append(
+            self._executor.submit(_deflate, block, self.level, self._previous)
+        )
+        self._previous = block[-32768:]
+        # bounds the memory held by blocks in flight
+        while len(self._pending) > 2 * THREADS:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def close(self):
+        if len(self._buffer) > 0:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        while self._pending:
+            self.fileobj.write(self._pending.popleft().result())
+        self.fileobj.write(zlib.compressobj(0, zlib.DEFLATED, -15).flush())
+        self.fileobj.write(struct.pack("<LL", self._crc, self._size & 0xFFFFFFFF))
+
+
+class ZstdWriter:
+    """Multi-threaded zstd compression, requires the optional zstandard package."""
+
+    def __init__(self, fileobj, level: int = 3):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError(
+                "zstd compression requires the zstandard package: pip install leruli[zstd]"
+            )
+
+        compressor = zstandard.ZstdCompressor(level=level, threads=THREADS)
+        self._writer = compressor.stream_writer(fileobj, closefd=False)
+
+    def write(self, data):
+        return self._writer.write(data)
+
+    def close(self):
+        self._writer.close()
+
+
+def write(
+    fileobj,
+    directory: str,
+    command: str,
+    compression: str = None,
+    exclude: set = None,
+):
+    """Writes a job directory and its run script as compressed tar stream to a file-like object.
+
+    Parameters
+    ----------
+    fileobj : file-like
+        Receives the archive.
+    directory : str
+        Job directory.
+    command : str
+        Command to run, written to the archive as run.sh.
+    compression : str, optional
+        Codec and level, e.g. ``gzip:9``, ``zstd:3`` or ``store``, by default `COMPRESSION`.
+    exclude : set, optional
+        Paths relative to `directory` which are left out, e.g. files stored as blobs.
+    """
+    name, level = codec(compression)
+    if name == "zstd":
+        stream = ZstdWriter(fileobj, level)
+    else:
+        stream = GzipWriter(fileobj, level)
+
+    exclude = set(exclude or ()) | set(HANDLES)
+
+    def skip(tarinfo):
+        if os.path.normpath(tarinfo.name) in exclude:
+            return None
+        return tarinfo
+
+    with tarfile.open(fileobj=stream, mode="w|") as tar:
+        tar.add(directory, arcname=os.path.basename("."), filter=skip)
+
+        runscript = io.BytesIO(("#!/bin/bash\n" + " ".join(command)).encode("ascii"))
+        tarinfo = tarfile.TarInfo(name="run.sh")
+        tarinfo.size = runscript.getbuffer().nbytes
+        tar.addfile(tarinfo=tarinfo, fileobj=runscript)
+    stream.close()
+
+
+class Pipe:
+    """Bounded in-memory pipe from an archive writer thread to a reading uploader.
+
+    Writers block while more than `capacity` bytes are buffered, so memory
+    use does not depend on the size of the archive.
+    """
+
+    def __init__(self, capacity: int = None):
+        self.capacity = capacity or PART_SIZE
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._aborted = False
+        self._error = None
+
+    def write(self, data):
+        with self._cond:
+            while len(self._buffer) >= self.capacity and not self._aborted:
+                self._cond.wait()
+            if self._aborted:
+                raise OSError("Upload aborted.")
+            self._buffer += data
+            self._cond.notify_all()
+        return len(data)
+
+    def close(self, error: BaseException = None):
+        """Marks the end of the data, or a failure of the writer to be raised by `read`."""
+        with self._cond:
+            self._closed = True
+            self._error = error
+            self._cond.notify_all()
+
+    def abort(self):
+        """Makes blocked and further writes fail after the reader gave up."""
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+    def read(self, size: int = -1):
+        with self._cond:
+            while not self._closed and (size < 0 or len(self._buffer) < size):
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+            if size < 0 or size > len(self._buffer):
+                size = len(self._buffer)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._cond.notify_all()
+        return data
+
+
+class PartWriter:
+    """File-like object handing the written data on in parts of `part_size` bytes.
+
+    The last part may be smaller. `emit` is called from the writing thread and
+    may block to apply backpressure.
+    """
+
+    def __init__(self, emit, part_size: int = None):
+        self.part_size = part_size or PART_SIZE
+        self.aborted = False
+        self.size = 0
+        self._emit = emit
+        self._buffer = bytearray()
+
+    def write(self, data):
+        if self.aborted:
+            raise OSError("Upload aborted.")
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._emit(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+        return len(data)
+
+    def flush(self):
+        """Emits the remaining data as last part."""
+        if len(self._buffer) > 0:
+            self._emit(bytes(self._buffer))
+            self._buffer = bytearray()
+
+
+def upload_stream(s3_client, bucket: str, key: str, produce):
+    """Streams data of unknown length to S3 with a minio client.
+
+    `produce` is called with a file-like object to write the data to, in a
+    separate thread.
+    """
+    pipe = Pipe()
+
+    def run():
+        try:
+            produce(pipe)
+        except BaseException as e:
+            pipe.close(e)
+        else:
+            pipe.close()
+
+    writer = threading.Thread(target=run, name="leruli-archive", daemon=True)
+    writer.start()
+    try:
+        # unknown length, minio switches to a multipart upload beyond one part
+        s3_client.put_object(bucket, key, pipe, -1, part_size=PART_SIZE)
+    except BaseException:
+        pipe.abort()
+        raise
+    finally:
+        writer.join()
+
+
+def upload(
+    s3_client,
+    bucket: str,
+    key: str,
+    directory: str,
+    command: str,
+    compression: str = None,
+    exclude: set = None,
+):
+    """Streams the archive of a job directory to S3 with a minio client."""
+
+    def produce(fileobj):
+        with profiling.span("pack", directory):
+            write(fileobj, directory, command, compression, exclude)
+
+    upload_stream(s3_client, bucket, key, produce)
+
+
+async def upload_stream_async(s3_client, bucket: str, key: str, produce):
+    """Streams data of unknown length to S3 with an aiobotocore client.
+
+    `produce` is called with a file-like object to write the data to, in a
+    thread. Data of a single part is stored with one request, more as
+    multipart upload. Returns the number of uploaded bytes.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    parts = asyncio.Queue(maxsize=1)
+
+    def emit(part):
+        asyncio.run_coroutine_threadsafe(parts.put(part), loop).result()
+
+    writer = PartWriter(emit)
+
+    def run():
+        try:
+            produce(writer)
+            writer.flush()
+        except BaseException as e:
+            emit(e)
+        else:
+            emit(None)
+
+    async def next_part():
+        part = await parts.get()
+        if isinstance(part, BaseException):
+            raise part
+        return part
+
+    producer = loop.run_in_executor(None, run)
+    upload_id = None
+    try:
+        current = await next_part()
+        following = await next_part()
+        if following is None:
+            await s3_client.put_object(Bucket=bucket, Key=key, Body=current)
+        else:
+            res = await s3_client.create_multipart_upload(Bucket=bucket, Key=key)
+            upload_id = res["UploadId"]
+            completed = []
+            while current is not None:
+                res = await s3_client.upload_part(
+                    Bucket=bucket,
+                    Key=key,
+                    PartNumber=len(completed) + 1,
+                    UploadId=upload_id,
+                    Body=current,
+                )
+                completed.append(
+                    {"PartNumber": len(completed) + 1, "ETag": res["ETag"]}
+                )
+                current, following = following, (
+                    None if following is None else await next_part()
+                )
+            await s3_client.complete_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": completed},
+            )
+        await producer
+        return writer.size
+    except BaseException:
+        # unblock the writer thread, it fails on its next write
+        writer.aborted = True
+        while not producer.done():
+            try:
+                parts.get_nowait()
+            except asyncio.QueueEmpty:
+                await asyncio.sleep(0.01)
+        if upload_id is not None:
+            await s3_client.abort_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=upload_id
+            )
+        raise
+
+
+async def upload_async(
+    s3_client,
+    bucket: str,
+    key: str,
+    directory: str,
+    command: str,
+    compression: str = None,
+    exclude: set = None,
+):
+    """Streams the archive of a job directory to S3 with an aiobotocore client.
+
+    Returns the size of the archive in bytes.
+    """
+
+    def produce(fileobj):
+        with profiling.span("pack", directory):
+            write(fileobj, directory, command, compression, exclude)
+
+    return await upload_stream_async(s3_client, bucket, key, produce)
@@ -0,0 +1,338 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from . import archive
+from . import internal
+from . import profiling
+
+# file name of the list of blobs of a job, stored next to the job archive
+MANIFEST = "leruli.manifest"
+# local record of the blobs of a job directory, for incremental resubmission
+STATE = "leruli.state"
+# files of at least this many bytes are stored once in the blob store
+THRESHOLD = int(os.getenv("LERULI_DEDUP_SIZE", 2**20))
+_bucket = None
+# sha256 of files by (device, inode, size, mtime), shared files are hashed once
+_digests = {}
+# blobs known to be in the store, not to be checked or uploaded again
+_stored = set()
+_lock = threading.Lock()
+
+
+def configure(name: str = None):
+    """Sets the blob store bucket, e.g. in worker processes, to save looking it up."""
+    global _bucket
+    _bucket = name
+
+
+def bucket():
+    """Name of the blob store bucket of the group."""
+    global _bucket
+    if _bucket is None:
+        group = internal.get_group_token()
+        if group is None:
+            raise ValueError("No API token configured")
+        _bucket = f"blobs-{group}"
+    return _bucket
+
+
+def key(digest: str):
+    """Object name of a blob."""
+    return f"sha256/{digest}"
+
+
+def digest(path: str):
+    """SHA-256 of a file, remembered for unchanged files."""
+    stat = os.stat(path)
+    handle = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if handle in _digests:
+            return _digests[handle]
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(2**20), b""):
+            sha.update(chunk)
+    with _lock:
+        _digests[handle] = sha.hexdigest()
+    return _digests[handle]
+
+
+def scan(directory: str, threshold: int = None, previous: dict = None):
+    """Files of a job directory to be stored as blobs.
+
+    Parameters
+    ----------
+    directory : str
+        Job directory.
+    threshold : int, optional
+        Minimum size in bytes, by default `THRESHOLD`.
+    previous : dict, optional
+        Entries of an earlier scan. Files with unchanged size and mtime are not hashed again.
+
+    Returns
+    -------
+    dict[str, dict]
+        Keys: paths relative to `directory`, values: sha256, size, mtime and mode of the file.
+    """
+    if threshold is None:
+        threshold = THRESHOLD
+    entries = {}
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            relative = os.path.relpath(path, directory)
+            if relative == MANIFEST or relative in archive.HANDLES:
+                continue
+            stat = os.stat(path)
+            if stat.st_size < threshold:
+                continue
+            entry = (previous or {}).get(relative)
+            if not (
+                entry is not None
+                and entry["size"] == stat.st_size
+                and entry["mtime"] == stat.st_mtime_ns
+            ):
+                entry = {"sha256": digest(path)}
+            entries[relative] = {
+                "sha256": entry["sha256"],
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "mode": stat.st_mode & 0o777,
+            }
+    return entries
+
+
+def load_state(directory: str):
+    """Blobs recorded by the last submission of a job directory.
+
+    Their digests are taken as stored, so they are neither checked nor
+    uploaded again.
+
+    Returns
+    -------
+    dict[str, dict]
+        Entries as returned by `scan`, empty if there is no usable record.
+    """
+    try:
+        with open(os.path.join(directory, STATE)) as fh:
+            document = json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if document.get("bucket") != bucket():
+        return {}
+    with _lock:
+        _stored.update(_["sha256"] for _ in document["files"].values())
+    return document["files"]
+
+
+def save_state(directory: str, entries: dict):
+    """Records the blobs of a job directory for `load_state`."""
+    path = os.path.join(directory, STATE)
+    with open(f"{path}.tmp", "w") as fh:
+        json.dump({"bucket": bucket(), "files": entries}, fh, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def manifest(entries: dict):
+    """Manifest of a job referencing its blobs, as uploaded next to the archive."""
+    return json.dumps(
+        {"version": 1, "bucket": bucket(), "files": entries}, indent=1, sort_keys=True
+    ).encode("utf8")
+
+
+def _copy(path: str):
+    def produce(fileobj):
+        with open(path, "rb") as fh:
+            shutil.copyfileobj(fh, fileobj, 2**20)
+
+    return produce
+
+
+def ensure_bucket(s3_client, name: str):
+    """Creates a long-lived bucket with a minio client unless it exists, checked once per process."""
+    from minio.error import S3Error
+
+    if name in _stored:
+        return
+    if not s3_client.bucket_exists(name):
+        try:
+            s3_client.make_bucket(name)
+        except S3Error as e:
+            # created by a concurrent process
+            if e.code != "BucketAlreadyOwnedByYou":
+                raise
+    # buckets and blobs do not share names
+    _stored.add(name)
+
+
+def stage(s3_client, directory: str, threshold: int = None, incremental: bool = False):
+    """Uploads the large files of a job directory to the blob store with a minio client.
+
+    Blobs already in the store are not uploaded again. The blobs are recorded
+    in the directory, and with `incremental` this record from the previous
+    submission is used to skip hashing and checking unchanged files.
+
+    Returns
+    -------
+    dict[str, dict]
+        Blobs of the job as returned by `scan`.
+    """
+    from minio.error import S3Error
+
+    with profiling.span("dedup", directory):
+        previous = load_state(directory) if incremental else None
+        entries = scan(directory, threshold, previous)
+        if not entries:
+            return entries
+        target = bucket()
+        ensure_bucket(s3_client, target)
+
+        for relative, entry in entries.items():
+            if entry["sha256"] in _stored:
+                continue
+            try:
+                s3_client.stat_object(target, key(entry["sha256"]))
+            except S3Error as e:
+                if e.code not in ("NoSuchKey", "ResourceNotFound"):
+                    raise
+                archive.upload_stream(
+                    s3_client,
+                    target,
+                    key(entry["sha256"]),
+                    _copy(os.path.join(directory, relative)),
+                )
+            _stored.add(entry["sha256"])
+        save_state(directory, entries)
+    return entries
+
+
+class AsyncStore:
+    """Uploads blobs and creates long-lived buckets with an aiobotocore client, each at most once.
+
+    Jobs sharing a blob wait for the first upload of it instead of starting
+    their own.
+    """
+
+    def __init__(self, s3_client):
+        self.s3_client = s3_client
+        self._pending = {}
+
+    async def _exists(self, bucket: str, name: str = None):
+        from botocore.exceptions import ClientError
+
+        try:
+            if name is None:
+                await self.s3_client.head_bucket(Bucket=bucket)
+            else:
+                await self.s3_client.head_object(Bucket=bucket, Key=name)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("404", "NoSuchKey", "NoSuchBucket"):
+                raise
+            return False
+        return True
+
+    async def _ensure_bucket(self, target: str):
+        from botocore.exceptions import ClientError
+
+        if not await self._exists(target):
+            try:
+                await self.s3_client.create_bucket(Bucket=target)
+            except ClientError as e:
+                # created by a concurrent worker
+                if e.response["Error"]["Code"] != "BucketAlreadyOwnedByYou":
+                    raise
+
+    async def ensure_bucket(self, name: str):
+        """Creates a long-lived bucket unless it exists."""
+        await self._once(name, self._ensure_bucket(name))
+
+    async def _upload(self, target: str, digest: str, path: str):
+        if not await self._exists(target, key(digest)):
+            await archive.upload_stream_async(
+                self.s3_client, target, key(digest), _copy(path)
+            )
+        _stored.add(digest)
+
+    def _once(self, name: str, coroutine):
+        import asyncio
+
+        if name not in self._pending:
+            future = asyncio.ensure_future(coroutine)
+            self._pending[name] = future
+
+            def forget(future):
+                # a failed upload is tried again by the next job needing it
+                if future.cancelled() or future.exception() is not None:
+                    if self._pending.get(name) is future:
+                        del self._pending[name]
+
+            future.add_done_callback(forget)
+        else:
+            coroutine.close()
+        return self._pending[name]
+
+    async def stage(
+        self, directory: str, threshold: int = None, incremental: bool = False
+    ):
+        """Uploads the large files of a job directory to the blob store, see `stage`.
+
+        Returns
+        -------
+        dict[str, dict]
+            Blobs of the job as returned by `scan`.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        with profiling.span("dedup", directory):
+            # hashing blocks, keep the event loop serving other jobs
+            previous = None
+            if incremental:
+                previous = await loop.run_in_executor(None, load_state, directory)
+            entries = await loop.run_in_executor(
+                None, scan, directory, threshold, previous
+            )
+            if not entries:
+                return entries
+            target = await loop.run_in_executor(None, bucket)
+            await self.ensure_bucket(target)
+
+            uploads = []
+            for relative, entry in entries.items():
+                if entry["sha256"] in _stored:
+                    continue
+                path = os.path.join(directory, relative)
+                uploads.append(
+                    self._once(
+                        entry["sha256"], self._upload(target, entry["sha256"], path)
+                    )
+                )
+            # shield, a failing job must not cancel uploads shared with other jobs
+            await asyncio.gather(*[asyncio.shield(_) for _ in uploads])
+            save_state(directory, entries)
+        return entries
+
+
+def restore(s3_client, directory: str):
+    """Downloads the blobs listed in the manifest of a job directory into it.
+
+    Files already present with the right content are kept.
+    """
+    with open(os.path.join(directory, MANIFEST)) as fh:
+        document = json.load(fh)
+    for relative, entry in document["files"].items():
+        path = os.path.join(directory, relative)
+        if os.path.exists(path) and digest(path) == entry["sha256"]:
+            continue
+        dirname = os.path.dirname(path)
+        if dirname != "":
+            os.makedirs(dirname, exist_ok=True)
+        s3_client.fget_object(document["bucket"], key(entry["sha256"]), path)
+        os.chmod(path, entry["mode"])
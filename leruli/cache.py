@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def default_path(filename: str = "results.sqlite"):
+    """Location of the cache files, following the XDG base directory convention."""
+    basedir = os.getenv(
+        "XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")
+    )
+    return os.path.join(basedir, "leruli", filename)
+
+
+class _Database:
+    """Lazily opened SQLite connection which is reopened in forked processes."""
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def _db(self):
+        # sqlite connections must not be shared with forked processes
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False, timeout=30
+            )
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._connection.close()
+            self._pid = None
+
+
+class ResultCache(_Database):
+    """Disk-backed cache for API results, stored in a SQLite database.
+
+    Entries are evicted least-recently-used first once more than `max_entries`
+    are stored. Results for ``version="latest"`` expire after `ttl` seconds,
+    since the underlying model may change. Pinned versions never expire.
+    Results of `None` (no content) are cached as well.
+
+    Parameters
+    ----------
+    path : str, optional
+        Database file, created if missing. Defaults to ``~/.cache/leruli/results.sqlite``.
+    max_entries : int, optional
+        Maximum number of cached results.
+    ttl : float, optional
+        Lifetime in seconds of results for ``version="latest"``.
+    """
+
+    def __init__(
+        self, path: str = None, max_entries: int = 1000000, ttl: float = 7 * 86400
+    ):
+        if path is None:
+            path = default_path()
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, version TEXT, value TEXT, created REAL, accessed REAL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+            )
+            (self._entries,) = self._db.execute(
+                "SELECT COUNT(*) FROM results"
+            ).fetchone()
+
+    @staticmethod
+    def key(endpoint: str, payload: dict, version: str):
+        """Canonical cache key of a request."""
+        canonical = json.dumps(
+            [endpoint, payload, version], sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode("utf8")).hexdigest()
+
+    def get(self, key: str):
+        """Looks up a result.
+
+        Returns
+        -------
+        tuple[bool, object]
+            Whether the key was found and the cached result.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT version, value, created FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[0] == "latest" and now - row[2] > self.ttl:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._entries -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return False, None
+            self._db.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+        return True, json.loads(row[1])
+
+    def put(self, key: str, version: str, value):
+        """Stores a result, evicting the least recently used entries if needed."""
+        now = time.time()
+        with self._lock, self._db:
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, version, json.dumps(value), now, now),
+            ).rowcount
+            if not inserted:
+                self._db.execute(
+                    "UPDATE results SET value = ?, created = ?, accessed = ? WHERE key = ?",
+                    (json.dumps(value), now, now, key),
+                )
+            self._entries += inserted
+            if self._entries > self.max_entries:
+                # evict in batches to amortize the cost of the index scan
+                excess = self._entries - self.max_entries + self.max_entries // 10
+                self._db.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)",
+                    (excess,),
+                )
+                (self._entries,) = self._db.execute(
+                    "SELECT COUNT(*) FROM results"
+                ).fetchone()
+
+    def clear(self):
+        """Removes all cached results."""
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM results")
+            self._entries = 0
+            self._db.execute("VACUUM")
+
+    def stats(self):
+        """Hit and miss counters of this process and the number of stored results."""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {
+            "path": self.path,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CanonicalMap(_Database):
+    """Persistent mapping of input graphs to their canonical graph.
+
+    Parameters
+    ----------
+    path : str, optional
+        Database file, created if missing. Defaults to ``~/.cache/leruli/canonical.sqlite``.
+    """
+
+    def __init__(self, path: str = None):
+        if path is None:
+            path = default_path("canonical.sqlite")
+        super().__init__(path)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS graphs (input TEXT, version TEXT, canonical TEXT, PRIMARY KEY (input, version))"
+            )
+
+    def get_many(self, graphs: list, version: str):
+        """Canonical graphs of all known inputs, as dictionary."""
+        found = {}
+        with self._lock:
+            # stay below the default limit of 999 sqlite parameters
+            for start in range(0, len(graphs), 500):
+                segment = graphs[start : start + 500]
+                rows = self._db.execute(
+                    f"SELECT input, canonical FROM graphs WHERE version = ? AND input IN ({','.join('?' * len(segment))})",
+                    [version] + segment,
+                )
+                found.update(rows)
+        return found
+
+    def put_many(self, canonicals: dict, version: str):
+        """Stores canonical graphs given as dictionary keyed by the input graph."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO graphs VALUES (?, ?, ?)",
+                [(k, version, v) for k, v in canonicals.items()],
+            )
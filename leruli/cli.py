@@ -1,21 +1,130 @@
 """Console script for leruli."""
+
 import sys
 import click
 import leruli
-import tabulate
 import glob
 import base64
+import collections
+import concurrent.futures
+import csv
+import json
+import os
 import time as modtime
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 
 
-@click.group()
-def cli1():
-    pass
+def batch_options(func):
+    """Adds the options to process many inputs from a file or stdin."""
+    options = [
+        click.option(
+            "--batch",
+            type=click.File("r"),
+            help="Process one input per line from a file, or from stdin if given as -.",
+        ),
+        click.option(
+            "--jobs",
+            type=click.IntRange(min=1),
+            default=8,
+            help="Concurrent requests in batch mode, default 8.",
+        ),
+        click.option(
+            "--output-format",
+            type=click.Choice("csv jsonl".split(), case_sensitive=False),
+            default="csv",
+            help="Output format in batch mode, defaults to CSV.",
+        ),
+        click.option(
+            "--keep-order",
+            is_flag=True,
+            default=False,
+            help="Write batch results in input order instead of as they arrive.",
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def _require(value, name: str):
+    if value is None:
+        raise click.UsageError(f"Missing argument '{name}'.")
+
+
+def _run_batch(
+    lines,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
+    endpoint: str,
+    field: str,
+    key: str,
+    version: str,
+    extra: dict = {},
+):
+    """Streams inputs through the API with bounded concurrency and memory."""
+    # references come with single results only
+    if click.get_current_context().params.get("reference"):
+        raise click.UsageError("--reference cannot be combined with --batch.")
+    column = key or "result"
+
+    def call(value):
+        payload = {field: value, **extra}
+        result = leruli.internal._base_future(endpoint, payload, version).result()
+        if result is not None and key is not None:
+            result = result[key]
+        return result
+
+    if output_format.lower() == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["input", column, "error"])
+
+    failed = 0
+
+    def write(value, future):
+        nonlocal failed
+        try:
+            result, error = future.result(), None
+        except Exception as e:
+            result, error = None, str(e) or type(e).__name__
+            failed += 1
+        if output_format.lower() == "csv":
+            if not (result is None or isinstance(result, (str, int, float))):
+                result = json.dumps(result)
+            writer.writerow([value, result, error])
+        else:
+            print(json.dumps({"input": value, column: result, "error": error}))
+
+    inputs = (_.strip() for _ in lines)
+    inputs = (_ for _ in inputs if len(_) > 0)
+    window = 4 * jobs
+    pending = collections.OrderedDict()
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+
+        def drain(limit):
+            while len(pending) > limit:
+                if keep_order:
+                    future, value = pending.popitem(last=False)
+                    write(value, future)
+                    continue
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    write(pending.pop(future), future)
+
+        for value in inputs:
+            pending[executor.submit(call, value)] = value
+            drain(window)
+        drain(0)
+
+    if failed > 0:
+        sys.exit(1)
 
 
-@cli1.command()
+@click.command()
+@batch_options
 @click.option(
     "--format",
     type=click.Choice("XYZ PDB SDF".split(), case_sensitive=False),
@@ -26,9 +135,31 @@ def cli1():
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
-@click.argument("graph")
-def graph_to_geometry(graph: str, format: str, reference: str, version: str = None):
+@click.argument("graph", required=False)
+def graph_to_geometry(
+    graph: str,
+    format: str,
+    reference: str,
+    version: str,
+    batch,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
+):
     """Molecular geometry from a graph."""
+    if batch is not None:
+        return _run_batch(
+            batch,
+            jobs,
+            output_format,
+            keep_order,
+            "graph-to-geometry",
+            "graph",
+            "geometry",
+            version,
+            {"format": format},
+        )
+    _require(graph, "GRAPH")
     try:
         result = leruli.graph_to_geometry(graph, format, version)
     except Exception as e:
@@ -40,23 +171,35 @@ def graph_to_geometry(graph: str, format: str, reference: str, version: str = No
         print(result["geometry"])
 
 
-@click.group()
-def cli2():
-    pass
-
-
-@cli2.command()
+@click.command()
+@batch_options
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
-@click.argument("formula")
+@click.argument("formula", required=False)
 def canonical_formula(
     formula: str,
     reference: bool,
     version: str,
+    batch,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
 ):
     """Canonicalize a sum formula."""
+    if batch is not None:
+        return _run_batch(
+            batch,
+            jobs,
+            output_format,
+            keep_order,
+            "canonical-formula",
+            "formula",
+            "formula",
+            version,
+        )
+    _require(formula, "FORMULA")
     result = leruli.canonical_formula(formula, version)
     if reference:
         print(
@@ -65,23 +208,35 @@ def canonical_formula(
     print(result["formula"])
 
 
-@click.group()
-def cli5():
-    pass
-
-
-@cli5.command()
+@click.command()
+@batch_options
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
-@click.argument("graph")
+@click.argument("graph", required=False)
 def graph_to_formula(
     graph: str,
     reference: bool,
     version: str,
+    batch,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
 ):
     """Obtain a formula from a graph."""
+    if batch is not None:
+        return _run_batch(
+            batch,
+            jobs,
+            output_format,
+            keep_order,
+            "graph-to-formula",
+            "graph",
+            "formula",
+            version,
+        )
+    _require(graph, "GRAPH")
     result = leruli.graph_to_formula(graph, version)
     if reference:
         print(
@@ -90,23 +245,35 @@ def graph_to_formula(
     print(result["formula"])
 
 
-@click.group()
-def cli20():
-    pass
-
-
-@cli20.command()
+@click.command()
+@batch_options
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
-@click.argument("graph")
+@click.argument("graph", required=False)
 def graph_to_boiling_point(
     graph: str,
     reference: bool,
     version: str,
+    batch,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
 ):
     """Estimate a boiling point in deg C."""
+    if batch is not None:
+        return _run_batch(
+            batch,
+            jobs,
+            output_format,
+            keep_order,
+            "graph-to-boiling-point",
+            "graph",
+            "bp",
+            version,
+        )
+    _require(graph, "GRAPH")
     result = leruli.graph_to_boiling_point(graph, version)
     if reference:
         print(
@@ -115,23 +282,35 @@ def graph_to_boiling_point(
     print(result["bp"])
 
 
-@click.group()
-def cli21():
-    pass
-
-
-@cli21.command()
+@click.command()
+@batch_options
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
-@click.argument("graph")
+@click.argument("graph", required=False)
 def graph_to_melting_point(
     graph: str,
     reference: bool,
     version: str,
+    batch,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
 ):
     """Estimate a melting point in deg C."""
+    if batch is not None:
+        return _run_batch(
+            batch,
+            jobs,
+            output_format,
+            keep_order,
+            "graph-to-melting-point",
+            "graph",
+            "mp",
+            version,
+        )
+    _require(graph, "GRAPH")
     result = leruli.graph_to_melting_point(graph, version)
     if reference:
         print(
@@ -140,23 +319,35 @@ def graph_to_melting_point(
     print(result["mp"])
 
 
-@click.group()
-def cli22():
-    pass
-
-
-@cli22.command()
+@click.command()
+@batch_options
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
-@click.argument("graph")
+@click.argument("graph", required=False)
 def graph_to_logP(
     graph: str,
     reference: bool,
     version: str,
+    batch,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
 ):
     """Estimate a logP."""
+    if batch is not None:
+        return _run_batch(
+            batch,
+            jobs,
+            output_format,
+            keep_order,
+            "graph-to-logP",
+            "graph",
+            "logp",
+            version,
+        )
+    _require(graph, "GRAPH")
     result = leruli.graph_to_logP(graph, version)
     if reference:
         print(
@@ -165,23 +356,35 @@ def graph_to_logP(
     print(result["logp"])
 
 
-@click.group()
-def cli23():
-    pass
-
-
-@cli23.command()
+@click.command()
+@batch_options
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
-@click.argument("graph")
+@click.argument("graph", required=False)
 def graph_to_logD(
     graph: str,
     reference: bool,
     version: str,
+    batch,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
 ):
     """Estimate a logD."""
+    if batch is not None:
+        return _run_batch(
+            batch,
+            jobs,
+            output_format,
+            keep_order,
+            "graph-to-logD",
+            "graph",
+            "logp",
+            version,
+        )
+    _require(graph, "GRAPH")
     result = leruli.graph_to_logD(graph, version)
     if reference:
         print(
@@ -190,23 +393,35 @@ def graph_to_logD(
     print(result["logp"])
 
 
-@click.group()
-def cli24():
-    pass
-
-
-@cli24.command()
+@click.command()
+@batch_options
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
-@click.argument("graph")
+@click.argument("graph", required=False)
 def graph_to_pKa(
     graph: str,
     reference: bool,
     version: str,
+    batch,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
 ):
     """Estimate a pKa."""
+    if batch is not None:
+        return _run_batch(
+            batch,
+            jobs,
+            output_format,
+            keep_order,
+            "graph-to-pKa",
+            "graph",
+            None,
+            version,
+        )
+    _require(graph, "GRAPH")
     result = leruli.graph_to_pKa(graph, version)
     if reference:
         print(
@@ -215,23 +430,35 @@ def graph_to_pKa(
     print(result)
 
 
-@click.group()
-def cli3():
-    pass
-
-
-@cli3.command()
+@click.command()
+@batch_options
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
-@click.argument("graph")
+@click.argument("graph", required=False)
 def canonical_graph(
     graph: str,
     reference: bool,
     version: str,
+    batch,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
 ):
     """Canonicalize a graph."""
+    if batch is not None:
+        return _run_batch(
+            batch,
+            jobs,
+            output_format,
+            keep_order,
+            "canonical-graph",
+            "graph",
+            "graph",
+            version,
+        )
+    _require(graph, "GRAPH")
     result = leruli.canonical_graph(graph, version)
     if reference:
         print(
@@ -240,49 +467,66 @@ def canonical_graph(
     print(result["graph"])
 
 
-@click.group()
-def cli6():
-    pass
-
-
-@cli6.command()
+@click.command()
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
+@click.option(
+    "--limit", type=int, default=None, help="Print at most this many molecules."
+)
 @click.argument("formula")
 def formula_to_graphs(
     formula: str,
     reference: bool,
     version: str,
+    limit: int,
 ):
-    """Find molecular graphs of a given sum formula."""
-    result = leruli.formula_to_graphs(formula, version)
+    """Find molecular graphs of a given sum formula.
+
+    Molecules are printed while they are received."""
     if reference:
+        # the reference is part of the full result, which cannot be streamed
+        result = leruli.formula_to_graphs(formula, version)
         print(
             f"# Reference as BibTeX: https://api.leruli.com/{version}/references/{result['reference']}/bibtex"
         )
-    for molecule in result["molecules"]:
+        molecules = result["molecules"][:limit]
+    else:
+        molecules = leruli.iter_formula_to_graphs(formula, version, limit=limit)
+    for molecule in molecules:
         print(f"{molecule['name']}: {molecule['smiles']}")
 
 
-@click.group()
-def cli7():
-    pass
-
-
-@cli7.command()
+@click.command()
+@batch_options
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
-@click.argument("graph")
+@click.argument("graph", required=False)
 def graph_to_name(
     graph: str,
     reference: bool,
     version: str,
+    batch,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
 ):
     """Obtain a name from a graph."""
+    if batch is not None:
+        return _run_batch(
+            batch,
+            jobs,
+            output_format,
+            keep_order,
+            "graph-to-name",
+            "graph",
+            "name",
+            version,
+        )
+    _require(graph, "GRAPH")
     result = leruli.graph_to_name(graph, version)
     if reference:
         print(
@@ -291,23 +535,35 @@ def graph_to_name(
     print(result["name"])
 
 
-@click.group()
-def cli8():
-    pass
-
-
-@cli8.command()
+@click.command()
+@batch_options
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
 )
-@click.argument("name")
+@click.argument("name", required=False)
 def name_to_graph(
     name: str,
     reference: bool,
     version: str,
+    batch,
+    jobs: int,
+    output_format: str,
+    keep_order: bool,
 ):
     """Obtain a graph from a name."""
+    if batch is not None:
+        return _run_batch(
+            batch,
+            jobs,
+            output_format,
+            keep_order,
+            "name-to-graph",
+            "name",
+            "graph",
+            version,
+        )
+    _require(name, "NAME")
     result = leruli.name_to_graph(name, version)
     if reference:
         print(
@@ -316,12 +572,7 @@ def name_to_graph(
     print(result["graph"])
 
 
-@click.group()
-def cli9():
-    pass
-
-
-@cli9.command()
+@click.command()
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
@@ -340,15 +591,12 @@ def formula_to_cost(
         print(
             f"# Reference as BibTeX: https://api.leruli.com/{version}/references/{result['reference']}/bibtex"
         )
-    print(tabulate.tabulate(result["data"], headers="keys"))
+    import tabulate
 
-
-@click.group()
-def cli10():
-    pass
+    print(tabulate.tabulate(result["data"], headers="keys"))
 
 
-@cli10.command()
+@click.command()
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option("--angle", default=0, help="Rotation angle.")
 @click.option(
@@ -380,12 +628,7 @@ def graph_to_image(
         fh.write(base64.b64decode(result["image"]))
 
 
-@click.group()
-def cli11():
-    pass
-
-
-@cli11.command()
+@click.command()
 @click.option("--version", default="latest", help="Request specific API version.")
 @click.option(
     "--reference", is_flag=True, default=False, help="Print references for the result."
@@ -419,15 +662,12 @@ def graph_to_solvation_energy(
             {"Temperature [K]": k, "Energy of solvation [kcal/mol]": v}
             for k, v in result["solvation_energies"].items()
         ]
-        print(tabulate.tabulate(printable, headers="keys"))
-
+        import tabulate
 
-@click.group()
-def group_task_submit():
-    pass
+    print(tabulate.tabulate(printable, headers="keys"))
 
 
-@group_task_submit.command()
+@click.command()
 @click.option("--memory", default=4000, help="Memory limit in MB.")
 @click.option("--time", default=60 * 24, help="Time limit in minutes.")
 @click.option("--cores", default=1, help="Number of cores to allocate.")
@@ -436,6 +676,52 @@ def group_task_submit():
     nargs=1,
     help="Submit multiple directories at once, specified as either a string of a globbing pattern (e.g., case-?/run-*/) or a file with a line-by-line list of directories.",
 )
+@click.option(
+    "--compression",
+    default=None,
+    help="Codec and level of the job archive: gzip[:LEVEL] (default gzip:6), zstd[:LEVEL] or store.",
+)
+@click.option(
+    "--dedup",
+    is_flag=True,
+    default=False,
+    help="Upload files of at least LERULI_DEDUP_SIZE bytes (default 1 MiB) only once to a blob store shared by all jobs.",
+)
+@click.option(
+    "--resubmit",
+    is_flag=True,
+    default=False,
+    help="Submit already submitted directories again, uploading only files changed since. Implies --dedup.",
+)
+@click.option(
+    "--bucket",
+    default=None,
+    help="Store the jobs under key prefixes of this long-lived bucket instead of creating one bucket per job.",
+)
+@click.option(
+    "--processes",
+    type=int,
+    default=None,
+    help="Worker processes for --batch, by default one per core, at most 8.",
+)
+@click.option(
+    "--max-uploads",
+    type=int,
+    default=None,
+    help="Upper bound of concurrent uploads for --batch, which otherwise adapt to the connection (default 64).",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Print the time spent in each stage of the submission.",
+)
+@click.option(
+    "--trace",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write a timeline of all stages and jobs as Chrome trace JSON file.",
+)
 @click.argument("code")
 @click.argument("version")
 @click.argument("command", nargs=-1, required=True)
@@ -444,20 +730,48 @@ def task_submit(
     time: int,
     cores: int,
     batch: str,
+    compression: str,
+    dedup: bool,
+    resubmit: bool,
+    bucket: str,
+    processes: int,
+    max_uploads: int,
+    profile: bool,
+    trace: str,
     code: str,
     version: str,
     command: str,
 ):
     """Submit one or many jobs to the Leruli queue. This is a paid feature requiring an API secret, which can be obtained from info@leruli.com."""
+    from leruli import archive, profiling
 
+    try:
+        archive.codec(compression)
+    except ValueError as e:
+        print(str(e))
+        sys.exit(1)
+    profiling.enable(profile or trace is not None)
+    starttime = modtime.time()
     if batch is None:
         try:
             jobid = leruli.task_submit(
-                ".", code, version, command, cores, memory, time * 60
+                ".",
+                code,
+                version,
+                command,
+                cores,
+                memory,
+                time * 60,
+                compression,
+                dedup,
+                resubmit,
+                bucket,
             )
         except ValueError as e:
             print(f"Not submitted: {str(e)}")
             sys.exit(1)
+        finally:
+            _report_profile(profile, trace, modtime.time() - starttime)
         if jobid is not None:
             print(jobid)
         else:
@@ -473,8 +787,21 @@ def task_submit(
         except:
             directories = glob.glob(batch)
 
+        # an interrupted run of the same command resumes from its journal
+        journal = leruli.journal.journal_path(
+            os.path.abspath(batch),
+            code,
+            version,
+            command,
+            cores,
+            memory,
+            time,
+            compression,
+            dedup,
+            resubmit,
+            bucket,
+        )
         njobs = len(directories)
-        starttime = modtime.time()
         failed = leruli.task_submit_many(
             directories,
             [code] * njobs,
@@ -483,22 +810,66 @@ def task_submit(
             [cores] * njobs,
             [memory] * njobs,
             [time * 60] * njobs,
+            compression,
+            dedup,
+            resubmit,
+            bucket,
+            processes,
+            max_uploads,
+            journal,
         )
         stoptime = modtime.time()
         for directory in sorted(failed.keys()):
             print(f"Not submitted: {directory} - {failed[directory]}")
         duration = stoptime - starttime
         print(f"Submitted {njobs} in {duration:1.1f}s ({njobs/duration:1.0f}/s)")
+        _report_profile(profile, trace, duration)
         if len(failed) > 0:
             sys.exit(1)
 
 
-@click.group()
-def group_task_status():
-    pass
+def _report_profile(profile: bool, trace: str, wall: float):
+    from leruli import profiling
 
+    spans = profiling.take()
+    if trace is not None:
+        profiling.dump(spans, trace)
+    if not profile:
+        return
 
-@group_task_status.command()
+    import tabulate
+
+    rows = [
+        [
+            _["stage"],
+            _["count"],
+            _["total"],
+            _["mean"],
+            _["p95"],
+            _["busy"],
+            100 * _["share"],
+        ]
+        for _ in profiling.summary(spans, wall)
+    ]
+    print(
+        tabulate.tabulate(
+            rows,
+            headers=[
+                "Stage",
+                "Jobs",
+                "Total [s]",
+                "Mean [s]",
+                "p95 [s]",
+                "Busy [s]",
+                "Share of wall [%]",
+            ],
+            floatfmt=".3f",
+        ),
+        file=sys.stderr,
+    )
+
+
+@click.command()
 @click.argument("jobid", required=False)
 def task_status(jobid: str):
     """Get the status of a job in the queue."""
@@ -522,12 +893,7 @@ def task_status(jobid: str):
         print(status["status"] + ": " + status["reason"])
 
 
-@click.group()
-def group_task_get():
-    pass
-
-
-@group_task_get.command()
+@click.command()
 @click.argument("bucket", required=False)
 def task_get(bucket: str):
     """Retrieve the input and result files of a job."""
@@ -537,12 +903,7 @@ def task_get(bucket: str):
     leruli.task_get(".", bucket)
 
 
-@click.group()
-def group_task_cancel():
-    pass
-
-
-@group_task_cancel.command()
+@click.command()
 @click.argument("jobid", required=False)
 def task_cancel(jobid: str):
     """Cancels a job in the queue."""
@@ -558,12 +919,7 @@ def task_cancel(jobid: str):
         print(status["status"] + ": " + status["reason"])
 
 
-@click.group()
-def group_task_list_codes():
-    pass
-
-
-@group_task_list_codes.command()
+@click.command()
 def task_list_codes():
     """Lists all codes available to you."""
     codes = leruli.task_list_codes()
@@ -571,16 +927,15 @@ def task_list_codes():
         print(f"{code}:{version}")
 
 
-@click.group()
-def group_task_prune():
-    pass
-
-
-@group_task_prune.command()
+@click.command()
 @click.argument("jobid", required=False)
 @click.argument("bucket", required=False)
 def task_prune(jobid: str, bucket: str):
-    """Deletes the input/output files of a bucket."""
+    """Deletes the input/output files of a bucket.
+
+    Without arguments, the files of earlier submissions of a resubmitted
+    directory are deleted, too.
+    """
     if (jobid is None and bucket is not None) or (jobid is not None and bucket is None):
         print("Either specify none or both of jobid and bucket.")
         sys.exit(1)
@@ -593,22 +948,28 @@ def task_prune(jobid: str, bucket: str):
         print("Cannot prune a running job: the job would complete and fail.")
         sys.exit(1)
 
+    # storage of earlier jobs of a resubmitted directory
+    previous = []
     if bucket is None:
         with open("leruli.bucket") as fh:
             bucket = fh.read().strip()
+        previous = leruli.task._task_previous_locations(".")
     try:
         leruli.task_prune(bucket)
     except:
         print("Pruning failed. Bucket already pruned or wrong S3 credentials.")
         sys.exit(1)
+    for location in previous:
+        try:
+            leruli.task_prune(location)
+        except:
+            print(f"Pruning {location} of an earlier submission failed.")
+            sys.exit(1)
+    if previous:
+        os.remove("leruli.bucket.previous")
 
 
-@click.group()
-def group_task_publish_code():
-    pass
-
-
-@group_task_publish_code.command()
+@click.command()
 @click.argument("code")
 @click.argument("version")
 def task_publish_code(code: str, version: str):
@@ -616,34 +977,68 @@ def task_publish_code(code: str, version: str):
     leruli.task_publish_code(code, version)
 
 
-cli = click.CommandCollection(
-    sources=[
-        cli1,
-        cli2,
-        cli3,
-        cli20,
-        cli21,
-        cli22,
-        cli23,
-        cli24,
-        cli5,
-        cli6,
-        cli7,
-        cli8,
-        cli9,
-        cli10,
-        cli11,
-        group_task_submit,
-        group_task_status,
-        # group_task_cancel,
-        group_task_publish_code,
-        group_task_prune,
-        group_task_get,
-        group_task_list_codes,
-        group_task_cancel,
-    ],
-    context_settings=CONTEXT_SETTINGS,
+@click.command()
+def cache_clear():
+    """Removes all locally cached results."""
+    resultcache = leruli.internal.get_cache()
+    if resultcache is None:
+        resultcache = leruli.internal.enable_cache()
+    resultcache.clear()
+
+
+@click.command()
+def cache_info():
+    """Shows location and size of the local result cache."""
+    resultcache = leruli.internal.get_cache()
+    if resultcache is None:
+        print("Result cache disabled. Set LERULI_CACHE=1 to enable it.")
+        return
+    stats = resultcache.stats()
+    print(f"{stats['path']}: {stats['entries']} results")
+
+
+def _configure_cache(cache: bool):
+    if not cache:
+        leruli.internal.disable_cache()
+
+
+@click.group(context_settings=CONTEXT_SETTINGS)
+@click.option(
+    "--cache/--no-cache",
+    default=True,
+    help="Use the local result cache if enabled via LERULI_CACHE.",
 )
+def cli(cache: bool):
+    _configure_cache(cache)
+
+
+for command in (
+    cache_clear,
+    cache_info,
+    canonical_formula,
+    canonical_graph,
+    formula_to_cost,
+    formula_to_graphs,
+    graph_to_boiling_point,
+    graph_to_formula,
+    graph_to_geometry,
+    graph_to_image,
+    graph_to_logD,
+    graph_to_logP,
+    graph_to_melting_point,
+    graph_to_name,
+    graph_to_pKa,
+    graph_to_solvation_energy,
+    name_to_graph,
+    task_cancel,
+    task_get,
+    task_list_codes,
+    task_prune,
+    task_publish_code,
+    task_status,
+    task_submit,
+):
+    cli.add_command(command)
 
 
 def main():
@@ -1,5 +1,7 @@
 from . import internal
-from typing import List
+from typing import Iterable, List
+import concurrent.futures
+import itertools
 
 
 def graph_to_image(
@@ -110,3 +112,224 @@ def graph_to_formula(
 ):
     payload = {"graph": graph}
     return internal._base_call("graph-to-formula", payload, version, urgent, progress)
+
+
+# property name: (endpoint, key of the value in the result or None for all of it)
+_PROPERTIES = {
+    "logP": ("graph-to-logP", "logp"),
+    "logD": ("graph-to-logD", "logp"),
+    "pKa": ("graph-to-pKa", None),
+    "bp": ("graph-to-boiling-point", "bp"),
+    "mp": ("graph-to-melting-point", "mp"),
+    "formula": ("graph-to-formula", "formula"),
+    "name": ("graph-to-name", "name"),
+    "canonical": ("canonical-graph", "graph"),
+}
+
+
+def _property_value(future, key):
+    result = future.result().result()
+    if result is None or key is None:
+        return result
+    return result[key]
+
+
+def _graph_to_properties_chunk(executor, graphs, properties, version, urgent, pbar):
+    futures = []
+    for graph in graphs:
+        row = []
+        for prop in properties:
+            endpoint, key = _PROPERTIES[prop]
+            row.append(
+                executor.submit(
+                    internal._base_future, endpoint, {"graph": graph}, version, urgent
+                )
+            )
+        futures.append(row)
+
+    columns = {prop: [] for prop in properties}
+    columns["graph"] = graphs
+    columns["error"] = []
+    for row in futures:
+        failed = False
+        for prop, future in zip(properties, row):
+            try:
+                value = _property_value(future, _PROPERTIES[prop][1])
+            except Exception:
+                value = None
+                failed = True
+            columns[prop].append(value)
+        columns["error"].append(failed)
+        if pbar is not None:
+            pbar.update(1)
+    return columns
+
+
+def _canonicalize(executor, graphs, version, urgent):
+    known = internal.get_canonical_map()
+    canonicals = known.get_many(graphs, version)
+    futures = {
+        graph: executor.submit(
+            internal._base_future, "canonical-graph", {"graph": graph}, version, urgent
+        )
+        for graph in graphs
+        if graph not in canonicals
+    }
+    new = {}
+    for graph, future in futures.items():
+        try:
+            new[graph] = _property_value(future, "graph")
+        except Exception:
+            continue
+    known.put_many(new, version)
+    canonicals.update(new)
+    return canonicals
+
+
+def _graph_to_properties_deduplicated(
+    executor, graphs, properties, version, urgent, pbar
+):
+    canonicals = _canonicalize(executor, list(dict.fromkeys(graphs)), version, urgent)
+    unique = list(dict.fromkeys(canonicals.values()))
+    results = _graph_to_properties_chunk(
+        executor, unique, properties, version, urgent, None
+    )
+    rows = {graph: row for row, graph in enumerate(unique)}
+
+    columns = {prop: [] for prop in properties}
+    columns["graph"] = graphs
+    columns["error"] = []
+    for graph in graphs:
+        row = rows.get(canonicals.get(graph))
+        for prop in properties:
+            columns[prop].append(None if row is None else results[prop][row])
+        columns["error"].append(True if row is None else results["error"][row])
+    if pbar is not None:
+        pbar.update(len(graphs))
+    return columns
+
+
+def iter_graph_to_properties(
+    graphs: Iterable[str],
+    properties: List[str],
+    version: str = "latest",
+    urgent: bool = False,
+    progress: bool = False,
+    max_workers: int = 16,
+    chunksize: int = 1000,
+    deduplicate: bool = False,
+):
+    """Obtains several properties for many molecular graphs, chunk by chunk.
+
+    Only one chunk of the input is held in memory at a time, so arbitrarily
+    long iterables can be processed.
+
+    Parameters
+    ----------
+    graphs : Iterable[str]
+        SMILES, may be a generator.
+    properties : List[str]
+        Any of logP, logD, pKa, bp, mp, formula, name, canonical.
+    version : str, optional
+        Specific version of the API to use, by default "latest"
+    urgent : bool, optional
+        For interactive use only, by default False
+    progress : bool, optional
+        Whether to show a progress bar, by default False
+    max_workers : int, optional
+        Maximum number of requests sent concurrently, by default 16
+    chunksize : int, optional
+        Number of graphs per chunk, by default 1000
+    deduplicate : bool, optional
+        Query every canonical graph only once per chunk, by default False.
+        Canonical forms are remembered across runs, see `internal.get_canonical_map`.
+
+    Yields
+    ------
+    dict[str, list]
+        Columns for the input graphs ("graph"), every requested property and a
+        per-row error mask ("error"). Failed values are None.
+    """
+    unknown = set(properties) - set(_PROPERTIES)
+    if len(unknown) > 0:
+        raise ValueError(
+            f"Unknown properties {', '.join(sorted(unknown))}. Choose from {', '.join(_PROPERTIES)}."
+        )
+
+    pbar = None
+    if progress:
+        import tqdm
+
+        total = len(graphs) if hasattr(graphs, "__len__") else None
+        pbar = tqdm.tqdm(total=total, desc="Querying")
+
+    graphs = iter(graphs)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            while True:
+                chunk = list(itertools.islice(graphs, chunksize))
+                if len(chunk) == 0:
+                    break
+                if deduplicate:
+                    yield _graph_to_properties_deduplicated(
+                        executor, chunk, properties, version, urgent, pbar
+                    )
+                else:
+                    yield _graph_to_properties_chunk(
+                        executor, chunk, properties, version, urgent, pbar
+                    )
+    finally:
+        if pbar is not None:
+            pbar.close()
+
+
+def graph_to_properties(
+    graphs: Iterable[str],
+    properties: List[str],
+    version: str = "latest",
+    urgent: bool = False,
+    progress: bool = False,
+    max_workers: int = 16,
+    deduplicate: bool = False,
+):
+    """Obtains several properties for many molecular graphs at once.
+
+    Requests are sent concurrently. See `iter_graph_to_properties` for inputs
+    that do not fit into memory.
+
+    Parameters
+    ----------
+    graphs : Iterable[str]
+        SMILES
+    properties : List[str]
+        Any of logP, logD, pKa, bp, mp, formula, name, canonical.
+    version : str, optional
+        Specific version of the API to use, by default "latest"
+    urgent : bool, optional
+        For interactive use only, by default False
+    progress : bool, optional
+        Whether to show a progress bar, by default False
+    max_workers : int, optional
+        Maximum number of requests sent concurrently, by default 16
+    deduplicate : bool, optional
+        Query different spellings of the same molecule only once, by default False
+
+    Returns
+    -------
+    dict[str, list]
+        Columns for the input graphs ("graph"), every requested property and a
+        per-row error mask ("error"), all aligned to the input order.
+    """
+    columns = {prop: [] for prop in ["graph"] + list(properties) + ["error"]}
+    for chunk in iter_graph_to_properties(
+        graphs,
+        properties,
+        version,
+        urgent,
+        progress,
+        max_workers,
+        deduplicate=deduplicate,
+    ):
+        for column, values in chunk.items():
+            columns[column] += values
+    return columns
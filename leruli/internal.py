@@ -1,9 +1,21 @@
 from typing import Dict
+import codecs
+import concurrent.futures
+import heapq
+import itertools
+import email.utils
+import json
 import os
+import random
+import re
+import threading
+import urllib.parse
 import requests as rq
-import tqdm
-from minio import Minio
+import requests.adapters
 import time
+from . import cache
+from . import metrics
+from . import ratelimit
 
 BASEURL = os.getenv("LERULI_BASEURL", "https://api.leruli.com")
 SORRY = "ERROR: Accessing API failed. This is our fault, not yours. Please accept our apologies. We have been notified of this error."
@@ -29,6 +41,725 @@ class LeruliInternalError(Exception):
     pass
 
 
+class CircuitOpenError(LeruliInternalError):
+    """Raised without contacting the API while an endpoint is considered down."""
+
+    pass
+
+
+class CircuitBreaker:
+    """Fails fast for an endpoint after repeated failures.
+
+    After `threshold` consecutive failures the circuit opens and calls fail
+    immediately. Once `cooldown` seconds have passed, a single trial call is let
+    through (half-open): success closes the circuit, failure opens it again with
+    twice the cooldown, up to `max_cooldown`.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 10, max_cooldown=300):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._failures = 0
+        self._opened = None
+        self._current_cooldown = cooldown
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """One of "closed", "open" or "half-open"."""
+        with self._lock:
+            if self._opened is None:
+                return "closed"
+            if self._trial or time.monotonic() >= self._opened + self._current_cooldown:
+                return "half-open"
+            return "open"
+
+    @property
+    def retry_after(self):
+        """Seconds until the next trial call is allowed."""
+        with self._lock:
+            if self._opened is None:
+                return 0
+            return max(self._opened + self._current_cooldown - time.monotonic(), 0)
+
+    def allow(self):
+        with self._lock:
+            if self._opened is None:
+                return True
+            if self._trial or time.monotonic() < self._opened + self._current_cooldown:
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._trial = False
+            self._current_cooldown = self.cooldown
+
+    def release(self):
+        """Ends a call without an outcome, e.g. a cancelled one, freeing the trial."""
+        with self._lock:
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial:
+                self._current_cooldown = min(
+                    2 * self._current_cooldown, self.max_cooldown
+                )
+            if self._trial or self._failures >= self.threshold:
+                self._opened = time.monotonic()
+            self._trial = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(endpoint: str):
+    """Returns the circuit breaker of an endpoint."""
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker()
+        return _breakers[endpoint]
+
+
+def circuit_state():
+    """Current state of all circuit breakers, so batch drivers can pause instead of failing.
+
+    Returns
+    -------
+    dict[str, dict]
+        Per endpoint, the state ("closed", "open", "half-open") and the number of
+        seconds until the next trial call.
+    """
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {
+        endpoint: {"state": breaker.state, "retry_after": breaker.retry_after}
+        for endpoint, breaker in breakers.items()
+    }
+
+
+# transient failures worth retrying
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# responses asking clients to slow down
+THROTTLE_STATUS = {429, 503}
+
+
+def _endpoint_group(endpoint: str):
+    if endpoint.startswith("task-") or endpoint.startswith("bulk/"):
+        return "task"
+    return "properties"
+
+
+def _retry_delay(attempt: int, retry_after: str = None, backoff: float = 0.5):
+    """Exponential backoff with full jitter, honouring a Retry-After header."""
+    delay = random.uniform(0, min(backoff * 2**attempt, 30))
+    if retry_after is None:
+        return delay
+    try:
+        seconds = float(retry_after)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(retry_after).timestamp()
+            seconds -= time.time()
+        except (TypeError, ValueError):
+            return delay
+    return min(max(seconds, 0), 300) + random.uniform(0, backoff)
+
+
+def _record_response(method, url, endpoint, attempt, status, start):
+    elapsed = time.monotonic() - start
+    metrics.metrics.observe(endpoint, "http", elapsed)
+    if status >= 500:
+        metrics.metrics.increment(endpoint, "server_errors")
+    elif status == 429:
+        metrics.metrics.increment(endpoint, "throttled")
+    metrics.emit(
+        "on_response",
+        method=method,
+        url=url,
+        endpoint=endpoint,
+        attempt=attempt,
+        status=status,
+        elapsed=elapsed,
+    )
+
+
+class Client:
+    """Shared HTTP client keeping a pool of persistent connections to the API.
+
+    Failed requests (network errors, 429 and 5xx) are retried with jittered
+    exponential backoff. Repeated failures open the circuit breaker of the
+    endpoint, after which calls fail fast with `CircuitOpenError`.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        Maximum number of connections kept alive per host.
+    timeout : float or tuple[float, float], optional
+        Connect and read timeout in seconds, as accepted by `requests`.
+    retries : int, optional
+        Number of retries of a failed request.
+    backoff : float, optional
+        Base delay in seconds between retries, doubling with every attempt.
+    """
+
+    def __init__(
+        self, pool_size: int = 10, timeout=(10, 120), retries: int = 3, backoff=0.5
+    ):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # sockets must not be shared with forked worker processes
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    session = rq.Session()
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=self.pool_size, pool_maxsize=self.pool_size
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+                    self._pid = pid
+        return self._session
+
+    def request(
+        self, method: str, url: str, endpoint: str = None, retries: int = None, **kwargs
+    ):
+        """Sends a request, retrying transient failures.
+
+        Returns the last response once retries are exhausted, so callers still
+        see the final status code. Network errors are raised. Requests are paced
+        by the rate limiter of the endpoint group.
+        """
+        if endpoint is None:
+            endpoint = urllib.parse.urlsplit(url).path.split("/", 2)[-1]
+        limiter = ratelimit.get_limiter(_endpoint_group(endpoint))
+        if retries is None:
+            retries = self.retries
+        kwargs.setdefault("timeout", self.timeout)
+
+        breaker = circuit_breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(
+                f"API endpoint {endpoint} unavailable, retrying in {breaker.retry_after:1.0f}s."
+            )
+
+        try:
+            for attempt in range(retries + 1):
+                res, error = None, None
+                if limiter is not None:
+                    limiter.acquire()
+                metrics.emit(
+                    "on_request",
+                    method=method,
+                    url=url,
+                    endpoint=endpoint,
+                    attempt=attempt,
+                )
+                metrics.metrics.increment(endpoint, "requests")
+                start = time.monotonic()
+                try:
+                    res = self.session.request(method, url, **kwargs)
+                except (rq.ConnectionError, rq.Timeout) as e:
+                    error = e
+                    metrics.metrics.increment(endpoint, "errors")
+                    metrics.emit(
+                        "on_error",
+                        method=method,
+                        url=url,
+                        endpoint=endpoint,
+                        attempt=attempt,
+                        error=e,
+                    )
+                else:
+                    _record_response(
+                        method, url, endpoint, attempt, res.status_code, start
+                    )
+                    if res.status_code not in RETRY_STATUS:
+                        breaker.success()
+                        return res
+                    if limiter is not None and res.status_code in THROTTLE_STATUS:
+                        limiter.throttle()
+                if attempt < retries:
+                    metrics.metrics.increment(endpoint, "retries")
+                    retry_after = (
+                        None if res is None else res.headers.get("Retry-After")
+                    )
+                    time.sleep(_retry_delay(attempt, retry_after, self.backoff))
+        except rq.RequestException:
+            # e.g. a broken response body
+            breaker.failure()
+            raise
+        except BaseException:
+            # e.g. an interrupt or a failing metrics hook, not the endpoint's fault
+            breaker.release()
+            raise
+
+        # throttling means the service is up
+        if res is not None and res.status_code == 429:
+            breaker.success()
+        else:
+            breaker.failure()
+        if error is not None:
+            raise error
+        return res
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None and self._pid == os.getpid():
+                self._session.close()
+            self._session = None
+
+
+def _timeout_from_env():
+    timeout = os.getenv("LERULI_TIMEOUT")
+    if timeout is None:
+        return (10, 120)
+    if "," in timeout:
+        return tuple(float(_) for _ in timeout.split(","))
+    return float(timeout)
+
+
+client = Client(
+    pool_size=int(os.getenv("LERULI_POOLSIZE", "10")),
+    timeout=_timeout_from_env(),
+    retries=int(os.getenv("LERULI_RETRIES", "3")),
+)
+
+
+def configure_client(
+    pool_size: int = None, timeout=None, retries: int = None, backoff: float = None
+):
+    """Replaces the shared HTTP client used by all API calls.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        Maximum number of connections kept alive, by default unchanged.
+    timeout : float or tuple[float, float], optional
+        Connect and read timeout in seconds, by default unchanged.
+    retries : int, optional
+        Number of retries of failed requests, by default unchanged.
+    backoff : float, optional
+        Base delay in seconds between retries, by default unchanged.
+    """
+    global client
+    if pool_size is None:
+        pool_size = client.pool_size
+    if timeout is None:
+        timeout = client.timeout
+    if retries is None:
+        retries = client.retries
+    if backoff is None:
+        backoff = client.backoff
+    client.close()
+    client = Client(pool_size, timeout, retries, backoff)
+    return client
+
+
+# endpoints whose results only depend on payload and version
+CACHEABLE_ENDPOINTS = {
+    "canonical-formula",
+    "canonical-graph",
+    "name-to-graph",
+    "formula-to-graphs",
+    "formula-to-cost",
+    "graph-to-image",
+    "graph-to-solvation-energy",
+    "graph-to-geometry",
+    "graph-to-name",
+    "graph-to-boiling-point",
+    "graph-to-melting-point",
+    "graph-to-logP",
+    "graph-to-logD",
+    "graph-to-pKa",
+    "graph-to-formula",
+}
+# results with no content are cached as None, error documents not at all
+CACHEABLE_STATUS = (200, 204)
+_cache = None
+_cache_configured = False
+
+
+def enable_cache(path: str = None, max_entries: int = 1000000, ttl: float = 7 * 86400):
+    """Caches results of property endpoints on disk across runs.
+
+    Parameters
+    ----------
+    path : str, optional
+        SQLite database file, by default ``~/.cache/leruli/results.sqlite``.
+    max_entries : int, optional
+        Maximum number of results kept, least recently used ones are evicted first.
+    ttl : float, optional
+        Lifetime in seconds of results obtained for ``version="latest"``.
+
+    Returns
+    -------
+    cache.ResultCache
+        The active cache.
+    """
+    global _cache, _cache_configured
+    _cache = cache.ResultCache(path, max_entries, ttl)
+    _cache_configured = True
+    return _cache
+
+
+def disable_cache():
+    """Stops using the result cache for subsequent calls."""
+    global _cache, _cache_configured
+    _cache = None
+    _cache_configured = True
+
+
+def get_cache():
+    """Returns the active result cache or None.
+
+    Unless configured explicitly, the cache is enabled by the environment variable
+    LERULI_CACHE, which is either a database path or 1 for the default location.
+    """
+    if not _cache_configured:
+        setting = os.getenv("LERULI_CACHE", "")
+        if setting.lower() in ("", "0", "off", "false", "no"):
+            disable_cache()
+        elif setting.lower() in ("1", "on", "true", "yes"):
+            enable_cache()
+        else:
+            enable_cache(setting)
+    return _cache
+
+
+_canonical_map = None
+
+
+def get_canonical_map():
+    """Returns the persistent map of input graphs to canonical graphs.
+
+    The location can be set with the environment variable LERULI_CANONICAL_MAP.
+    """
+    global _canonical_map
+    if _canonical_map is None:
+        _canonical_map = cache.CanonicalMap(os.getenv("LERULI_CANONICAL_MAP"))
+    return _canonical_map
+
+
+class _Poller:
+    """Polls all outstanding delayed (202) results from one background thread.
+
+    Every token is scheduled from its `time_to_result`. Tokens whose result is
+    overdue are polled again with exponential backoff. The actual requests are
+    issued from a small thread pool so slow responses do not delay other tokens.
+    """
+
+    MAX_INTERVAL = 3
+    MIN_BACKOFF = 0.1
+    IDLE_TIMEOUT = 30
+
+    def __init__(self, workers: int = 4):
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._queue = []
+        self._counter = itertools.count()
+        self._thread = None
+        self._executor = None
+
+    def track(
+        self,
+        version: str,
+        token: str,
+        time_to_result: float,
+        endpoint: str = None,
+        stream: bool = False,
+    ):
+        """Registers a token and returns a future for the parsed API result.
+
+        With `stream`, the future resolves to the unread response instead.
+        """
+        job = _PollJob(version, token, concurrent.futures.Future(), endpoint, stream)
+        self._schedule(job, time_to_result)
+        return job.future
+
+    def _schedule(self, job, time_to_result: float):
+        if time_to_result > 0:
+            delay = min(time_to_result, self.MAX_INTERVAL)
+            job.backoff = 0
+        else:
+            delay = job.backoff
+            job.backoff = min(max(2 * job.backoff, self.MIN_BACKOFF), self.MAX_INTERVAL)
+        job.future.eta = time.monotonic() + max(time_to_result, delay)
+
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            heapq.heappush(
+                self._queue, (time.monotonic() + delay, next(self._counter), job)
+            )
+            if self._thread is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="leruli-poll"
+                )
+                self._thread = threading.Thread(
+                    target=self._run, name="leruli-poller", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._queue) == 0:
+                    self._cond.wait(self.IDLE_TIMEOUT)
+                    if len(self._queue) == 0:
+                        self._thread = None
+                        self._executor.shutdown(wait=False)
+                        return
+                    continue
+                due, _, job = self._queue[0]
+                remainder = due - time.monotonic()
+                if remainder > 0:
+                    self._cond.wait(remainder)
+                    continue
+                heapq.heappop(self._queue)
+                executor = self._executor
+            executor.submit(self._poll, job)
+
+    def _poll(self, job):
+        try:
+            kwargs = {"stream": True} if job.stream else {}
+            res = client.get(
+                f"{BASEURL}/{job.version}/result/{job.token}",
+                endpoint=job.endpoint,
+                **kwargs,
+            )
+            job.polls += 1
+            endpoint = job.endpoint or "result"
+            metrics.metrics.increment(endpoint, "polls")
+            metrics.emit(
+                "on_poll",
+                endpoint=endpoint,
+                token=job.token,
+                status=res.status_code,
+                polls=job.polls,
+            )
+            if res.status_code == 202:
+                res = res.json()
+                job.token = res["token"]
+                self._schedule(job, res["time_to_result"])
+                return
+            metrics.metrics.observe(endpoint, "queue", time.monotonic() - job.queued)
+            job.future.cacheable = res.status_code in CACHEABLE_STATUS
+            job.future.set_result(_finish(res, job.stream))
+        except Exception as e:
+            job.future.set_exception(e)
+
+
+class _PollJob:
+    __slots__ = (
+        "version",
+        "token",
+        "future",
+        "backoff",
+        "endpoint",
+        "stream",
+        "polls",
+        "queued",
+    )
+
+    def __init__(self, version, token, future, endpoint=None, stream=False):
+        self.version = version
+        self.token = token
+        self.future = future
+        self.backoff = 0
+        self.endpoint = endpoint
+        self.stream = stream
+        self.polls = 0
+        self.queued = time.monotonic()
+
+
+poller = _Poller()
+
+
+def _finish(res, stream: bool = False):
+    # Internal error?
+    if str(res.status_code).startswith("5"):
+        if stream:
+            res.close()
+        raise LeruliInternalError()
+
+    # No content?
+    if res.status_code == 204:
+        return None
+    if stream:
+        return res
+    return res.json()
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_inflight_pid = os.getpid()
+
+
+def _request_future(
+    endpoint: str,
+    payload: Dict,
+    version: str,
+    urgent: bool = False,
+    files: Dict = {},
+    stream: bool = False,
+):
+    url = f"{BASEURL}/{version}/{endpoint}"
+    if urgent is True:
+        url = f"{url}?urgent={urgent}"
+    kwargs = {"stream": True} if stream else {}
+    start = time.monotonic()
+    metrics.metrics.increment(endpoint, "calls")
+    res = client.post(url, json=payload, files=files, endpoint=endpoint, **kwargs)
+    metrics.metrics.observe(endpoint, "first_response", time.monotonic() - start)
+
+    if res.status_code == 202:
+        res = res.json()
+        metrics.metrics.increment(endpoint, "delayed")
+        metrics.metrics.observe(endpoint, "time_to_result", res["time_to_result"])
+        future = poller.track(
+            version, res["token"], res["time_to_result"], endpoint, stream
+        )
+    else:
+        future = concurrent.futures.Future()
+        future.cacheable = res.status_code in CACHEABLE_STATUS
+        try:
+            future.set_result(_finish(res, stream))
+        except Exception as e:
+            future.set_exception(e)
+
+    def record(future):
+        metrics.metrics.observe(endpoint, "call", time.monotonic() - start)
+        if future.exception() is not None:
+            metrics.metrics.increment(endpoint, "failed_calls")
+
+    future.add_done_callback(record)
+    return future
+
+
+def _base_future(
+    endpoint: str,
+    payload: Dict,
+    version: str,
+    urgent: bool = False,
+    files: Dict = {},
+):
+    """Starts an API call and returns a future resolving to its result.
+
+    Delayed responses are handed to the shared poller, so no thread needs to
+    block while the result is being computed. Identical requests issued while
+    one is still in flight share its future instead of calling the API again.
+    """
+    if len(files) > 0:
+        return _request_future(endpoint, payload, version, urgent, files)
+
+    key = cache.ResultCache.key(endpoint, payload, version)
+    resultcache = None
+    if endpoint in CACHEABLE_ENDPOINTS:
+        resultcache = get_cache()
+    if resultcache is not None:
+        found, result = resultcache.get(key)
+        if found:
+            future = concurrent.futures.Future()
+            future.set_result(result)
+            return future
+
+    global _inflight_pid
+    # an urgent request does not wait for a regular one
+    inflight = (key, urgent)
+    with _inflight_lock:
+        # requests of the parent never complete in a forked child
+        if _inflight_pid != os.getpid():
+            _inflight.clear()
+            _inflight_pid = os.getpid()
+        if inflight in _inflight:
+            return _inflight[inflight]
+        future = concurrent.futures.Future()
+        _inflight[inflight] = future
+
+    try:
+        upstream = _request_future(endpoint, payload, version, urgent)
+    except Exception as e:
+        upstream = concurrent.futures.Future()
+        upstream.set_exception(e)
+    future.upstream = upstream
+
+    def resolve(upstream):
+        with _inflight_lock:
+            if _inflight.get(inflight) is future:
+                del _inflight[inflight]
+        if upstream.exception() is not None:
+            future.set_exception(upstream.exception())
+            return
+        # error documents, e.g. of throttled requests, must not be served later
+        if resultcache is not None and getattr(upstream, "cacheable", False):
+            resultcache.put(key, version, upstream.result())
+        future.set_result(upstream.result())
+
+    upstream.add_done_callback(resolve)
+    return future
+
+
+def _eta(future):
+    while hasattr(future, "upstream"):
+        future = future.upstream
+    return getattr(future, "eta", time.monotonic())
+
+
+def _wait(future, progress: bool = False):
+    """Blocks until the future is resolved, optionally showing a progress bar."""
+    if not progress or future.done():
+        return future.result()
+
+    import tqdm
+
+    pbar = tqdm.tqdm(
+        total=max(_eta(future) - time.monotonic(), 0),
+        desc="Waiting",
+        bar_format="{desc}: |{bar}| [{elapsed}<{remaining}]",
+    )
+    try:
+        while True:
+            try:
+                return future.result(timeout=1)
+            except concurrent.futures.TimeoutError:
+                pbar.total = pbar.n + 1 + max(_eta(future) - time.monotonic(), 0)
+                pbar.update(1)
+    finally:
+        pbar.total = pbar.n
+        pbar.update(0)
+        pbar.close()
+
+
 def _base_call(
     endpoint: str,
     payload: Dict,
@@ -39,65 +770,121 @@ def _base_call(
 ):
     """Common code to deal with the delayed responses as they can come from the API."""
     try:
-        url = f"{BASEURL}/{version}/{endpoint}"
-        if urgent is True:
-            url = f"{url}?urgent={urgent}"
-        res = rq.post(url, json=payload, files=files)
-
-        pbar = None
-        # wait for delayed responses
-        if res.status_code == 202:
+        future = _base_future(endpoint, payload, version, urgent, files)
+        return _wait(future, progress)
+    except CircuitOpenError:
+        raise
+    except:
+        print(SORRY)
+        raise LeruliInternalError()
+
+
+def _iter_json_array(res, key: str, chunk_size: int = 65536):
+    """Yields the objects of the array `key` of a JSON response while it is being received.
+
+    Only the current chunk and the object being parsed are held in memory.
+    """
+    scan = json.JSONDecoder().scan_once
+    text = codecs.getincrementaldecoder("utf-8")()
+    start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    separators = re.compile(r"[,\s]*")
+    chunks = res.iter_content(chunk_size=chunk_size)
+    buffer, position, found, exhausted = "", 0, False, False
+    while True:
+        if not found:
+            match = start.search(buffer)
+            if match is not None:
+                position = match.end()
+                found = True
+        if found:
+            # skip separators, then decode as many complete objects as available
             while True:
-                res = res.json()
-                token = res["token"]
-                remainder = res["time_to_result"]
-
-                if progress:
-                    if pbar is None:
-                        pbar = tqdm.tqdm(
-                            total=remainder,
-                            desc="Waiting",
-                            bar_format="{desc}: |{bar}| [{elapsed}<{remaining}]",
-                        )
-                    else:
-                        pbar.total = remainder + pbar.n
-                        pbar.update(0)
-
-                early = remainder - 3
-                while remainder > 0 and remainder > early:
-                    tosleep = min(remainder, 1)
-                    time.sleep(tosleep)
-                    remainder -= 1
-                    if progress:
-                        pbar.update(tosleep)
-
-                res = rq.get(
-                    f"{BASEURL}/{version}/result/{token}",
-                )
-                if res.status_code != 202:
-                    if progress:
-                        pbar.total = pbar.n
-                        pbar.update(0)
-                        pbar.close()
+                position = separators.match(buffer, position).end()
+                if buffer.startswith("]", position):
+                    return
+                try:
+                    # raw_decode without its per-call overhead
+                    item, position = scan(buffer, position)
+                except (StopIteration, json.JSONDecodeError):
                     break
-            if str(res.status_code).startswith("5"):
-                print(SORRY)
-                raise LeruliInternalError()
-            res = res.json()
-        else:
-            # Internal error?
-            if str(res.status_code).startswith("5"):
-                print(SORRY)
-                raise LeruliInternalError()
+                yield item
+            # the decoded objects are dropped once per chunk, not once per object
+            buffer, position = buffer[position:], 0
+        if exhausted:
+            raise ValueError(f"Incomplete response, array {key} not terminated.")
+        try:
+            buffer += text.decode(next(chunks))
+        except StopIteration:
+            buffer += text.decode(b"", final=True)
+            exhausted = True
 
-            # No content?
-            if res.status_code == 204:
-                return None
-            res = res.json()
-        return res
+
+def _base_stream(
+    endpoint: str,
+    payload: Dict,
+    version: str,
+    key: str,
+    urgent: bool = False,
+    progress: bool = False,
+    limit: int = None,
+):
+    """Like `_base_call`, but yields the entries of the result array `key` as they arrive.
+
+    Cached results are served from the cache. Streamed results bypass the
+    cache and are not shared between identical requests in flight.
+    """
+    resultcache = None
+    if endpoint in CACHEABLE_ENDPOINTS:
+        resultcache = get_cache()
+    if resultcache is not None:
+        found, result = resultcache.get(
+            cache.ResultCache.key(endpoint, payload, version)
+        )
+        if found:
+            if result is not None:
+                yield from itertools.islice(result[key], limit)
+            return
+    if limit is not None and limit <= 0:
+        return
+
+    try:
+        future = _request_future(endpoint, payload, version, urgent, stream=True)
+        res = _wait(future, progress)
+    except CircuitOpenError:
+        raise
     except:
         print(SORRY)
         raise LeruliInternalError()
+    if res is None:
+        return
+    if res.status_code != 200:
+        # rejected requests carry a short error document, formula_to_graphs returns it
+        try:
+            try:
+                message = _extract_error_message(res)
+            except NotImplementedError:
+                message = f"Request rejected with status {res.status_code}."
+        finally:
+            res.close()
+        raise ValueError(message)
+
+    count = 0
+    try:
+        items = _iter_json_array(res, key)
+        while True:
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            except Exception:
+                print(SORRY)
+                raise LeruliInternalError()
+            yield item
+            count += 1
+            if count == limit:
+                return
+    finally:
+        res.close()
 
 
 def get_api_secret():
@@ -134,6 +921,8 @@ def get_s3_client():
     s3_secret = os.getenv("LERULI_S3_SECRET")
     s3_server = os.getenv("LERULI_S3_SERVER")
 
+    from minio import Minio
+
     s3_client = Minio(
         s3_server.split("/")[-1],
         access_key=s3_access,
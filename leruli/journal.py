@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+
+from .cache import _Database, default_path
+
+# states of a job directory in the journal, in the order they are reached
+UPLOADING = "uploading"
+UPLOADED = "uploaded"
+SUBMITTING = "submitting"
+SUBMITTED = "submitted"
+
+
+def journal_path(*arguments):
+    """Journal file of a batch submission, identified by its arguments.
+
+    Running the same command in the same working directory again finds the
+    journal of an interrupted run.
+    """
+    canonical = json.dumps([os.getcwd(), *arguments], sort_keys=True, default=str)
+    run = hashlib.sha256(canonical.encode("utf8")).hexdigest()[:32]
+    return default_path(os.path.join("journals", f"{run}.sqlite"))
+
+
+class Journal(_Database):
+    """Crash-safe record of the job directories of a batch submission, stored in a SQLite database.
+
+    Every directory passes the states `UPLOADING` (storage location chosen,
+    written before it is created), `UPLOADED` (payload known, written as the
+    uploads come in), `SUBMITTING` (written before the API call) and
+    `SUBMITTED` (job id known, written before leruli.job).
+    Each change is committed before the step it announces, so after a crash
+    the journal tells which uploads are orphaned, which uploads can be
+    submitted as they are, and which jobs are queued. Rows carry the run that
+    uploaded or resumed them, so a directory listed twice in one run is noticed.
+
+    Parameters
+    ----------
+    path : str
+        Database file, created if missing.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.run = uuid.uuid4().hex
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (directory TEXT PRIMARY KEY, state TEXT, location TEXT, arguments TEXT, payload TEXT, jobid TEXT, run TEXT, since REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS owner (id INTEGER PRIMARY KEY CHECK (id = 0), host TEXT, pid INTEGER)"
+            )
+
+    def acquire(self):
+        """Takes over the journal for this process.
+
+        Raises
+        ------
+        ValueError
+            If a live process on this host is still running the submission.
+        """
+        host, pid = socket.gethostname(), os.getpid()
+        with self._lock, self._db:
+            # a write lock up front, two processes must not both take over
+            self._db.execute("BEGIN IMMEDIATE")
+            row = self._db.execute("SELECT host, pid FROM owner").fetchone()
+            if row is not None and row[0] == host and row[1] != pid:
+                try:
+                    os.kill(row[1], 0)
+                    alive = True
+                except ProcessLookupError:
+                    # the process of an interrupted run
+                    alive = False
+                except PermissionError:
+                    alive = True
+                if alive:
+                    raise ValueError(f"Submission already running in process {row[1]}")
+            self._db.execute(
+                "INSERT OR REPLACE INTO owner VALUES (0, ?, ?)", (host, pid)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def pending(self):
+        """Number of jobs not known to be queued."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state != ?", (SUBMITTED,)
+            ).fetchone()[0]
+
+    def get(self, directory: str):
+        """State of a job directory.
+
+        Returns
+        -------
+        dict
+            Keys: state, location, arguments, payload, jobid, run and since (time of
+            the last state change before the submission), or None for unknown directories.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state, location, arguments, payload, jobid, run, since FROM jobs WHERE directory = ?",
+                (os.path.abspath(directory),),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "state": row[0],
+            "location": row[1],
+            "arguments": json.loads(row[2]),
+            "payload": None if row[3] is None else json.loads(row[3]),
+            "jobid": row[4],
+            "run": row[5],
+            "since": row[6],
+        }
+
+    def uploading(self, jobs: list):
+        """Records the storage locations of jobs given as (directory, location, arguments) before they are created."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, NULL, NULL, ?, ?)",
+                [
+                    (os.path.abspath(d), UPLOADING, l, json.dumps(a), self.run, now)
+                    for d, l, a in jobs
+                ],
+            )
+
+    def claim(self, directories: list):
+        """Marks jobs of an earlier run as resumed by this one."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE jobs SET run = ? WHERE directory = ?",
+                [(self.run, os.path.abspath(_)) for _ in directories],
+            )
+
+    def uploaded(self, jobs: list):
+        """Records the payloads of uploaded jobs given as (directory, payload)."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE jobs SET state = ?, payload = ? WHERE directory = ?",
+                [
+                    (UPLOADED, json.dumps(self._public(p)), os.path.abspath(d))
+                    for d, p in jobs
+                ],
+            )
+
+    def submitting(self, directories: list):
+        """Marks uploaded jobs before they are submitted."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE jobs SET state = ?, since = ? WHERE directory = ?",
+                [(SUBMITTING, now, os.path.abspath(_)) for _ in directories],
+            )
+
+    def submitted(self, jobs: list):
+        """Records the job ids of accepted jobs given as (directory, jobid)."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE jobs SET state = ?, jobid = ? WHERE directory = ?",
+                [(SUBMITTED, j, os.path.abspath(d)) for d, j in jobs],
+            )
+
+    def rejected(self, directories: list):
+        """Marks jobs as certainly not submitted, e.g. rejected by the API, so they can be submitted again."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE jobs SET state = ? WHERE directory = ?",
+                [(UPLOADED, os.path.abspath(_)) for _ in directories],
+            )
+
+    def orphans(self):
+        """Directories and storage locations of interrupted or failed uploads."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT directory, location FROM jobs WHERE state = ?", (UPLOADING,)
+            ).fetchall()
+
+    def forget(self, directories: list):
+        """Removes job directories, e.g. once their orphaned uploads are deleted."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "DELETE FROM jobs WHERE directory = ?",
+                [(os.path.abspath(_),) for _ in directories],
+            )
+
+    def remove(self):
+        """Deletes the journal, once the submission is complete."""
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    @staticmethod
+    def _public(payload: dict):
+        # the API secret stays in the configuration
+        return {k: v for k, v in payload.items() if k not in ("secret", "directory")}
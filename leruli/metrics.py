@@ -0,0 +1,184 @@
+import bisect
+import collections
+import threading
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+EVENTS = ("on_request", "on_response", "on_poll", "on_error")
+_hooks = {event: [] for event in EVENTS}
+
+
+def add_hook(event: str, callback):
+    """Registers a callback for instrumentation events of the HTTP layer.
+
+    Callbacks are called with keyword arguments from the thread issuing the
+    request, so they should return quickly.
+
+    ``on_request``
+        `method`, `url`, `endpoint`, `attempt`; before every HTTP request.
+    ``on_response``
+        `method`, `url`, `endpoint`, `attempt`, `status`, `elapsed`; for every HTTP response.
+    ``on_poll``
+        `endpoint`, `token`, `status`, `polls`; for every poll of a delayed result.
+    ``on_error``
+        `method`, `url`, `endpoint`, `attempt`, `error`; for network errors.
+
+    Parameters
+    ----------
+    event : str
+        One of ``on_request``, ``on_response``, ``on_poll`` and ``on_error``.
+    callback : callable
+        Called with the keyword arguments of the event.
+    """
+    if event not in _hooks:
+        raise ValueError(f"Unknown event {event}, expected one of {', '.join(EVENTS)}.")
+    _hooks[event].append(callback)
+
+
+def remove_hook(event: str, callback):
+    """Unregisters a callback added with `add_hook`."""
+    _hooks[event].remove(callback)
+
+
+def emit(event: str, **kwargs):
+    for callback in _hooks[event]:
+        callback(**kwargs)
+
+
+class Histogram:
+    """Cumulative latency histogram in the layout used by Prometheus."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float):
+        """Estimated quantile, as upper bound of the bucket it falls into."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def as_dict(self):
+        cumulative, seen = {}, 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = seen
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": cumulative,
+        }
+
+
+class Metrics:
+    """Per-endpoint request counters and latency histograms.
+
+    Latencies are recorded separately for single HTTP requests (``http``), the
+    time until the first response of an API call (``first_response``), the
+    time a delayed call waited for its result after the first response
+    (``queue``), the `time_to_result` announced by the API and the complete
+    call (``call``). Metrics are kept per process.
+    """
+
+    HISTOGRAMS = ("http", "first_response", "queue", "time_to_result", "call")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = collections.defaultdict(collections.Counter)
+            self._histograms = collections.defaultdict(
+                lambda: {_: Histogram() for _ in self.HISTOGRAMS}
+            )
+
+    def increment(self, endpoint: str, name: str, value: int = 1):
+        with self._lock:
+            self._counters[endpoint][name] += value
+
+    def observe(self, endpoint: str, name: str, value: float):
+        with self._lock:
+            self._histograms[endpoint][name].observe(value)
+
+    def as_dict(self):
+        """All metrics, keyed by endpoint."""
+        with self._lock:
+            endpoints = set(self._counters) | set(self._histograms)
+            return {
+                endpoint: {
+                    "counters": dict(self._counters[endpoint]),
+                    "latency": {
+                        name: histogram.as_dict()
+                        for name, histogram in self._histograms[endpoint].items()
+                        if histogram.count > 0
+                    },
+                }
+                for endpoint in sorted(endpoints)
+            }
+
+    def to_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        snapshot = self.as_dict()
+        counters = sorted({_ for m in snapshot.values() for _ in m["counters"]})
+        for name in counters:
+            lines.append(f"# TYPE leruli_{name}_total counter")
+            for endpoint, values in snapshot.items():
+                if name in values["counters"]:
+                    lines.append(
+                        f'leruli_{name}_total{{endpoint="{endpoint}"}} {values["counters"][name]}'
+                    )
+        for name in self.HISTOGRAMS:
+            entries = [
+                (endpoint, values["latency"][name])
+                for endpoint, values in snapshot.items()
+                if name in values["latency"]
+            ]
+            if not entries:
+                continue
+            lines.append(f"# TYPE leruli_{name}_seconds histogram")
+            for endpoint, histogram in entries:
+                for bound, count in histogram["buckets"].items():
+                    lines.append(
+                        f'leruli_{name}_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'leruli_{name}_seconds_sum{{endpoint="{endpoint}"}} {histogram["sum"]}'
+                )
+                lines.append(
+                    f'leruli_{name}_seconds_count{{endpoint="{endpoint}"}} {histogram["count"]}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def as_dict():
+    """Metrics of this process as dictionary keyed by endpoint."""
+    return metrics.as_dict()
+
+
+def to_prometheus():
+    """Metrics of this process in the Prometheus text format."""
+    return metrics.to_prometheus()
+
+
+def reset():
+    metrics.reset()
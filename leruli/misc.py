@@ -49,6 +49,44 @@ def formula_to_graphs(
     return internal._base_call("formula-to-graphs", payload, version, urgent, progress)
 
 
+def iter_formula_to_graphs(
+    formula: str,
+    version: str = "latest",
+    urgent: bool = False,
+    progress: bool = False,
+    limit: int = None,
+):
+    """Iterates over the molecular graphs of a sum formula while they are being received.
+
+    Unlike `formula_to_graphs`, the response is parsed incrementally, so the
+    first molecules are available before the whole result has been transferred
+    and memory use does not grow with the number of molecules. The request is
+    sent on first iteration.
+
+    Parameters
+    ----------
+    formula : str
+        Any chemical sum formula.
+    version : str, optional
+        A specific API version in case you want to enforce backwards compatibility.
+    urgent : bool, optional
+        Enable to call with priority, might not allow parallel execution.
+    progress : bool, optional
+        Enable to show interactive progress bar while the result is computed.
+    limit : int, optional
+        Stop after this many molecules and close the connection.
+
+    Yields
+    ------
+    dict
+        One molecule with the keys `name` and `smiles`.
+    """
+    payload = {"formula": formula}
+    return internal._base_stream(
+        "formula-to-graphs", payload, version, "molecules", urgent, progress, limit
+    )
+
+
 def formula_to_cost(
     formula: str,
     basisset: str,
@@ -0,0 +1,143 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+# stages of a job submission, in pipeline order
+STAGES = ("scan", "bucket", "dedup", "pack", "upload", "submit", "finalize")
+_enabled = False
+_spans = []
+_lock = threading.Lock()
+
+
+def enable(enabled: bool = True):
+    """Starts recording timing spans in this process, discarding earlier ones."""
+    global _enabled
+    _enabled = enabled
+    take()
+
+
+def enabled():
+    return _enabled
+
+
+@contextlib.contextmanager
+def span(stage: str, job: str = None):
+    """Records the duration of a stage of a job if profiling is enabled."""
+    if not _enabled:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(stage, job, start, time.time())
+
+
+def record(stage: str, job: str, start: float, end: float):
+    if _enabled:
+        with _lock:
+            _spans.append((stage, job, start, end, os.getpid()))
+
+
+def take():
+    """Returns and clears the spans recorded in this process, to pass them on from workers."""
+    global _spans
+    with _lock:
+        spans, _spans = _spans, []
+    return spans
+
+
+def add(spans: list):
+    """Adds spans recorded in worker processes."""
+    with _lock:
+        _spans.extend(spans)
+
+
+def _union(intervals):
+    """Total length covered by a list of possibly overlapping intervals."""
+    covered, reach = 0.0, None
+    for start, end in sorted(intervals):
+        if reach is None or start > reach:
+            covered += end - start
+            reach = end
+        elif end > reach:
+            covered += end - reach
+            reach = end
+    return covered
+
+
+def summary(spans: list, wall: float = None):
+    """Statistics per stage.
+
+    Stages of different jobs overlap, so besides the summed `total`, `busy`
+    gives the wall time during which at least one job was in the stage and
+    `share` relates it to the overall wall time.
+
+    Returns
+    -------
+    list[dict]
+        One entry per stage with keys stage, count, total, mean, p95, busy and share.
+    """
+    if wall is None:
+        wall = max(_[3] for _ in spans) - min(_[2] for _ in spans) if spans else 0
+    stages = [_ for _ in STAGES if any(s[0] == _ for s in spans)]
+    stages += sorted({_[0] for _ in spans} - set(STAGES))
+    rows = []
+    for stage in stages:
+        durations = sorted(s[3] - s[2] for s in spans if s[0] == stage)
+        busy = _union([(s[2], s[3]) for s in spans if s[0] == stage])
+        rows.append(
+            {
+                "stage": stage,
+                "count": len(durations),
+                "total": sum(durations),
+                "mean": sum(durations) / len(durations),
+                "p95": durations[min(len(durations) - 1, int(0.95 * len(durations)))],
+                "busy": busy,
+                "share": busy / wall if wall > 0 else 0,
+            }
+        )
+    return rows
+
+
+def chrome_trace(spans: list):
+    """Spans in the Chrome trace event format, viewable in chrome://tracing or Perfetto.
+
+    Every job is shown as a separate track of the process which handled it.
+    """
+    lanes = {}
+    events = []
+    origin = min((_[2] for _ in spans), default=0)
+    for stage, job, start, end, pid in sorted(spans, key=lambda _: _[2]):
+        lane = lanes.setdefault((pid, job), len(lanes))
+        events.append(
+            {
+                "name": stage,
+                "cat": "submit",
+                "ph": "X",
+                "ts": (start - origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": lane,
+                "args": {"job": job},
+            }
+        )
+    for (pid, job), lane in lanes.items():
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": lane,
+                "args": {"name": job or "batch"},
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def dump(spans: list, path: str):
+    """Writes the spans as Chrome trace JSON file."""
+    with open(path, "w") as fh:
+        json.dump(chrome_trace(spans), fh)
@@ -0,0 +1,261 @@
+import math
+import os
+import time
+
+
+class RateLimiter:
+    """Token bucket shared by threads and multiprocessing workers.
+
+    The bucket lives in shared memory, so a limiter created before worker
+    processes are started (or passed to them as initializer argument)
+    coordinates the request rate of all of them.
+
+    When the server signals throttling, `throttle` halves the rate. It then
+    grows linearly by a tenth of `rate` per second, so it is back at `rate`
+    five seconds after a single halving unless throttled again. Without `rate`
+    there is no ceiling: requests pass freely until the server signals
+    throttling, which halves the rate observed just before. It grows by a tenth
+    of the observed rate per second, and once back at it after five seconds,
+    requests pass freely again.
+
+    Parameters
+    ----------
+    rate : float, optional
+        Maximum sustained requests per second, unlimited by default.
+    burst : float, optional
+        Maximum number of requests sent at once, by default the current rate.
+    min_rate : float, optional
+        Lower bound for the adaptive rate, by default 1% of `rate` or 1.
+    """
+
+    # indices into the shared state
+    _TOKENS, _UPDATED, _RATE, _THROTTLED, _OBSERVED, _RECOVERY = range(6)
+
+    def __init__(self, rate: float = None, burst: float = None, min_rate: float = None):
+        self.max_rate = rate or math.inf
+        self.burst = burst or (max(rate, 1) if rate else None)
+        self.min_rate = min_rate or (rate / 100 if rate else 1)
+
+        import multiprocessing as mp
+
+        recovery = rate / 10 if rate else 0
+        self._state = mp.RawArray(
+            "d", [self.burst or 0, time.time(), self.max_rate, 0, 0, recovery]
+        )
+        self._lock = mp.Lock()
+
+    @property
+    def rate(self):
+        """Current requests per second, lower than the maximum after throttling."""
+        return self._state[self._RATE]
+
+    def _take(self, tokens: float):
+        """Takes tokens if available, otherwise returns the time to wait for them."""
+        state = self._state
+        with self._lock:
+            now = time.time()
+            elapsed = max(now - state[self._UPDATED], 0)
+            state[self._UPDATED] = now
+            # requests per second over the last seconds
+            state[self._OBSERVED] *= math.exp(-elapsed)
+            state[self._RATE] = min(
+                state[self._RATE] + elapsed * state[self._RECOVERY], self.max_rate
+            )
+            if (
+                self.max_rate == math.inf
+                and state[self._RATE] >= 10 * state[self._RECOVERY]
+            ):
+                # back at the rate the server rejected, the ceiling is lifted
+                state[self._RATE] = math.inf
+            if state[self._RATE] == math.inf:
+                state[self._OBSERVED] += tokens
+                return 0
+            state[self._TOKENS] = min(
+                state[self._TOKENS] + elapsed * state[self._RATE],
+                self.burst or max(state[self._RATE], 1),
+            )
+            if state[self._TOKENS] >= tokens:
+                state[self._TOKENS] -= tokens
+                state[self._OBSERVED] += tokens
+                return 0
+            return (tokens - state[self._TOKENS]) / state[self._RATE]
+
+    def acquire(self, tokens: float = 1):
+        """Blocks until the request may be sent."""
+        while True:
+            wait = self._take(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1):
+        """Waits without blocking the event loop until the request may be sent."""
+        import asyncio
+
+        while True:
+            wait = self._take(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def throttle(self):
+        """Halves the rate after the server signalled throttling."""
+        state = self._state
+        with self._lock:
+            now = time.time()
+            # requests in flight report the same event, only react once
+            if now - state[self._THROTTLED] < 1:
+                return
+            rate = state[self._RATE]
+            if self.max_rate == math.inf:
+                # the rate the server just rejected, recovered from half in five seconds
+                rate = min(rate, max(state[self._OBSERVED], self.min_rate))
+                state[self._RECOVERY] = rate / 10
+            state[self._RATE] = max(rate / 2, self.min_rate)
+            state[self._TOKENS] = min(state[self._TOKENS], 0)
+            state[self._THROTTLED] = now
+
+
+# endpoint groups with a rate limiter each, LERULI_RATELIMIT_<GROUP> sets a fixed
+# maximum in requests per second, 0 disables the limiter. By default there is no
+# ceiling, the rate only drops when the server signals throttling.
+GROUPS = ("properties", "task", "s3")
+_limiters = None
+
+
+def get_limiters():
+    """All rate limiters, to be passed to worker processes."""
+    global _limiters
+    if _limiters is None:
+        _limiters = {}
+        for group in GROUPS:
+            rate = os.getenv(f"LERULI_RATELIMIT_{group.upper()}")
+            if rate is None:
+                _limiters[group] = RateLimiter()
+            elif float(rate) > 0:
+                _limiters[group] = RateLimiter(float(rate))
+            else:
+                _limiters[group] = None
+    return _limiters
+
+
+def set_limiters(limiters: dict):
+    """Installs rate limiters shared with the parent process."""
+    global _limiters
+    _limiters = limiters
+
+
+def get_limiter(group: str):
+    """Rate limiter for an endpoint group (properties, task, s3), None if unlimited."""
+    return get_limiters().get(group)
+
+
+class ConcurrencyLimiter:
+    """Adaptive limit of concurrent uploads shared by multiprocessing workers.
+
+    The limit follows additive increase, multiplicative decrease: every
+    successful upload raises it by ``1 / limit``, i.e. by one per round of
+    uploads, so fast links are filled. A failed upload halves it. An upload
+    taking more than `slowdown` times as long per byte as the fastest one
+    seen so far lowers it by a quarter, as queueing at the server or on the
+    link only adds latency. Decreases happen at most once per second, since
+    uploads in flight report the same congestion.
+
+    Parameters
+    ----------
+    initial : int
+        Concurrent uploads at the start.
+    maximum : int
+        Hard upper bound of the limit.
+    minimum : int, optional
+        Lower bound of the limit, by default 1.
+    slowdown : float, optional
+        Latency increase over the best observed one which counts as congestion.
+    """
+
+    # indices into the shared state
+    _ACTIVE, _LIMIT, _BEST, _DECREASED, _BYTES, _STARTED = range(6)
+    # uploads are compared per byte, small ones as if they had this size
+    MIN_SIZE = 2**20
+
+    def __init__(
+        self, initial: int, maximum: int, minimum: int = 1, slowdown: float = 4
+    ):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.slowdown = slowdown
+
+        import multiprocessing as mp
+
+        initial = min(max(initial, minimum), maximum)
+        self._state = mp.RawArray("d", [0, initial, 0, 0, 0, time.time()])
+        self._lock = mp.Lock()
+
+    @property
+    def limit(self):
+        """Current number of concurrent uploads allowed."""
+        return int(self._state[self._LIMIT])
+
+    @property
+    def active(self):
+        return int(self._state[self._ACTIVE])
+
+    @property
+    def throughput(self):
+        """Uploaded bytes per second since the limiter was created."""
+        return self._state[self._BYTES] / max(
+            time.time() - self._state[self._STARTED], 1e-9
+        )
+
+    def _try_acquire(self):
+        state = self._state
+        with self._lock:
+            if state[self._ACTIVE] < int(state[self._LIMIT]):
+                state[self._ACTIVE] += 1
+                return True
+            return False
+
+    async def acquire_async(self):
+        """Waits without blocking the event loop until an upload may start."""
+        import asyncio
+
+        while not self._try_acquire():
+            await asyncio.sleep(0.01)
+
+    def _decrease(self, factor: float, now: float):
+        state = self._state
+        if now - state[self._DECREASED] < 1:
+            return
+        state[self._LIMIT] = max(state[self._LIMIT] * factor, self.minimum)
+        state[self._DECREASED] = now
+
+    def release(self, seconds: float = None, size: int = 0, failed: bool = False):
+        """Ends an upload and adapts the limit to its outcome.
+
+        Parameters
+        ----------
+        seconds : float, optional
+            Duration of the upload.
+        size : int, optional
+            Uploaded bytes.
+        failed : bool, optional
+            Whether the upload failed, e.g. timed out.
+        """
+        state = self._state
+        with self._lock:
+            now = time.time()
+            state[self._ACTIVE] -= 1
+            if failed:
+                self._decrease(0.5, now)
+                return
+            state[self._BYTES] += size
+            latency = seconds / max(size, self.MIN_SIZE)
+            # the baseline slowly drifts up, e.g. when the server load changes
+            best = state[self._BEST] * 1.01 if state[self._BEST] > 0 else latency
+            state[self._BEST] = min(best, latency)
+            if latency > self.slowdown * state[self._BEST]:
+                self._decrease(0.75, now)
+            else:
+                state[self._LIMIT] = min(
+                    state[self._LIMIT] + 1 / state[self._LIMIT], self.maximum
+                )
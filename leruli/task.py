@@ -1,20 +1,93 @@
-import aiohttp
+from . import archive
+from . import blobs
 from . import internal
+from . import profiling
+from . import ratelimit
 import os
 import io
-import tarfile
 import gzip
-import docker
-import requests as rq
 import uuid
 from typing import List, Iterable
-import tqdm
-import tqdm.asyncio
-import asyncio
-import aiobotocore.session
-import multiprocessing as mp
 import time
 
+# aiohttp, aiobotocore, docker, tqdm and multiprocessing are imported where
+# needed, since loading them dominates the startup time of the CLI
+
+
+def _pace(group: str = "s3"):
+    limiter = ratelimit.get_limiter(group)
+    if limiter is not None:
+        limiter.acquire()
+
+
+async def _pace_async(group: str = "s3"):
+    limiter = ratelimit.get_limiter(group)
+    if limiter is not None:
+        await limiter.acquire_async()
+
+
+def _s3_throttled(error):
+    """Whether a failed S3 request was throttled, and the Retry-After header it came with."""
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return False, None
+    metadata = response.get("ResponseMetadata", {})
+    throttled = (
+        response.get("Error", {}).get("Code") in S3_THROTTLE_CODES
+        or metadata.get("HTTPStatusCode") in internal.THROTTLE_STATUS
+    )
+    return throttled, metadata.get("HTTPHeaders", {}).get("retry-after")
+
+
+def _key(prefix: str, name: str):
+    if prefix:
+        return f"{prefix}/{name}"
+    return name
+
+
+def _location(bucket: str, prefix: str):
+    """Storage location of a job as recorded in leruli.bucket."""
+    if prefix:
+        return f"{bucket}/{prefix}"
+    return bucket
+
+
+def _new_location(shared: str = None):
+    """Storage location of a new job, a bucket of its own or a key prefix of the shared bucket."""
+    if shared is None:
+        return str(uuid.uuid4())
+    return _location(shared, str(uuid.uuid4()))
+
+
+def _split_location(location: str):
+    """Bucket and key prefix of a job, the prefix is empty for jobs with their own bucket."""
+    bucket, _, prefix = location.strip("/").partition("/")
+    return bucket, prefix
+
+
+# attempts to upload the data of a job before it is reported as failed
+UPLOAD_ATTEMPTS = 3
+# S3 error codes asking clients to slow down
+S3_THROTTLE_CODES = (
+    "SlowDown",
+    "ServiceUnavailable",
+    "Throttling",
+    "RequestLimitExceeded",
+)
+# default upper bound of concurrent uploads of task_submit_many
+MAX_UPLOADS = int(os.getenv("LERULI_MAX_UPLOADS", 64))
+# jobs waiting between the stages of task_submit_many
+QUEUE_SIZE = 256
+# jobs per bulk submission, and seconds an uploaded job waits for its batch to fill
+BATCH_SIZE = 50
+BATCH_WAIT = 0.5
+# bulk submissions in flight
+SUBMIT_CONCURRENCY = 4
+# jobs recorded in the journal per transaction before they are handed out
+JOURNAL_CHUNK = 64
+# seconds after which an interrupted submission of unknown outcome is given up
+SUBMITTING_EXPIRY = 24 * 60 * 60
+
 
 async def _async_object_stage(
     s3_client,
@@ -25,43 +98,92 @@ async def _async_object_stage(
     cores: int,
     memorymb: int,
     timeseconds: int,
+    store=None,
+    dedup: bool = False,
+    resubmit: bool = False,
+    shared: str = None,
+    uploads: ratelimit.ConcurrencyLimiter = None,
+    location: str = None,
 ):
-    global counter
-    global rank
-
-    api_secret = internal.get_api_secret()
-    if api_secret is None:
-        counter[rank] += 2
-        return {"error": "No API token configured", "directory": directory}
-
-    if os.path.exists(f"{directory}/leruli.job"):
-        counter[rank] += 2
-        return {"error": "Directory already submitted.", "directory": directory}
-
-    # TODO: detect failed S3 interactions
-    bucket = str(uuid.uuid4())
-    await s3_client.create_bucket(Bucket=bucket)
-    counter[rank] += 1
-
-    # in-memory tar file
-    buffer = io.BytesIO()
-    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
-        tar.add(directory, arcname=os.path.basename("."))
-
-        runscript = io.BytesIO(("#!/bin/bash\n" + " ".join(command)).encode("ascii"))
-        tarinfo = tarfile.TarInfo(name="run.sh")
-        tarinfo.size = runscript.getbuffer().nbytes
-        tar.addfile(tarinfo=tarinfo, fileobj=runscript)
-    buffer.seek(0)
-
-    # upload
-    await s3_client.put_object(Bucket=bucket, Key="run.tgz", Body=buffer)
+    import asyncio
+
+    with profiling.span("scan", directory):
+        api_secret = internal.get_api_secret()
+        if api_secret is None:
+            return {"error": "No API token configured", "directory": directory}
+
+        if os.path.exists(f"{directory}/leruli.job") and not resubmit:
+            return {"error": "Directory already submitted.", "directory": directory}
+
+    # with a shared long-lived bucket, jobs differ in the key prefix
+    bucket, prefix = _split_location(location or _new_location(shared))
+    created = False
+
+    async def upload():
+        nonlocal created
+        if not created:
+            await _pace_async()
+            with profiling.span("bucket", directory):
+                if shared is None:
+                    await s3_client.create_bucket(Bucket=bucket)
+                else:
+                    await store.ensure_bucket(bucket)
+            created = True
+
+        exclude = None
+        if dedup or resubmit:
+            await _pace_async()
+            entries = await store.stage(directory, incremental=resubmit)
+            if entries:
+                await s3_client.put_object(
+                    Bucket=bucket,
+                    Key=_key(prefix, blobs.MANIFEST),
+                    Body=blobs.manifest(entries),
+                )
+                exclude = set(entries)
+
+        # stream the archive, packing overlaps with the upload
+        await _pace_async()
+        with profiling.span("upload", directory):
+            return await archive.upload_async(
+                s3_client,
+                bucket,
+                _key(prefix, archive.filename()),
+                directory,
+                command,
+                exclude=exclude,
+            )
+
+    retry_after = None
+    for attempt in range(UPLOAD_ATTEMPTS):
+        if attempt > 0:
+            # a throttled or briefly unavailable storage gets time to recover
+            await asyncio.sleep(internal._retry_delay(attempt - 1, retry_after))
+        if uploads is not None:
+            await uploads.acquire_async()
+        start = time.time()
+        try:
+            size = await upload()
+        except Exception as e:
+            error = e
+            if uploads is not None:
+                uploads.release(failed=True)
+            throttled, retry_after = _s3_throttled(e)
+            limiter = ratelimit.get_limiter("s3")
+            if throttled and limiter is not None:
+                limiter.throttle()
+            continue
+        if uploads is not None:
+            uploads.release(time.time() - start, size)
+        break
+    else:
+        return {"error": f"Upload failed: {error}", "directory": directory}
 
     # submit to API
     codeversion = f"{code}:{version}"
     payload = {
         "secret": api_secret,
-        "bucketid": bucket,
+        "bucketid": _location(bucket, prefix),
         "name": "default",
         "codeversion": codeversion,
         "cores": cores,
@@ -69,8 +191,6 @@ async def _async_object_stage(
         "timelimit": timeseconds,
         "directory": directory,
     }
-
-    counter[rank] += 1
     return payload
 
 
@@ -82,9 +202,21 @@ def task_submit_many(
     cores: Iterable[int],
     memorymb: Iterable[int],
     timeseconds: Iterable[int],
+    compression: str = None,
+    dedup: bool = False,
+    resubmit: bool = False,
+    bucket: str = None,
+    processes: int = None,
+    max_uploads: int = None,
+    journal: str = None,
 ) -> List[str]:
     """Submits many calculations to Leruli Queue/Cloud at once.
 
+    The jobs pass through a pipeline: worker processes pack and upload them,
+    while this process submits the uploaded ones in batches and writes their
+    leruli.job, so the first jobs queue while others are still uploaded. The
+    arguments are consumed lazily and memory use does not grow with their length.
+
     Parameters
     ----------
     directories : Iterable[str]
@@ -101,92 +233,379 @@ def task_submit_many(
         Memory to use in MB. Needs to be of same length as `directories`.
     timeseconds : Iterable[int]
         Time limit for jobs in seconds. Needs to be of same length as `directories`.
+    compression : str, optional
+        Codec and level of the job archives, e.g. ``gzip:9``, ``zstd:3`` or ``store``.
+        Defaults to ``gzip:6`` or the environment variable LERULI_COMPRESSION.
+    dedup : bool, optional
+        Whether to upload files of at least LERULI_DEDUP_SIZE bytes (default 1 MiB)
+        only once to a blob store shared by all jobs of the group.
+    resubmit : bool, optional
+        Whether to submit directories again which have been submitted before. Implies
+        `dedup`, and only files changed since the last submission are uploaded.
+    bucket : str, optional
+        Long-lived bucket to store all jobs in, each under its own key prefix, instead
+        of creating a bucket per job. It is created if needed.
+    processes : int, optional
+        Worker processes packing and uploading the jobs, by default one per core, at most 8.
+    max_uploads : int, optional
+        Upper bound of concurrent uploads of all workers, by default 64 or the environment
+        variable LERULI_MAX_UPLOADS. Within it, the number of concurrent uploads adapts
+        to the measured latency and errors.
+    journal : str, optional
+        SQLite file recording the progress of every directory. Calling again with the
+        same journal after an interruption resumes: queued jobs are skipped, uploaded
+        ones are submitted without uploading them again, and interrupted uploads are
+        deleted. Jobs whose submission was interrupted are reported, since they may be
+        queued, and given up after SUBMITTING_EXPIRY seconds. The journal is removed
+        once no job is left to resume.
 
     Returns
     -------
     dict[str]
         Keys: directories which could not be submitted, values: reasons for this to happen.
+
+    Raises
+    ------
+    Exception
+        Errors of the iterables or the journal while the jobs are handed out, once the
+        jobs handed out before are submitted.
     """
+    import asyncio
+    import itertools
+    import json
+    import multiprocessing as mp
+    import queue
+    import threading
+    import tqdm
+
+    cases = zip(directories, codes, versions, commands, cores, memorymb, timeseconds)
+    try:
+        total = len(directories)
+    except TypeError:
+        total = None
+
+    if compression is None:
+        compression = archive.COMPRESSION
+    archive.codec(compression)
+    # looked up once instead of in every worker
+    blob_bucket = None
+    if dedup or resubmit:
+        try:
+            blob_bucket = blobs.bucket()
+        except ValueError as e:
+            return {case[0]: str(e) for case in cases}
 
-    cases = list(
-        zip(directories, codes, versions, commands, cores, memorymb, timeseconds)
-    )
+    if journal is not None:
+        from .journal import Journal, SUBMITTED, SUBMITTING, UPLOADING
 
-    def split(a, n):
-        k, m = divmod(len(a), n)
-        return (a[i * k + min(i, m) : (i + 1) * k + min(i + 1, m)] for i in range(n))
-
-    # TODO find number of procs
-    nprocs = 5
-    segments = split(cases, nprocs)
-
-    # assign one id to every worker
-    idqueue = mp.Queue()
-    [idqueue.put(_) for _ in range(nprocs)]
-    progress_counter = mp.Array("i", nprocs, lock=False)
-
-    # Uploading
-    with tqdm.tqdm(total=len(cases), desc="Uploading job data") as pbar:
-        with mp.Pool(
-            nprocs,
-            initializer=_task_submit_many_initializer,
-            initargs=(idqueue, progress_counter),
-        ) as p:
-            result = p.map_async(_task_submit_many_toasync, segments)
-            while True:
-                total = sum([progress_counter[_] for _ in range(nprocs)])
-                pbar.n = int(total / 2)
-                pbar.refresh()
-                try:
-                    result.successful()
-                except:
-                    time.sleep(0.1)
-                    continue
-                result.wait()
-                break
+        journal = Journal(journal)
+        try:
+            journal.acquire()
+        except ValueError as e:
+            journal.close()
+            return {case[0]: str(e) for case in cases}
+        # uploads of an interrupted run which never got submitted
+        _task_submit_cleanup(journal)
+
+    # packing and hashing use the cores, the uploads of a worker are asynchronous
+    nprocs = processes or min(os.cpu_count() or 1, 8)
+    if total is not None:
+        nprocs = max(min(nprocs, total), 1)
+    settings = {
+        "workers": nprocs,
+        "limiters": ratelimit.get_limiters(),
+        "uploads": ratelimit.ConcurrencyLimiter(4 * nprocs, max_uploads or MAX_UPLOADS),
+        "profile": profiling.enabled(),
+        "compression": compression,
+        "threads": max(1, archive.THREADS // nprocs),
+        "blob_bucket": blob_bucket,
+        "resubmit": resubmit,
+        "shared": bucket,
+    }
 
-        # prepare for stage 2: submission to bulk API
-        failed = {}
-        cases = []
-        for case in sum(result.get(), []):
-            if "error" in case:
-                failed[case["directory"]] = case["error"]
+    # bounded queues between the stages keep the memory use flat
+    inbox = mp.Queue(QUEUE_SIZE)
+    outbox = mp.Queue(QUEUE_SIZE)
+    workers = [
+        mp.Process(
+            target=_task_submit_many_worker,
+            args=(inbox, outbox, settings),
+            daemon=True,
+        )
+        for _ in range(nprocs)
+    ]
+    failed = {}
+    # directories handed to the workers without a result yet
+    pending = set()
+    stop = threading.Event()
+    error = None
+
+    def put(target, item):
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def discard(case, state):
+        """Deletes the upload of a job never submitted, returns whether it is gone."""
+        _task_submit_cleanup(journal, [(case[0], state["location"])])
+        if journal.get(case[0]) is None:
+            return True
+        failed[case[0]] = (
+            f"Interrupted upload in {state['location']} could not be deleted. "
+            "Not submitted."
+        )
+        pbar.update(1)
+        return False
+
+    def resume(case):
+        """Handles a directory known to the journal, returns whether it still needs an upload."""
+        state = journal.get(case[0])
+        if state is None:
+            return True
+        if state["run"] == journal.run:
+            # its upload or submission is in progress and must not be touched
+            failed[case[0]] = "Directory listed more than once."
+            pbar.update(1)
+            return False
+        if state["state"] == SUBMITTED:
+            # the handles may be incomplete if the run was killed while writing them
+            _task_submit_finalize(case[0], state["jobid"], state["location"])
+            pbar.update(1)
+            return False
+        if state["state"] == SUBMITTING:
+            # the job may be queued, submitting it again could run it twice
+            message = (
+                f"Submission interrupted, the job may be queued with data in "
+                f"{state['location']}."
+            )
+            if time.time() - (state["since"] or 0) > SUBMITTING_EXPIRY:
+                # no longer blocks the removal of the journal
+                journal.forget([case[0]])
+                message += " Given up, the next run submits the directory again."
             else:
-                payload = case.copy()
-                del payload["directory"]
-                cases.append((payload, case["directory"]))
+                message += " Not submitted again."
+            failed[case[0]] = message
+            pbar.update(1)
+            return False
+        if state["state"] == UPLOADING:
+            # never finished, started afresh
+            return discard(case, state)
+        if state["arguments"] == json.loads(json.dumps(case[1:])):
+            journal.claim([case[0]])
+            payload = dict(state["payload"], directory=case[0])
+            payload["secret"] = internal.get_api_secret()
+            pending.add(case[0])
+            if not put(outbox, ("job", payload)):
+                pending.discard(case[0])
+                failed[case[0]] = "Not submitted after a worker failure"
+            return False
+        # uploaded with other arguments, e.g. a different command in the archive
+        return discard(case, state)
+
+    def feed():
+        nonlocal error
+        try:
+            while True:
+                chunk = list(itertools.islice(cases, JOURNAL_CHUNK))
+                if not chunk:
+                    break
+                if journal is not None:
+                    chunk = [_ for _ in chunk if resume(_)]
+                    # later entries of a directory listed twice in the chunk
+                    unique = {}
+                    for case in chunk:
+                        if os.path.abspath(case[0]) in unique:
+                            failed[case[0]] = "Directory listed more than once."
+                            pbar.update(1)
+                        else:
+                            unique[os.path.abspath(case[0])] = case
+                    chunk = list(unique.values())
+                # checked by the workers as well, but spares them the round trip
+                if not resubmit:
+                    done = [_ for _ in chunk if os.path.exists(f"{_[0]}/leruli.job")]
+                    for case in done:
+                        failed[case[0]] = "Directory already submitted."
+                    pbar.update(len(done))
+                    chunk = [_ for _ in chunk if _ not in done]
+                chunk = [(_, _new_location(bucket)) for _ in chunk]
+                # recorded before any of the locations is created
+                if journal is not None:
+                    journal.uploading([(c[0], l, c[1:]) for c, l in chunk])
+                for case, location in chunk:
+                    pending.add(case[0])
+                    if not put(inbox, (case, location)):
+                        pending.discard(case[0])
+                        failed[case[0]] = "Not submitted after a worker failure"
+        except Exception as e:
+            # e.g. from the iterables, reported once the jobs handed out are done
+            error = e
+        finally:
+            # without them the workers wait forever
+            for _ in workers:
+                put(inbox, None)
 
-    results = asyncio.run(_task_submit_many_API_toasync(cases))
-    for result in results:
-        failed.update(results)
-    return failed
+    async def collect(pbar):
+        import aiohttp
 
+        loop = asyncio.get_running_loop()
+        submissions = set()
+        slots = asyncio.Semaphore(SUBMIT_CONCURRENCY)
+        # uploaded jobs waiting for their batch, and those not in the journal yet
+        batch, recorded, deadline, finished = [], 0, None, 0
+
+        async def submit(segment):
+            async with slots:
+                try:
+                    result = await _task_submit_many_API(session, segment, journal)
+                except Exception as e:
+                    result = {_[1]: f"Submission failed: {e}" for _ in segment}
+                    # never reached the API, safe to submit again
+                    if journal is not None and isinstance(
+                        e, aiohttp.ClientConnectorError
+                    ):
+                        journal.rejected(list(result))
+            failed.update(result)
+            pbar.update(len(segment))
+
+        async def record():
+            nonlocal recorded
+            if journal is not None and recorded < len(batch):
+                jobs = [(d, p) for p, d in batch[recorded:]]
+                await loop.run_in_executor(None, journal.uploaded, jobs)
+            recorded = len(batch)
+
+        async def flush():
+            nonlocal batch, recorded, deadline
+            await record()
+            segment, batch = batch[:BATCH_SIZE], batch[BATCH_SIZE:]
+            recorded -= len(segment)
+            if journal is not None:
+                await loop.run_in_executor(
+                    None, journal.submitting, [_[1] for _ in segment]
+                )
+            task = asyncio.ensure_future(submit(segment))
+            submissions.add(task)
+            task.add_done_callback(submissions.discard)
+            # the rest is overdue already
+            if not batch:
+                deadline = None
+
+        def due():
+            return batch and (len(batch) >= BATCH_SIZE or time.time() >= deadline)
+
+        async with aiohttp.ClientSession() as session:
+            while finished + sum(_.exitcode not in (None, 0) for _ in workers) < nprocs:
+                if len(batch) >= QUEUE_SIZE:
+                    # backpressure on the workers when the API is slower than the uploads
+                    await asyncio.wait(submissions, return_when=asyncio.FIRST_COMPLETED)
+                    kind = None
+                else:
+                    # shortly if a batch waits for a free submission slot
+                    timeout = 0.01 if due() else BATCH_WAIT
+                    try:
+                        kind, value = await loop.run_in_executor(
+                            None, outbox.get, True, timeout
+                        )
+                    except queue.Empty:
+                        kind, value = None, None
+                if kind == "done":
+                    finished += 1
+                    profiling.add(value)
+                elif kind == "job":
+                    pending.discard(value["directory"])
+                    if "error" in value:
+                        failed[value["directory"]] = value["error"]
+                        pbar.update(1)
+                    else:
+                        payload = value.copy()
+                        directory = payload.pop("directory")
+                        if not batch:
+                            deadline = time.time() + BATCH_WAIT
+                        batch.append((payload, directory))
+                # committed in chunks, or once no more jobs are coming in
+                if kind is None or len(batch) - recorded >= JOURNAL_CHUNK:
+                    await record()
+                while due() and len(submissions) < 2 * SUBMIT_CONCURRENCY:
+                    await flush()
+            while batch:
+                while len(submissions) >= 2 * SUBMIT_CONCURRENCY:
+                    await asyncio.wait(submissions, return_when=asyncio.FIRST_COMPLETED)
+                await flush()
+            await asyncio.gather(*submissions)
+
+    with tqdm.tqdm(total=total, desc="Submitting jobs") as pbar:
+        for worker in workers:
+            worker.start()
+        feeder = threading.Thread(target=feed, name="leruli-feed", daemon=True)
+        feeder.start()
+        try:
+            asyncio.run(collect(pbar))
+        finally:
+            stop.set()
+            feeder.join()
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+
+    # lost with a worker which died, e.g. out of memory
+    for directory in pending:
+        failed[directory] = "Worker process failed"
+
+    if journal is not None:
+        # failed uploads, they are started afresh in the next run
+        _task_submit_cleanup(journal)
+        if not journal.pending():
+            journal.remove()
+        else:
+            journal.close()
+    if error is not None:
+        raise error
+    return failed
 
-async def _task_submit_many_API_toasync(cases):
-    # build parallel task list
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        while len(cases) > 0:
-            segment, cases = cases[:50], cases[50:]
-            tasks.append(_task_submit_many_API(session, segment))
 
-        # defer for async execution
-        result = await tqdm.asyncio.tqdm.gather(*tasks, desc="Submitting job batches")
+def _task_submit_cleanup(journal, jobs: list = None):
+    """Deletes the uploads of jobs which were never submitted, by default all orphans in the journal."""
+    import concurrent.futures
+    from minio.error import S3Error
 
-    return result
+    if jobs is None:
+        jobs = journal.orphans()
+    if not jobs:
+        return
+    s3_client = internal.get_s3_client()
+    if s3_client is None:
+        return
 
+    def remove(job):
+        try:
+            _task_remove(s3_client, job[1])
+        except S3Error as e:
+            # never created
+            if e.code != "NoSuchBucket":
+                raise
+        return job[0]
 
-def _task_submit_many_toasync(cases):
-    return asyncio.run(_task_submit_many_worker(cases))
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        journal.forget(list(pool.map(remove, jobs)))
 
 
-async def _task_submit_many_API(session, segment):
+async def _task_submit_many_API(session, segment, journal=None):
     failed = {}
+    accepted = []
+    await _pace_async("task")
+    start = time.time()
     async with session.post(
         f"{internal.BASEURL}/v22_1/bulk/task-submit", json=[_[0] for _ in segment]
     ) as res:
         results = await res.json()
+        end = time.time()
         for case, result in zip(segment, results):
+            profiling.record("submit", case[1], start, end)
             payload, directory = case
 
             if result["status"] != 200:
@@ -200,34 +619,83 @@ async def _task_submit_many_API(session, segment):
                 failed[directory] = reason
                 continue
 
-            jobid = result["data"]
-            _task_submit_finalize(directory, jobid, payload["bucketid"])
+            accepted.append((directory, result["data"], payload["bucketid"]))
+
+    # recorded before leruli.job, the job must not be submitted twice
+    if journal is not None:
+        journal.submitted([(d, j) for d, j, _ in accepted])
+        journal.rejected(list(failed))
+    for directory, jobid, bucket in accepted:
+        _task_submit_finalize(directory, jobid, bucket)
     return failed
 
 
-async def _task_submit_many_worker(cases):
+def _task_submit_many_worker(inbox, outbox, settings):
+    """Packs and uploads the jobs from `inbox` and puts their payloads into `outbox`."""
+    import asyncio
+
+    ratelimit.set_limiters(settings["limiters"])
+    # the worker processes share the cores for compression
+    archive.configure(settings["compression"], settings["threads"])
+    blobs.configure(settings["blob_bucket"])
+    # also drops spans inherited from the parent process
+    profiling.enable(settings["profile"])
+
+    asyncio.run(_task_submit_many_consume(inbox, outbox, settings))
+    outbox.put(("done", profiling.take()))
+
+    # TODO print missing API key only once, abort immediately
+
+
+async def _task_submit_many_consume(inbox, outbox, settings):
+    import asyncio
+    import concurrent.futures
+    import aiobotocore.session
+
+    loop = asyncio.get_running_loop()
+    uploads = settings["uploads"]
+    # blocking queue operations must not take the threads packing the archives
+    queues = concurrent.futures.ThreadPoolExecutor(2, thread_name_prefix="leruli-queue")
+    running = set()
+
     session = aiobotocore.session.get_session()
-    tasks = []
     async with session.create_client(
         "s3",
         endpoint_url=os.getenv("LERULI_S3_SERVER"),
         aws_secret_access_key=os.getenv("LERULI_S3_SECRET"),
         aws_access_key_id=os.getenv("LERULI_S3_ACCESS"),
     ) as s3_client:
-        for args in cases:
-            tasks.append(_async_object_stage(s3_client, *args))
-        cases = await asyncio.gather(*tasks)
-
-    return cases
-
-
-def _task_submit_many_initializer(idqueue, progress):
-    global rank
-    global counter
-    rank = idqueue.get()
-    counter = progress
-
-    # TODO print missing API key only once, abort immediately
+        store = blobs.AsyncStore(s3_client)
+
+        async def process(case, location):
+            try:
+                result = await _async_object_stage(
+                    s3_client,
+                    *case,
+                    store=store,
+                    dedup=settings["blob_bucket"] is not None,
+                    resubmit=settings["resubmit"],
+                    shared=settings["shared"],
+                    uploads=uploads,
+                    location=location,
+                )
+            except Exception as e:
+                result = {"error": f"Failed: {e}", "directory": case[0]}
+            await loop.run_in_executor(queues, outbox.put, ("job", result))
+
+        while True:
+            # take jobs only as fast as they are uploaded, others go to other workers
+            while len(running) >= max(2, 2 * uploads.limit // settings["workers"]):
+                await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            item = await loop.run_in_executor(queues, inbox.get)
+            if item is None:
+                break
+            task = asyncio.ensure_future(process(*item))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        if running:
+            await asyncio.wait(running)
+    queues.shutdown()
 
 
 def task_submit(
@@ -238,23 +706,53 @@ def task_submit(
     cores: int = 1,
     memorymb: int = 4000,
     timeseconds: int = 24 * 60 * 60,
+    compression: str = None,
+    dedup: bool = False,
+    resubmit: bool = False,
+    bucket: str = None,
 ):
-    """Submits a given directory content as job to Leruli Queue/Cloud."""
+    """Submits a given directory content as job to Leruli Queue/Cloud.
+
+    The job archive is compressed with `compression`, e.g. ``gzip:9``, ``zstd:3``
+    or ``store``, by default ``gzip:6`` or the environment variable LERULI_COMPRESSION.
+    With `dedup`, files of at least LERULI_DEDUP_SIZE bytes are uploaded only once
+    to a blob store shared by all jobs of the group. With `resubmit`, a directory
+    submitted before is submitted again as new job, uploading only the files
+    changed since, which implies `dedup`. With `bucket`, the job is stored under
+    a key prefix of this long-lived bucket instead of a bucket of its own.
+    """
     try:
         payload = _task_submit_payload(
-            directory, code, version, command, cores, memorymb, timeseconds
+            directory,
+            code,
+            version,
+            command,
+            cores,
+            memorymb,
+            timeseconds,
+            compression,
+            dedup,
+            resubmit,
+            bucket,
         )
     except ValueError as e:
         print(f"Failed: {str(e)}")
         return
 
-    res = rq.post(f"{internal.BASEURL}/v22_1/task-submit", json=payload)
+    if payload is None:
+        return
+
+    # not idempotent, a retry could submit the job twice
+    with profiling.span("submit", directory):
+        res = internal.client.post(
+            f"{internal.BASEURL}/v22_1/task-submit", json=payload, retries=0
+        )
     if res.status_code != 200:
         print("Cannot submit jobs. Please check the input.")
         return
     jobid = res.json()
 
-    _task_submit_finalize(directory, jobid, payload["bucketid"])
+    return _task_submit_finalize(directory, jobid, payload["bucketid"])
 
 
 def _task_submit_payload(
@@ -265,39 +763,65 @@ def _task_submit_payload(
     cores: int,
     memorymb: int,
     timeseconds: int,
+    compression: str = None,
+    dedup: bool = False,
+    resubmit: bool = False,
+    shared: str = None,
 ):
-    api_secret = internal.get_api_secret()
-    if api_secret is None:
-        return
-    s3_client = internal.get_s3_client()
-    if s3_client is None:
-        return
-
-    if os.path.exists(f"{directory}/leruli.job"):
-        raise ValueError("Directory already submitted.")
-
-    bucket = str(uuid.uuid4())
-    s3_client.make_bucket(bucket)
-
-    # in-memory tar file
-    buffer = io.BytesIO()
-    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
-        tar.add(directory, arcname=os.path.basename("."))
-
-        runscript = io.BytesIO(("#!/bin/bash\n" + " ".join(command)).encode("ascii"))
-        tarinfo = tarfile.TarInfo(name="run.sh")
-        tarinfo.size = runscript.getbuffer().nbytes
-        tar.addfile(tarinfo=tarinfo, fileobj=runscript)
-    buffer.seek(0)
-
-    # upload
-    s3_client.put_object(bucket, "run.tgz", buffer, buffer.getbuffer().nbytes)
+    archive.codec(compression)
+    with profiling.span("scan", directory):
+        api_secret = internal.get_api_secret()
+        if api_secret is None:
+            return
+        s3_client = internal.get_s3_client()
+        if s3_client is None:
+            return
+
+        if os.path.exists(f"{directory}/leruli.job") and not resubmit:
+            raise ValueError("Directory already submitted.")
+
+    bucket, prefix = _split_location(_new_location(shared))
+    if shared is None:
+        _pace()
+        with profiling.span("bucket", directory):
+            s3_client.make_bucket(bucket)
+    else:
+        # one long-lived bucket, jobs differ in the key prefix
+        with profiling.span("bucket", directory):
+            blobs.ensure_bucket(s3_client, bucket)
+
+    exclude = None
+    if dedup or resubmit:
+        _pace()
+        entries = blobs.stage(s3_client, directory, incremental=resubmit)
+        if entries:
+            document = blobs.manifest(entries)
+            s3_client.put_object(
+                bucket,
+                _key(prefix, blobs.MANIFEST),
+                io.BytesIO(document),
+                len(document),
+            )
+            exclude = set(entries)
+
+    # stream the archive, packing overlaps with the upload
+    _pace()
+    with profiling.span("upload", directory):
+        archive.upload(
+            s3_client,
+            bucket,
+            _key(prefix, archive.filename(compression)),
+            directory,
+            command,
+            compression,
+            exclude,
+        )
 
     # submit to API
     codeversion = f"{code}:{version}"
     payload = {
         "secret": api_secret,
-        "bucketid": bucket,
+        "bucketid": _location(bucket, prefix),
         "name": "default",
         "codeversion": codeversion,
         "cores": cores,
@@ -309,13 +833,34 @@ def _task_submit_payload(
 
 def _task_submit_finalize(directory, jobid, bucket):
     # local handle
-    with open(f"{directory}/leruli.job", "w") as fh:
-        fh.write(f"{jobid}\n")
-    with open(f"{directory}/leruli.bucket", "w") as fh:
-        fh.write(f"{bucket}\n")
+    with profiling.span("finalize", directory):
+        # a resubmitted directory keeps the storage of its earlier jobs for task-prune
+        previous = _task_previous_locations(directory)
+        try:
+            with open(f"{directory}/leruli.bucket") as fh:
+                current = fh.read().strip()
+        except FileNotFoundError:
+            current = None
+        if current and current != bucket and current not in previous:
+            with open(f"{directory}/leruli.bucket.previous", "a") as fh:
+                fh.write(f"{current}\n")
+        # leruli.job last, it marks the directory as submitted
+        with open(f"{directory}/leruli.bucket", "w") as fh:
+            fh.write(f"{bucket}\n")
+        with open(f"{directory}/leruli.job", "w") as fh:
+            fh.write(f"{jobid}\n")
     return jobid
 
 
+def _task_previous_locations(directory: str):
+    """Storage locations of the earlier jobs of a resubmitted directory, oldest first."""
+    try:
+        with open(f"{directory}/leruli.bucket.previous") as fh:
+            return fh.read().split()
+    except FileNotFoundError:
+        return []
+
+
 def task_status(jobid: str):
     """Queries the status of a job at Leruli Queue/Cloud."""
     api_secret = internal.get_api_secret()
@@ -326,7 +871,7 @@ def task_status(jobid: str):
         "secret": api_secret,
         "jobid": jobid,
     }
-    res = rq.post(f"{internal.BASEURL}/v22_1/task-status", json=payload)
+    res = internal.client.post(f"{internal.BASEURL}/v22_1/task-status", json=payload)
     if res.status_code == 200:
         return res.json()
     if res.status_code == 404:
@@ -334,15 +879,22 @@ def task_status(jobid: str):
 
 
 def task_get(directory: str, bucket: str):
-    """Downloads the input and output files of a Leruli Queue/Cloud task into a directory."""
+    """Downloads the input and output files of a Leruli Queue/Cloud task into a directory.
+
+    `bucket` is the location recorded in leruli.bucket, either a bucket or a
+    bucket and key prefix as ``bucket/prefix``.
+    """
     s3_client = internal.get_s3_client()
-    for obj in s3_client.list_objects(bucket, recursive=True):
-        object = obj.object_name
+    bucket, prefix = _split_location(bucket)
+    start = len(prefix) + 1 if prefix else 0
+    for obj in s3_client.list_objects(bucket, prefix=_key(prefix, ""), recursive=True):
+        object = obj.object_name[start:]
         dirname = os.path.dirname(object)
         if dirname != "":
-            os.makedirs(dirname, exist_ok=True)
+            os.makedirs(f"{directory}/{dirname}", exist_ok=True)
         try:
-            response = s3_client.get_object(bucket, object)
+            _pace()
+            response = s3_client.get_object(bucket, obj.object_name)
             content = response.read()
         finally:
             response.close()
@@ -350,6 +902,10 @@ def task_get(directory: str, bucket: str):
         with open(f"{directory}/{object}", "wb") as fh:
             fh.write(content)
 
+    # files stored once for many jobs
+    if os.path.exists(f"{directory}/{blobs.MANIFEST}"):
+        blobs.restore(s3_client, directory)
+
 
 def task_cancel(jobid: str):
     """Cancels a task on Leruli Queue/Cloud."""
@@ -361,7 +917,7 @@ def task_cancel(jobid: str):
         "secret": api_secret,
         "jobid": jobid,
     }
-    status = rq.post(f"{internal.BASEURL}/v22_1/task-cancel", json=payload)
+    status = internal.client.post(f"{internal.BASEURL}/v22_1/task-cancel", json=payload)
     return status.json()
 
 
@@ -373,6 +929,8 @@ def task_publish_code(code: str, version: str):
     s3_client = internal.get_s3_client()
     group = internal.get_group_token()
 
+    import docker
+
     client = docker.from_env()
     image = client.images.get(f"{code}:{version}")
     cache = io.BytesIO()
@@ -415,8 +973,24 @@ def task_list_codes():
 
 
 def task_prune(bucket: str):
-    """Irreversibly deletes the Leruli Queue/Cloud store of input and output files."""
-    s3_client = internal.get_s3_client()
-    for obj in s3_client.list_objects(bucket, recursive=True):
-        s3_client.remove_object(bucket, obj.object_name)
-    s3_client.remove_bucket(bucket)
+    """Irreversibly deletes the Leruli Queue/Cloud store of input and output files.
+
+    `bucket` is the location recorded in leruli.bucket. Jobs stored under a key
+    prefix of a shared bucket only lose their objects, the bucket is kept.
+    """
+    _task_remove(internal.get_s3_client(), bucket)
+
+
+def _task_remove(s3_client, location: str):
+    from minio.deleteobjects import DeleteObject
+
+    bucket, prefix = _split_location(location)
+    objects = s3_client.list_objects(bucket, prefix=_key(prefix, ""), recursive=True)
+    _pace()
+    # one request per 1000 objects
+    for error in s3_client.remove_objects(
+        bucket, (DeleteObject(_.object_name) for _ in objects)
+    ):
+        raise ValueError(f"Cannot delete {error.name}: {error.message}")
+    if not prefix:
+        s3_client.remove_bucket(bucket)
@@ -16,12 +16,11 @@ test_requirements = [
 setup(
     author="leruli.com",
     author_email="info@leruli.com",
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Natural Language :: English",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
     ],
@@ -32,6 +31,7 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require={"zstd": ["zstandard"]},
     long_description=readme,
     include_package_data=True,
     keywords="leruli",
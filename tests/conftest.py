@@ -0,0 +1,104 @@
+"""Shared fixtures replacing the HTTP layer of `leruli.internal`."""
+
+import contextlib
+import json
+
+import pytest
+
+from leruli import internal, ratelimit
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self._data
+
+    def iter_content(self, chunk_size=1):
+        body = json.dumps(self._data).encode("utf8")
+        for start in range(0, len(body), chunk_size):
+            yield body[start : start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    """Serves canned responses in order and records the requested URLs."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.urls = []
+
+    def _next(self, url, **kwargs):
+        self.urls.append(url)
+        return self.responses.pop(0)
+
+    post = _next
+    get = _next
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiters(monkeypatch):
+    # a test throttled by 429 or 503 responses does not slow down the next ones
+    monkeypatch.setattr(ratelimit, "_limiters", None)
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    def install(*responses):
+        client = FakeClient(responses)
+        monkeypatch.setattr(internal, "client", client)
+        return client
+
+    return install
+
+
+@pytest.fixture
+def api_server(monkeypatch):
+    """Serves aiohttp routes as the API, use as ``async with api_server(*routes) as url``."""
+    from aiohttp import web
+
+    @contextlib.asynccontextmanager
+    async def serve(*routes):
+        app = web.Application()
+        app.add_routes(routes)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        monkeypatch.setattr(internal, "BASEURL", url)
+        try:
+            yield url
+        finally:
+            await runner.cleanup()
+
+    return serve
+
+
+class PropertyClient:
+    """Answers logP and bp requests, fails for the graph "X"."""
+
+    def __init__(self):
+        self.calls = []
+
+    def post(self, url, json=None, **kwargs):
+        self.calls.append((url, json["graph"]))
+        if json["graph"] == "X":
+            return FakeResponse(500)
+        if url.endswith("canonical-graph"):
+            return FakeResponse(200, {"graph": "".join(sorted(json["graph"]))})
+        if url.endswith("graph-to-logP"):
+            return FakeResponse(200, {"logp": len(json["graph"])})
+        return FakeResponse(200, {"bp": -len(json["graph"])})
+
+
+@pytest.fixture
+def property_client(monkeypatch):
+    client = PropertyClient()
+    monkeypatch.setattr(internal, "client", client)
+    return client
@@ -0,0 +1,155 @@
+"""Tests for `leruli.aio`."""
+
+import asyncio
+import time
+
+from aiohttp import web
+
+from leruli import aio, cache, internal
+
+
+def test_async_client_waits_for_delayed_result(api_server):
+    polls = []
+
+    async def logp(request):
+        assert await request.json() == {"graph": "CCO"}
+        return web.json_response({"token": "abc", "time_to_result": 0}, status=202)
+
+    async def result(request):
+        polls.append(request.match_info["token"])
+        if len(polls) < 2:
+            return web.json_response({"token": "abc", "time_to_result": 0}, status=202)
+        return web.json_response({"logp": -0.3})
+
+    async def run():
+        async with api_server(
+            web.post("/latest/graph-to-logP", logp),
+            web.get("/latest/result/{token}", result),
+        ):
+            async with aio.AsyncLeruli(concurrency=2) as client:
+                return await asyncio.gather(
+                    client.graph_to_logP("CCO"), client.graph_to_logP("CCO")
+                )
+
+    assert asyncio.run(run()) == [{"logp": -0.3}, {"logp": -0.3}]
+    assert polls[:2] == ["abc", "abc"]
+
+
+def test_async_client_backs_off_overdue_results(api_server):
+    polls = []
+
+    async def logp(request):
+        return web.json_response({"token": "abc", "time_to_result": 0}, status=202)
+
+    async def result(request):
+        polls.append(time.monotonic())
+        if len(polls) < 4:
+            return web.json_response({"token": "abc", "time_to_result": 0}, status=202)
+        return web.json_response({"logp": -0.3})
+
+    async def run():
+        async with api_server(
+            web.post("/latest/graph-to-logP", logp),
+            web.get("/latest/result/{token}", result),
+        ):
+            async with aio.AsyncLeruli() as client:
+                return await client.graph_to_logP("CCO")
+
+    assert asyncio.run(run()) == {"logp": -0.3}
+    intervals = [b - a for a, b in zip(polls, polls[1:])]
+    assert intervals[0] >= 0.2 and intervals[1] >= 0.4
+
+
+def test_cancelled_trial_frees_circuit(api_server, monkeypatch):
+    monkeypatch.setattr(internal, "_breakers", {})
+    breaker = internal.circuit_breaker("graph-to-logP")
+    breaker.cooldown = breaker._current_cooldown = 0.05
+    for _ in range(breaker.threshold):
+        breaker.failure()
+
+    async def logp(request):
+        await asyncio.sleep(1)
+        return web.json_response({"logp": -0.3})
+
+    async def run():
+        async with api_server(web.post("/latest/graph-to-logP", logp)) as url:
+            async with aio.AsyncLeruli() as client:
+                await asyncio.sleep(0.05)
+                request = client._request(
+                    "POST", f"{url}/latest/graph-to-logP", json={}
+                )
+                try:
+                    await asyncio.wait_for(request, 0.1)
+                except asyncio.TimeoutError:
+                    pass
+
+    asyncio.run(run())
+    # a cancel is no failure, the next trial may follow right away
+    assert breaker._current_cooldown == 0.05
+    assert breaker.allow()
+
+
+def test_async_graph_to_properties(api_server, monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        internal, "_canonical_map", cache.CanonicalMap(str(tmp_path / "map.sqlite"))
+    )
+    calls = []
+
+    async def logp(request):
+        graph = (await request.json())["graph"]
+        calls.append(graph)
+        if graph == "X":
+            return web.Response(status=501)
+        return web.json_response({"logp": len(graph)})
+
+    async def canonical(request):
+        graph = (await request.json())["graph"]
+        if graph == "X":
+            return web.Response(status=501)
+        return web.json_response({"graph": "".join(sorted(graph))})
+
+    async def graphs():
+        for _ in ["OCC", "CCO", "X"]:
+            yield _
+
+    async def run():
+        async with api_server(
+            web.post("/latest/graph-to-logP", logp),
+            web.post("/latest/canonical-graph", canonical),
+        ):
+            async with aio.AsyncLeruli() as client:
+                chunks = [
+                    _
+                    async for _ in client.iter_graph_to_properties(
+                        graphs(), ["logP"], chunksize=2
+                    )
+                ]
+                deduplicated = await client.graph_to_properties(
+                    ["OCC", "CCO", "X"], ["logP"], deduplicate=True
+                )
+                return chunks, deduplicated
+
+    chunks, deduplicated = asyncio.run(run())
+    assert chunks == [
+        {"graph": ["OCC", "CCO"], "logP": [3, 3], "error": [False, False]},
+        {"graph": ["X"], "logP": [None], "error": [True]},
+    ]
+    assert deduplicated == {
+        "graph": ["OCC", "CCO", "X"],
+        "logP": [3, 3, None],
+        "error": [False, False, True],
+    }
+    # deduplicated, only the canonical graph CCO is queried
+    assert sorted(calls) == ["CCO", "CCO", "OCC", "X"]
+
+
+def test_async_client_returns_error_documents(api_server):
+    async def solvation(request):
+        return web.json_response({"detail": {"ERROR": "unknown solvent"}}, status=422)
+
+    async def run():
+        async with api_server(web.post("/latest/graph-to-solvation-energy", solvation)):
+            async with aio.AsyncLeruli() as client:
+                return await client.graph_to_solvation_energy("CCO", "water", [298.15])
+
+    assert asyncio.run(run()) == {"detail": {"ERROR": "unknown solvent"}}
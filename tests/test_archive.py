@@ -0,0 +1,171 @@
+"""Tests for the streamed job archives in `leruli.archive`."""
+
+import asyncio
+import gzip
+import io
+import os
+import tarfile
+
+import pytest
+
+from leruli import archive
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "PART_SIZE", 64 * 1024)
+    (tmp_path / "small.txt").write_text("input")
+    # incompressible, so the archive spans several parts
+    (tmp_path / "large.bin").write_bytes(os.urandom(200 * 1024))
+    return str(tmp_path)
+
+
+def members(data):
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+        return {
+            _.name: tar.extractfile(_).read() for _ in tar.getmembers() if _.isfile()
+        }
+
+
+class MinioClient:
+    def put_object(self, bucket, key, data, length, part_size):
+        assert length == -1
+        self.parts = []
+        while True:
+            part = data.read(part_size)
+            if len(part) == 0:
+                break
+            self.parts.append(part)
+        self.data = b"".join(self.parts)
+
+
+class AsyncClient:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.objects = {}
+        self.parts = []
+        self.aborted = False
+
+    async def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    async def create_multipart_upload(self, Bucket, Key):
+        return {"UploadId": "u1"}
+
+    async def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        if self.fail:
+            raise ConnectionError()
+        self.parts.append(Body)
+        return {"ETag": str(PartNumber)}
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        assert [_["PartNumber"] for _ in MultipartUpload["Parts"]] == list(
+            range(1, len(self.parts) + 1)
+        )
+        self.objects[Key] = b"".join(self.parts)
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+
+def test_upload_streams_through_bounded_pipe(job):
+    client = MinioClient()
+    archive.upload(client, "bucket", "run.tgz", job, ["run"])
+    assert len(client.parts) > 2
+    content = members(client.data)
+    assert content["./small.txt"] == b"input"
+    assert content["run.sh"] == b"#!/bin/bash\nrun"
+
+
+def test_upload_async_multipart(job):
+    client = AsyncClient()
+    asyncio.run(archive.upload_async(client, "bucket", "run.tgz", job, ["run"]))
+    assert len(client.parts) > 2
+    assert {len(_) for _ in client.parts[:-1]} == {archive.PART_SIZE}
+    assert len(members(client.objects["run.tgz"])["./large.bin"]) == 200 * 1024
+
+
+def test_upload_async_single_part(tmp_path):
+    (tmp_path / "small.txt").write_text("input")
+    client = AsyncClient()
+    asyncio.run(
+        archive.upload_async(client, "bucket", "run.tgz", str(tmp_path), ["run"])
+    )
+    assert client.parts == []
+    assert members(client.objects["run.tgz"])["./small.txt"] == b"input"
+
+
+def test_upload_async_failure_aborts(job):
+    client = AsyncClient(fail=True)
+    with pytest.raises(ConnectionError):
+        asyncio.run(archive.upload_async(client, "bucket", "run.tgz", job, ["run"]))
+    assert client.aborted
+
+
+def test_upload_missing_directory(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        archive.upload(MinioClient(), "bucket", "run.tgz", str(tmp_path / "x"), [])
+
+
+def roundtrip(job, compression):
+    buffer = io.BytesIO()
+    archive.write(buffer, job, ["run"], compression)
+    data = buffer.getvalue()
+    if compression.startswith("zstd"):
+        import zstandard
+
+        data = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    else:
+        data = gzip.decompress(data)
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        content = {
+            _.name: tar.extractfile(_).read() for _ in tar.getmembers() if _.isfile()
+        }
+    return buffer.getvalue(), content
+
+
+@pytest.mark.parametrize("compression", ["gzip", "gzip:1", "gzip:9", "store"])
+def test_parallel_gzip_roundtrip(job, compression, monkeypatch):
+    monkeypatch.setattr(archive, "BLOCK_SIZE", 20000)
+    text = b"".join(b"%d energy %f\n" % (_, _ / 7) for _ in range(20000))
+    with open(os.path.join(job, "output.log"), "wb") as fh:
+        fh.write(text)
+    data, content = roundtrip(job, compression)
+    assert content["./output.log"] == text
+    assert content["run.sh"] == b"#!/bin/bash\nrun"
+    if compression == "store":
+        assert len(data) > len(text) + 200 * 1024
+    else:
+        # the random file is stored, the log compressed
+        assert len(data) < 200 * 1024 + len(text) / 2
+
+
+def test_incompressible_blocks_are_stored(job, monkeypatch):
+    monkeypatch.setattr(archive, "BLOCK_SIZE", 20000)
+    calls = []
+    compressobj = archive.zlib.compressobj
+    monkeypatch.setattr(
+        archive.zlib,
+        "compressobj",
+        lambda level, *args, **kwargs: calls.append(level)
+        or compressobj(level, *args, **kwargs),
+    )
+    data, content = roundtrip(job, "gzip:9")
+    # the last call finishes the stream
+    assert calls[:-1].count(0) >= 9 and 9 in calls
+    assert len(content["./large.bin"]) == 200 * 1024
+
+
+def test_zstd_roundtrip(job):
+    pytest.importorskip("zstandard")
+    data, content = roundtrip(job, "zstd:3")
+    assert content["./small.txt"] == b"input"
+    assert archive.filename("zstd") == "run.tar.zst"
+
+
+def test_codec_settings():
+    assert archive.codec("store") == ("gzip", 0)
+    assert archive.codec("gzip:9") == ("gzip", 9)
+    assert archive.filename("gzip:1") == "run.tgz"
+    with pytest.raises(ValueError):
+        archive.codec("bzip2")
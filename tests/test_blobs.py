@@ -0,0 +1,212 @@
+"""Tests for the content-addressed blob store in `leruli.blobs`."""
+
+import asyncio
+import json
+import os
+
+import pytest
+from minio.error import S3Error
+
+from leruli import archive, blobs, internal, task
+
+from .conftest import FakeResponse
+from .test_archive import AsyncClient, members
+
+
+class BlobS3:
+    """Minio stand-in with stat and download of objects."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.stats = 0
+
+    def bucket_exists(self, bucket):
+        return bucket in self.buckets
+
+    def make_bucket(self, bucket):
+        self.buckets[bucket] = {}
+
+    def stat_object(self, bucket, key):
+        self.stats += 1
+        if key not in self.buckets[bucket]:
+            raise S3Error(None, "NoSuchKey", "missing", key, None, None)
+
+    def put_object(self, bucket, key, data, length, part_size=None):
+        self.buckets[bucket][key] = data.read()
+
+    def fget_object(self, bucket, key, path):
+        with open(path, "wb") as fh:
+            fh.write(self.buckets[bucket][key])
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(blobs, "THRESHOLD", 1024)
+    monkeypatch.setattr(blobs, "_bucket", "blobs-group")
+    monkeypatch.setattr(blobs, "_stored", set())
+    shared = os.urandom(4096)
+    directories = []
+    for index in range(3):
+        directory = tmp_path / f"job{index}"
+        (directory / "basis").mkdir(parents=True)
+        (directory / "basis" / "def2.dat").write_bytes(shared)
+        (directory / "input.xyz").write_text(f"geometry {index}")
+        directories.append(str(directory))
+    return directories
+
+
+def test_scan_lists_large_files(jobs):
+    entries = blobs.scan(jobs[0])
+    assert list(entries) == [os.path.join("basis", "def2.dat")]
+    assert entries[os.path.join("basis", "def2.dat")]["size"] == 4096
+
+
+def test_stage_uploads_shared_file_once(jobs):
+    client = BlobS3()
+    for directory in jobs:
+        entries = blobs.stage(client, directory)
+    digest = entries[os.path.join("basis", "def2.dat")]["sha256"]
+    assert list(client.buckets["blobs-group"]) == [blobs.key(digest)]
+    assert client.stats == 1
+
+
+def test_stage_skips_blobs_already_stored(jobs):
+    client = BlobS3()
+    blobs.stage(client, jobs[0])
+    blobs._stored.clear()
+    client.put_object = None
+    blobs.stage(client, jobs[1])
+    assert client.stats == 2
+
+
+def test_stage_async_uploads_shared_file_once(jobs, monkeypatch):
+    uploads = []
+
+    async def upload_stream_async(s3_client, bucket, key, produce):
+        await asyncio.sleep(0.01)
+        uploads.append(key)
+
+    monkeypatch.setattr(archive, "upload_stream_async", upload_stream_async)
+
+    class Client(AsyncClient):
+        async def head_bucket(self, Bucket):
+            pass
+
+        async def head_object(self, Bucket, Key):
+            from botocore.exceptions import ClientError
+
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+
+    async def stage():
+        store = blobs.AsyncStore(Client())
+        return await asyncio.gather(*[store.stage(_) for _ in jobs])
+
+    results = asyncio.run(stage())
+    assert len(uploads) == 1
+    assert all(len(_) == 1 for _ in results)
+
+
+def test_stage_async_retries_failed_upload(jobs, monkeypatch):
+    uploads = []
+
+    async def upload_stream_async(s3_client, bucket, key, produce):
+        uploads.append(key)
+        if len(uploads) == 1:
+            raise TimeoutError("slow")
+
+    monkeypatch.setattr(archive, "upload_stream_async", upload_stream_async)
+
+    class Client(AsyncClient):
+        async def head_bucket(self, Bucket):
+            pass
+
+        async def head_object(self, Bucket, Key):
+            from botocore.exceptions import ClientError
+
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+
+    async def stage():
+        store = blobs.AsyncStore(Client())
+        with pytest.raises(TimeoutError):
+            await store.stage(jobs[0])
+        return await store.stage(jobs[0])
+
+    assert len(asyncio.run(stage())) == 1
+    assert len(uploads) == 2
+
+
+def test_archive_excludes_blobs(jobs):
+    client = BlobS3()
+    entries = blobs.stage(client, jobs[0])
+
+    class Sink:
+        data = b""
+
+        def write(self, data):
+            self.data += data
+
+    sink = Sink()
+    archive.write(sink, jobs[0], ["run"], exclude=set(entries))
+    assert sorted(members(sink.data)) == ["./input.xyz", "run.sh"]
+
+
+def test_restore_downloads_blobs(jobs):
+    client = BlobS3()
+    entries = blobs.stage(client, jobs[0])
+    target = os.path.join(jobs[0], "..", "restored")
+    os.makedirs(target)
+    with open(os.path.join(target, blobs.MANIFEST), "wb") as fh:
+        fh.write(blobs.manifest(entries))
+    blobs.restore(client, target)
+    with open(os.path.join(target, "basis", "def2.dat"), "rb") as fh:
+        restored = fh.read()
+    with open(os.path.join(jobs[0], "basis", "def2.dat"), "rb") as fh:
+        assert restored == fh.read()
+    with open(os.path.join(target, blobs.MANIFEST)) as fh:
+        assert json.load(fh)["bucket"] == "blobs-group"
+
+
+def test_incremental_stage_uploads_changed_files_only(jobs, monkeypatch):
+    client = BlobS3()
+    with open(os.path.join(jobs[0], "large.bin"), "wb") as fh:
+        fh.write(os.urandom(2048))
+    blobs.stage(client, jobs[0])
+    assert os.path.exists(os.path.join(jobs[0], blobs.STATE))
+
+    # a new process, which knows about the blobs from the state file only
+    monkeypatch.setattr(blobs, "_stored", set())
+    monkeypatch.setattr(blobs, "_digests", {})
+    with open(os.path.join(jobs[0], "large.bin"), "ab") as fh:
+        fh.write(b"edit")
+    hashed = []
+    digest = blobs.digest
+    monkeypatch.setattr(
+        blobs, "digest", lambda path: hashed.append(path) or digest(path)
+    )
+    stats = client.stats
+    entries = blobs.stage(client, jobs[0], incremental=True)
+
+    assert hashed == [os.path.join(jobs[0], "large.bin")]
+    assert client.stats == stats + 1
+    assert len(client.buckets["blobs-group"]) == 3
+    assert entries["large.bin"]["size"] == 2052
+
+
+def test_resubmit_directory(jobs, monkeypatch, fake_client):
+    client = BlobS3()
+    monkeypatch.setenv("LERULI_API_SECRET", "secret")
+    monkeypatch.setattr(internal, "get_s3_client", lambda: client)
+    monkeypatch.setattr(task, "_pace", lambda group="s3": None)
+    fake_client(FakeResponse(200, "job-1"), FakeResponse(200, "job-2"))
+
+    assert task.task_submit(jobs[0], "code", "1", ["run"], dedup=True) == "job-1"
+    assert task.task_submit(jobs[0], "code", "1", ["run"]) is None
+    assert task.task_submit(jobs[0], "code", "1", ["run"], resubmit=True) == "job-2"
+
+    with open(os.path.join(jobs[0], "leruli.bucket")) as fh:
+        bucket = fh.read().strip()
+    assert sorted(client.buckets[bucket]) == [blobs.MANIFEST, "run.tgz"]
+    assert sorted(members(client.buckets[bucket]["run.tgz"])) == [
+        "./input.xyz",
+        "run.sh",
+    ]
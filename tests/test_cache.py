@@ -0,0 +1,75 @@
+"""Tests for `leruli.cache`."""
+
+import pytest
+
+from leruli import cache, internal
+
+from .conftest import FakeClient, FakeResponse
+
+
+@pytest.fixture
+def resultcache(tmp_path, monkeypatch):
+    resultcache = internal.enable_cache(str(tmp_path / "results.sqlite"))
+    yield resultcache
+    internal.disable_cache()
+    resultcache.close()
+
+
+def test_key_ignores_payload_order():
+    assert cache.ResultCache.key(
+        "graph-to-image", {"graph": "C", "angle": 0}, "latest"
+    ) == cache.ResultCache.key("graph-to-image", {"angle": 0, "graph": "C"}, "latest")
+
+
+def test_lru_eviction(tmp_path):
+    resultcache = cache.ResultCache(str(tmp_path / "c.sqlite"), max_entries=10)
+    for i in range(10):
+        resultcache.put(str(i), "latest", i)
+    assert resultcache.get("0") == (True, 0)
+    resultcache.put("new", "latest", "new")
+    assert resultcache.get("0") == (True, 0)
+    assert resultcache.get("1") == (False, None)
+    assert resultcache.get("new") == (True, "new")
+    assert resultcache.stats()["entries"] == 9
+
+
+def test_ttl_only_for_latest(tmp_path):
+    resultcache = cache.ResultCache(str(tmp_path / "c.sqlite"), ttl=-1)
+    resultcache.put("a", "latest", 1)
+    resultcache.put("b", "22.1", 2)
+    assert resultcache.get("a") == (False, None)
+    assert resultcache.get("b") == (True, 2)
+
+
+def test_base_call_uses_cache(resultcache, monkeypatch):
+    client = FakeClient([FakeResponse(200, {"logp": 1.0}), FakeResponse(204)])
+    monkeypatch.setattr(internal, "client", client)
+    for _ in range(2):
+        assert internal._base_call("graph-to-logP", {"graph": "C"}, "latest") == {
+            "logp": 1.0
+        }
+        assert (
+            internal._base_call("graph-to-geometry", {"graph": "X"}, "latest") is None
+        )
+    assert len(client.urls) == 2
+    assert resultcache.hits == 2
+    assert resultcache.misses == 2
+
+
+def test_base_call_skips_uncacheable(resultcache, monkeypatch):
+    client = FakeClient([FakeResponse(200, "token")] * 2)
+    monkeypatch.setattr(internal, "client", client)
+    for _ in range(2):
+        internal._base_call("group-token", {"secret": "s"}, "latest")
+    assert len(client.urls) == 2
+
+
+def test_base_call_skips_error_documents(resultcache, monkeypatch):
+    throttled = FakeResponse(429, {"detail": "Too many requests"})
+    client = FakeClient([throttled, FakeResponse(200, {"logp": 1.0})])
+    monkeypatch.setattr(internal, "client", client)
+    assert internal._base_call("graph-to-logP", {"graph": "C"}, "22_1") == {
+        "detail": "Too many requests"
+    }
+    assert internal._base_call("graph-to-logP", {"graph": "C"}, "22_1") == {"logp": 1.0}
+    assert len(client.urls) == 2
@@ -0,0 +1,72 @@
+"""Tests for `leruli.cli`."""
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from leruli import cli, internal
+
+from .conftest import FakeResponse
+
+
+def test_batch_csv_keeps_order(property_client):
+    runner = CliRunner()
+    result = runner.invoke(
+        cli.cli,
+        ["graph-to-logp", "--batch", "-", "--jobs", "2", "--keep-order"],
+        input="C\n\nCC\nX\nCCC\n",
+    )
+    assert result.exit_code == 1
+    assert result.output.splitlines() == [
+        "input,logp,error",
+        "C,1,",
+        "CC,2,",
+        "X,,LeruliInternalError",
+        "CCC,3,",
+    ]
+
+
+def test_batch_jsonl(property_client, tmp_path):
+    inputs = tmp_path / "graphs.txt"
+    inputs.write_text("\n".join(["C" * _ for _ in range(1, 51)]))
+    runner = CliRunner()
+    result = runner.invoke(
+        cli.cli,
+        ["graph-to-logp", "--batch", str(inputs), "--output-format", "jsonl"],
+    )
+    assert result.exit_code == 0
+    rows = [json.loads(_) for _ in result.output.splitlines()]
+    assert sorted(_["logp"] for _ in rows) == list(range(1, 51))
+    assert all(len(_["input"]) == _["logp"] for _ in rows)
+
+
+def test_missing_argument_without_batch():
+    result = CliRunner().invoke(cli.cli, ["graph-to-logp"])
+    assert result.exit_code == 2
+
+
+@pytest.mark.parametrize(
+    "options, message",
+    [
+        (["--jobs", "0"], "Invalid value for '--jobs'"),
+        (["--reference"], "--reference cannot be combined with --batch"),
+    ],
+)
+def test_invalid_batch_options(options, message):
+    result = CliRunner().invoke(
+        cli.cli, ["graph-to-logp", "--batch", "-", *options], input="C\n"
+    )
+    assert result.exit_code == 2
+    assert message in result.output
+
+
+def test_formula_to_graphs_streams_with_limit(fake_client, monkeypatch):
+    monkeypatch.setattr(internal, "_cache", None)
+    monkeypatch.setattr(internal, "_cache_configured", True)
+    molecules = [{"name": f"m{_}", "smiles": "C" * _} for _ in range(1, 6)]
+    fake_client(FakeResponse(200, {"molecules": molecules, "reference": "r"}))
+    runner = CliRunner()
+    result = runner.invoke(cli.cli, ["formula-to-graphs", "--limit", "2", "CH4"])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == ["m1: C", "m2: CC"]
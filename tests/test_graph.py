@@ -0,0 +1,48 @@
+"""Tests for the batch functions in `leruli.graph`."""
+
+import pytest
+
+import leruli
+from leruli import cache, internal
+
+
+def test_graph_to_properties_columns(property_client):
+    result = leruli.graph_to_properties(
+        (_ for _ in ["C", "CC", "X", "CCC"]), ["logP", "bp"], max_workers=3
+    )
+    assert result == {
+        "graph": ["C", "CC", "X", "CCC"],
+        "logP": [1, 2, None, 3],
+        "bp": [-1, -2, None, -3],
+        "error": [False, False, True, False],
+    }
+    assert len(property_client.calls) == 8
+
+
+def test_iter_graph_to_properties_chunks(property_client):
+    chunks = list(leruli.iter_graph_to_properties(["C"] * 5, ["logP"], chunksize=2))
+    assert [_["logP"] for _ in chunks] == [[1, 1], [1, 1], [1]]
+
+
+def test_graph_to_properties_unknown_property():
+    with pytest.raises(ValueError):
+        leruli.graph_to_properties(["C"], ["color"])
+
+
+def test_graph_to_properties_deduplicated(property_client, tmp_path, monkeypatch):
+    canonical_map = cache.CanonicalMap(str(tmp_path / "canonical.sqlite"))
+    monkeypatch.setattr(internal, "_canonical_map", canonical_map)
+    graphs = ["OCC", "CCO", "X", "COC", "OCC"]
+
+    result = leruli.graph_to_properties(graphs, ["logP"], deduplicate=True)
+    assert result == {
+        "graph": graphs,
+        "logP": [3, 3, None, 3, 3],
+        "error": [False, False, True, False, False],
+    }
+    assert sorted(_[1] for _ in property_client.calls if "logP" in _[0]) == ["CCO"]
+    assert canonical_map.get_many(["OCC", "X"], "latest") == {"OCC": "CCO"}
+
+    property_client.calls.clear()
+    leruli.graph_to_properties(["OCC", "COC"], ["logP"], deduplicate=True)
+    assert [_ for _ in property_client.calls if "canonical" in _[0]] == []
@@ -0,0 +1,46 @@
+"""Regression tests for the modules loaded at startup."""
+
+import subprocess
+import sys
+
+import pytest
+
+# optional heavy dependencies only needed by individual features
+HEAVY = ["aiohttp", "aiobotocore", "botocore", "docker", "minio", "tabulate", "tqdm"]
+
+
+def _imported(code):
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"{code}\nimport sys; print(' '.join(sys.modules), file=sys.stderr)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    return {_.split(".")[0] for _ in output.split()}
+
+
+def test_import_leruli_is_lightweight():
+    modules = _imported("import leruli")
+    assert [_ for _ in HEAVY + ["requests", "multiprocessing"] if _ in modules] == []
+
+
+@pytest.mark.parametrize("command", [["--help"], ["canonical-formula", "--help"]])
+def test_cli_startup_is_lightweight(command):
+    modules = _imported(
+        f"import sys; sys.argv = ['leruli'] + {command!r}\n"
+        "from leruli import cli\n"
+        "try:\n    cli.main()\nexcept SystemExit:\n    pass"
+    )
+    assert [_ for _ in HEAVY if _ in modules] == []
+
+
+def test_lazy_attributes():
+    import leruli
+
+    assert leruli.graph_to_logP.__module__ == "leruli.graph"
+    assert leruli.get_api_secret.__module__ == "leruli.internal"
+    assert set(leruli.__all__) <= set(dir(leruli))
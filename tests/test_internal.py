@@ -0,0 +1,318 @@
+"""Tests for the HTTP layer in `leruli.internal`."""
+
+import concurrent.futures
+import json
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+from leruli import internal, metrics
+
+from .conftest import FakeResponse
+
+
+def test_client_reuses_session():
+    client = internal.Client(pool_size=3)
+    session = client.session
+    assert client.session is session
+    adapter = session.get_adapter("https://api.leruli.com")
+    assert adapter._pool_maxsize == 3
+    client.close()
+    assert client.session is not session
+
+
+def test_client_new_session_after_fork():
+    client = internal.Client()
+    session = client.session
+    client._pid = -1
+    assert client.session is not session
+
+
+def test_configure_client_keeps_settings(monkeypatch):
+    monkeypatch.setattr(internal, "client", internal.Client(pool_size=4, timeout=3))
+    client = internal.configure_client(timeout=7)
+    assert internal.client is client
+    assert client.pool_size == 4
+    assert client.timeout == 7
+
+
+def test_base_call_uses_shared_client(fake_client):
+    client = fake_client(FakeResponse(200, {"logp": 1.0}))
+    assert internal._base_call("graph-to-logP", {"graph": "C"}, "latest") == {
+        "logp": 1.0
+    }
+    assert client.urls == [f"{internal.BASEURL}/latest/graph-to-logP"]
+
+
+def test_base_call_no_content(fake_client):
+    fake_client(FakeResponse(204))
+    assert internal._base_call("graph-to-geometry", {"graph": "C"}, "latest") is None
+
+
+def test_base_call_server_error(fake_client):
+    fake_client(FakeResponse(500))
+    with pytest.raises(internal.LeruliInternalError):
+        internal._base_call("graph-to-logP", {"graph": "C"}, "latest")
+
+
+def test_base_call_waits_for_delayed_result(fake_client):
+    client = fake_client(
+        FakeResponse(202, {"token": "t1", "time_to_result": 0}),
+        FakeResponse(202, {"token": "t2", "time_to_result": 0}),
+        FakeResponse(200, {"logp": 2.0}),
+    )
+    assert internal._base_call("graph-to-logP", {"graph": "C"}, "latest") == {
+        "logp": 2.0
+    }
+    assert client.urls[1:] == [
+        f"{internal.BASEURL}/latest/result/t1",
+        f"{internal.BASEURL}/latest/result/t2",
+    ]
+
+
+def test_poller_resolves_many_tokens(monkeypatch):
+    class TokenClient:
+        def get(self, url, **kwargs):
+            return FakeResponse(200, {"token": url.rsplit("/", 1)[-1]})
+
+    monkeypatch.setattr(internal, "client", TokenClient())
+    poller = internal._Poller(workers=2)
+    futures = [poller.track("latest", str(_), 0.01 * (_ % 3)) for _ in range(20)]
+    assert [_.result(timeout=5) for _ in futures] == [
+        {"token": str(_)} for _ in range(20)
+    ]
+
+
+def test_identical_requests_in_flight_are_coalesced(monkeypatch):
+    release = threading.Event()
+
+    class SlowClient:
+        posts = 0
+
+        def post(self, url, **kwargs):
+            SlowClient.posts += 1
+            release.wait(5)
+            return FakeResponse(500 if "fail" in url else 200, {"graph": "CC"})
+
+    monkeypatch.setattr(internal, "client", SlowClient())
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        ok = [
+            executor.submit(
+                internal._base_call, "name-to-graph", {"name": "ethane"}, "latest"
+            )
+            for _ in range(4)
+        ]
+        failed = [
+            executor.submit(internal._base_call, "fail", {"name": "ethane"}, "latest")
+            for _ in range(4)
+        ]
+        time.sleep(0.2)
+        release.set()
+    assert [_.result() for _ in ok] == [{"graph": "CC"}] * 4
+    assert all(isinstance(_.exception(), internal.LeruliInternalError) for _ in failed)
+    assert SlowClient.posts == 2
+    assert internal._inflight == {}
+
+
+def test_urgent_requests_are_not_coalesced_with_regular_ones(monkeypatch):
+    release = threading.Event()
+
+    class SlowClient:
+        urls = []
+
+        def post(self, url, **kwargs):
+            SlowClient.urls.append(url)
+            if "urgent" not in url:
+                release.wait(5)
+            return FakeResponse(200, {"graph": "CC"})
+
+    monkeypatch.setattr(internal, "client", SlowClient())
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        regular = executor.submit(
+            internal._base_call, "name-to-graph", {"name": "ethane"}, "latest"
+        )
+        time.sleep(0.1)
+        urgent = internal._base_call(
+            "name-to-graph", {"name": "ethane"}, "latest", urgent=True
+        )
+        assert not regular.done()
+        release.set()
+    assert urgent == regular.result() == {"graph": "CC"}
+    assert len(SlowClient.urls) == 2
+
+
+def test_requests_in_flight_are_not_shared_after_fork(fake_client, monkeypatch):
+    fake_client(FakeResponse(200, {"graph": "CC"}))
+    key = (internal.cache.ResultCache.key("name-to-graph", {}, "latest"), False)
+    # a request of the parent process, it never completes in the child
+    monkeypatch.setattr(internal, "_inflight", {key: concurrent.futures.Future()})
+    monkeypatch.setattr(internal, "_inflight_pid", -1)
+    future = internal._base_future("name-to-graph", {}, "latest")
+    assert future.result(timeout=1) == {"graph": "CC"}
+    assert internal._inflight == {}
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def make_client(*responses, retries=3):
+    client = internal.Client(retries=retries, backoff=0)
+    client._session = FakeSession(responses)
+    client._pid = os.getpid()
+    return client
+
+
+def test_client_retries_transient_failures(monkeypatch):
+    monkeypatch.setattr(internal, "_breakers", {})
+    delays = []
+    monkeypatch.setattr(internal.time, "sleep", delays.append)
+    client = make_client(
+        requests.ConnectionError(),
+        FakeResponse(503, headers={"Retry-After": "2"}),
+        FakeResponse(200),
+    )
+    assert client.post("https://x/latest/graph-to-logP").status_code == 200
+    assert client.session.calls == 3
+    assert 2 <= delays[1] < 3
+    assert internal.circuit_state()["graph-to-logP"]["state"] == "closed"
+
+
+def test_client_returns_last_response_when_retries_exhausted(monkeypatch):
+    monkeypatch.setattr(internal, "_breakers", {})
+    monkeypatch.setattr(internal.time, "sleep", lambda _: None)
+    client = make_client(*[FakeResponse(500)] * 3, retries=2)
+    assert client.get("https://x/latest/result/abc", endpoint="x").status_code == 500
+    assert client.session.calls == 3
+
+
+def test_circuit_breaker_opens_and_recovers(monkeypatch):
+    monkeypatch.setattr(internal, "_breakers", {})
+    breaker = internal.circuit_breaker("graph-to-logP")
+    breaker.cooldown = breaker._current_cooldown = 0.05
+    client = make_client(*[FakeResponse(500)] * breaker.threshold, retries=0)
+    for _ in range(breaker.threshold):
+        client.post("https://x/latest/graph-to-logP")
+    assert breaker.state == "open"
+    with pytest.raises(internal.CircuitOpenError):
+        client.post("https://x/latest/graph-to-logP")
+
+    time.sleep(0.05)
+    assert breaker.state == "half-open"
+    client.session.responses.append(FakeResponse(200))
+    assert client.post("https://x/latest/graph-to-logP").status_code == 200
+    assert breaker.state == "closed"
+
+
+def test_circuit_breaker_trial_failing_unexpectedly(monkeypatch):
+    monkeypatch.setattr(internal, "_breakers", {})
+    breaker = internal.circuit_breaker("graph-to-logP")
+    breaker.cooldown = breaker._current_cooldown = 0.05
+    client = make_client(*[FakeResponse(500)] * breaker.threshold, retries=0)
+    for _ in range(breaker.threshold):
+        client.post("https://x/latest/graph-to-logP")
+
+    time.sleep(0.05)
+    client.session.responses.append(requests.exceptions.ChunkedEncodingError())
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.post("https://x/latest/graph-to-logP")
+    assert breaker.state == "open"
+
+    # the next trial is allowed after the cooldown
+    time.sleep(breaker._current_cooldown)
+    client.session.responses.append(FakeResponse(200))
+    assert client.post("https://x/latest/graph-to-logP").status_code == 200
+    assert breaker.state == "closed"
+
+
+def test_circuit_breaker_ignores_hook_errors(monkeypatch):
+    monkeypatch.setattr(internal, "_breakers", {})
+    breaker = internal.circuit_breaker("graph-to-logP")
+
+    def hook(**kwargs):
+        raise RuntimeError("broken hook")
+
+    client = make_client(*[FakeResponse(200)] * breaker.threshold, retries=0)
+    metrics.add_hook("on_response", hook)
+    try:
+        for _ in range(breaker.threshold):
+            with pytest.raises(RuntimeError):
+                client.post("https://x/latest/graph-to-logP")
+    finally:
+        metrics.remove_hook("on_response", hook)
+    assert breaker.state == "closed"
+
+
+class ChunkedResponse(FakeResponse):
+    """Delivers the body in tiny chunks and counts how much of it was read."""
+
+    def __init__(self, data, chunk=7):
+        super().__init__(200, data)
+        self.chunk = chunk
+        self.read = 0
+
+    def iter_content(self, chunk_size=1):
+        for part in super().iter_content(self.chunk):
+            self.read += len(part)
+            yield part
+
+
+MOLECULES = [{"name": f"isomer {_} – ü", "smiles": "C" * _} for _ in range(50)]
+
+
+def test_iter_json_array_across_chunk_boundaries():
+    res = ChunkedResponse({"reference": "x", "molecules": MOLECULES})
+    assert list(internal._iter_json_array(res, "molecules")) == MOLECULES
+
+
+def test_iter_json_array_incomplete_body():
+    res = FakeResponse(200)
+    res.iter_content = lambda chunk_size: iter([b'{"molecules": [{"name": "a"}, {'])
+    with pytest.raises(ValueError):
+        list(internal._iter_json_array(res, "molecules"))
+
+
+def test_base_stream_yields_incrementally(fake_client, monkeypatch):
+    monkeypatch.setattr(internal, "_cache", None)
+    monkeypatch.setattr(internal, "_cache_configured", True)
+    res = ChunkedResponse({"molecules": MOLECULES, "reference": "x"})
+    client = fake_client(FakeResponse(202, {"token": "t1", "time_to_result": 0}), res)
+    items = internal._base_stream(
+        "formula-to-graphs", {"formula": "C2H6"}, "latest", "molecules", limit=3
+    )
+    assert list(items) == MOLECULES[:3]
+    assert res.read < len(json.dumps(res._data)) / 2
+    assert res.closed
+    assert client.urls[1] == f"{internal.BASEURL}/latest/result/t1"
+
+
+@pytest.mark.parametrize(
+    "document, message",
+    [
+        ({"detail": "formula too large"}, "formula too large"),
+        ({"error": "unexpected"}, "Request rejected with status 400."),
+    ],
+)
+def test_base_stream_rejected(fake_client, monkeypatch, document, message):
+    monkeypatch.setattr(internal, "_cache", None)
+    monkeypatch.setattr(internal, "_cache_configured", True)
+    res = FakeResponse(400, document)
+    fake_client(res)
+    items = internal._base_stream(
+        "formula-to-graphs", {"formula": "C2H6"}, "latest", "molecules"
+    )
+    with pytest.raises(ValueError, match=message):
+        list(items)
+    assert res.closed
@@ -0,0 +1,100 @@
+"""Tests for the batch submission journal in `leruli.journal`."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from leruli import journal
+
+
+@pytest.fixture
+def record(tmp_path):
+    record = journal.Journal(str(tmp_path / "journal.sqlite"))
+    yield record
+    record.close()
+
+
+def test_states(record, tmp_path):
+    record.uploading(
+        [("a", "bucket-a", ["code", "1"]), ("b", "bucket-b", ["code", "1"])]
+    )
+    assert record.get("a")["state"] == journal.UPLOADING
+    assert record.get(str(tmp_path / "missing")) is None
+
+    record.uploaded([("a", {"secret": "s", "bucketid": "bucket-a", "directory": "a"})])
+    assert record.get("a")["state"] == journal.UPLOADED
+    record.submitting(["a"])
+    assert record.get("a")["since"] > 0
+    record.submitted([("a", "job-1")])
+    state = record.get(os.path.abspath("a"))
+    assert state["state"] == journal.SUBMITTED
+    assert state["jobid"] == "job-1"
+    assert state["payload"] == {"bucketid": "bucket-a"}
+    assert state["arguments"] == ["code", "1"]
+    assert record.orphans() == [(os.path.abspath("b"), "bucket-b")]
+    assert record.pending() == 1
+
+    record.forget(["b"])
+    assert len(record) == 1
+
+
+def test_rejected_jobs_can_be_submitted_again(record):
+    record.uploading([("a", "bucket-a", [])])
+    record.uploaded([("a", {"bucketid": "bucket-a"})])
+    record.submitting(["a"])
+    record.rejected(["a"])
+    assert record.get("a")["state"] == journal.UPLOADED
+    assert record.orphans() == []
+
+
+def test_runs_claim_rows(record):
+    record.uploading([("a", "bucket-a", [])])
+    assert record.get("a")["run"] == record.run
+    other = journal.Journal(record.path)
+    assert other.run != record.run
+    other.claim(["a"])
+    assert record.get("a")["run"] == other.run
+    other.close()
+
+
+def test_persists_across_processes(record):
+    record.uploading([("a", "bucket-a", [])])
+    record.uploaded([("a", {"bucketid": "bucket-a"})])
+    record.submitting(["a"])
+    code = (
+        "from leruli import journal; "
+        f"print(journal.Journal({record.path!r}).get('a')['state'])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == journal.SUBMITTING
+
+
+def test_acquire(record):
+    record.acquire()
+    with record._db:
+        # a live process on this host
+        record._db.execute("UPDATE owner SET pid = ?", (os.getppid(),))
+    with pytest.raises(ValueError):
+        record.acquire()
+
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    with record._db:
+        record._db.execute("UPDATE owner SET pid = ?", (process.pid,))
+    record.acquire()
+
+
+def test_remove(record):
+    record.uploading([("a", "bucket-a", [])])
+    record.remove()
+    assert not os.path.exists(record.path)
+
+
+def test_journal_path_depends_on_arguments():
+    first = journal.journal_path("jobs.txt", "code", "1", ["run"])
+    assert first == journal.journal_path("jobs.txt", "code", "1", ["run"])
+    assert first != journal.journal_path("jobs.txt", "code", "2", ["run"])
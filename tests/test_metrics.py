@@ -0,0 +1,95 @@
+"""Tests for the instrumentation in `leruli.metrics`."""
+
+import os
+
+import pytest
+
+from leruli import internal, metrics
+
+from .conftest import FakeResponse
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    def request(self, method, url, **kwargs):
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, "metrics", metrics.Metrics())
+    monkeypatch.setattr(metrics, "_hooks", {_: [] for _ in metrics.EVENTS})
+    monkeypatch.setattr(internal, "_breakers", {})
+    monkeypatch.setattr(internal, "_cache", None)
+    monkeypatch.setattr(internal, "_cache_configured", True)
+    monkeypatch.setattr(internal.time, "sleep", lambda _: None)
+
+
+def install_client(monkeypatch, *responses):
+    client = internal.Client(retries=1, backoff=0)
+    client._session = FakeSession(responses)
+    client._pid = os.getpid()
+    monkeypatch.setattr(internal, "client", client)
+
+
+def test_hooks_and_metrics_of_delayed_call(fresh_metrics, monkeypatch):
+    events = []
+    for event in metrics.EVENTS:
+        metrics.add_hook(event, lambda event=event, **kw: events.append((event, kw)))
+    install_client(
+        monkeypatch,
+        FakeResponse(202, {"token": "t1", "time_to_result": 0}),
+        FakeResponse(503),
+        FakeResponse(202, {"token": "t2", "time_to_result": 0}),
+        FakeResponse(200, {"logp": 1.0}),
+    )
+    assert internal._base_call("graph-to-logP", {"graph": "C"}, "latest") == {
+        "logp": 1.0
+    }
+
+    assert [_[0] for _ in events] == [
+        "on_request",
+        "on_response",
+        "on_request",
+        "on_response",
+        "on_request",
+        "on_response",
+        "on_poll",
+        "on_request",
+        "on_response",
+        "on_poll",
+    ]
+    assert [_[1]["status"] for _ in events if _[0] == "on_poll"] == [202, 200]
+    assert events[3][1]["attempt"] == 0 and events[4][1]["attempt"] == 1
+
+    endpoint = metrics.as_dict()["graph-to-logP"]
+    assert endpoint["counters"] == {
+        "calls": 1,
+        "delayed": 1,
+        "requests": 4,
+        "server_errors": 1,
+        "retries": 1,
+        "polls": 2,
+    }
+    for name in ("http", "first_response", "queue", "time_to_result", "call"):
+        assert endpoint["latency"][name]["count"] == (4 if name == "http" else 1)
+
+
+def test_unknown_hook_is_rejected():
+    with pytest.raises(ValueError):
+        metrics.add_hook("on_everything", print)
+
+
+def test_prometheus_export():
+    registry = metrics.Metrics()
+    registry.increment("graph-to-logP", "requests", 3)
+    for value in (0.001, 0.02, 7):
+        registry.observe("graph-to-logP", "http", value)
+    text = registry.to_prometheus()
+    assert 'leruli_requests_total{endpoint="graph-to-logP"} 3' in text
+    assert 'leruli_http_seconds_bucket{endpoint="graph-to-logP",le="0.005"} 1' in text
+    assert 'leruli_http_seconds_bucket{endpoint="graph-to-logP",le="+Inf"} 3' in text
+    assert 'leruli_http_seconds_count{endpoint="graph-to-logP"} 3' in text
+    assert registry.as_dict()["graph-to-logP"]["latency"]["http"]["p50"] == 0.025
@@ -0,0 +1,82 @@
+"""Tests for the submission profiling in `leruli.profiling`."""
+
+import json
+
+from click.testing import CliRunner
+
+from leruli import blobs, cli, internal, profiling, task
+
+from .conftest import FakeResponse
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def bucket_exists(self, bucket):
+        return bucket in self.objects
+
+    def make_bucket(self, bucket):
+        self.objects[bucket] = {}
+
+    def stat_object(self, bucket, key):
+        pass
+
+    def put_object(self, bucket, key, data, length, **kwargs):
+        self.objects[bucket][key] = data.read()
+
+
+def test_summary_accounts_for_overlapping_jobs():
+    spans = [
+        ("pack", "a", 0.0, 2.0, 1),
+        ("pack", "b", 1.0, 3.0, 2),
+        ("upload", "a", 3.0, 4.0, 1),
+    ]
+    rows = {_["stage"]: _ for _ in profiling.summary(spans)}
+    assert list(rows) == ["pack", "upload"]
+    assert rows["pack"]["total"] == 4.0
+    assert rows["pack"]["busy"] == 3.0
+    assert rows["pack"]["share"] == 0.75
+    assert rows["upload"]["p95"] == 1.0
+
+
+def test_chrome_trace_has_one_track_per_job():
+    spans = [("pack", "a", 10.0, 10.5, 1), ("pack", "b", 10.0, 11.0, 1)]
+    trace = profiling.chrome_trace(spans)
+    events = [_ for _ in trace["traceEvents"] if _["ph"] == "X"]
+    assert [_["tid"] for _ in events] == [0, 1]
+    assert events[1]["ts"] == 0 and events[1]["dur"] == 1e6
+
+
+def test_task_submit_profile(monkeypatch, tmp_path, fake_client):
+    monkeypatch.setenv("LERULI_API_SECRET", "secret")
+    monkeypatch.setattr(internal, "get_s3_client", FakeS3)
+    monkeypatch.setattr(task, "_pace", lambda group="s3": None)
+    monkeypatch.setattr(blobs, "THRESHOLD", 0)
+    monkeypatch.setattr(blobs, "_bucket", "blobs-group")
+    fake_client(FakeResponse(200, "job-1"))
+    (tmp_path / "input.dat").write_text("data")
+    monkeypatch.chdir(tmp_path)
+    trace = tmp_path / "trace.json"
+
+    result = CliRunner().invoke(
+        cli.cli,
+        [
+            "task-submit",
+            "--profile",
+            "--trace",
+            str(trace),
+            "--dedup",
+            "code",
+            "1",
+            "run",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert result.stdout == "job-1\n"
+    for stage in profiling.STAGES:
+        assert stage in result.stderr
+    names = {_["name"] for _ in json.load(open(trace))["traceEvents"]}
+    assert set(profiling.STAGES) <= names
+    assert (tmp_path / "leruli.job").read_text() == "job-1\n"
+    profiling.enable(False)
@@ -0,0 +1,114 @@
+"""Tests for `leruli.ratelimit`."""
+
+import math
+import multiprocessing as mp
+import time
+
+from leruli import ratelimit
+
+
+def _take_many(limiter, n):
+    for _ in range(n):
+        limiter.acquire()
+
+
+def test_rate_limit_shared_across_processes():
+    limiter = ratelimit.RateLimiter(50, burst=1)
+    start = time.time()
+    ctx = mp.get_context("fork")
+    procs = [ctx.Process(target=_take_many, args=(limiter, 10)) for _ in range(3)]
+    [_.start() for _ in procs]
+    [_.join() for _ in procs]
+    # 30 requests at 50/s need at least 0.58s when coordinated
+    assert time.time() - start > 0.5
+
+
+def test_throttle_halves_and_recovers(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    limiter = ratelimit.RateLimiter(100)
+    limiter.throttle()
+    limiter.throttle()
+    assert limiter.rate == 50
+    now[0] += 2
+    limiter._take(0)
+    assert limiter.rate == 70
+    # back at the maximum five seconds after halving
+    now[0] += 3
+    limiter._take(0)
+    assert limiter.rate == 100
+
+
+def test_unlimited_until_throttled(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    limiter = ratelimit.RateLimiter()
+    for _ in range(400):
+        assert limiter._take(1) == 0
+    assert limiter.rate == math.inf
+
+    # half of the rate seen by the server
+    limiter.throttle()
+    assert limiter.rate == 200
+    assert limiter._take(1) > 0
+    now[0] += 4
+    limiter._take(0)
+    assert limiter.rate == 360
+    now[0] += 1
+    limiter._take(0)
+    assert limiter.rate == math.inf
+
+
+def test_limits_configured_from_environment(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_limiters", None)
+    monkeypatch.setenv("LERULI_RATELIMIT_S3", "0")
+    monkeypatch.setenv("LERULI_RATELIMIT_TASK", "5")
+    monkeypatch.delenv("LERULI_RATELIMIT_PROPERTIES", raising=False)
+    assert ratelimit.get_limiter("s3") is None
+    assert ratelimit.get_limiter("task").max_rate == 5
+    assert ratelimit.get_limiter("properties").rate == math.inf
+
+
+def test_concurrency_increases_additively():
+    limiter = ratelimit.ConcurrencyLimiter(2, maximum=4)
+    for _ in range(10):
+        assert limiter._try_acquire()
+        limiter.release(0.1, 2**20)
+    assert limiter.limit == 4
+
+
+def test_concurrency_decreases_on_failure_and_latency(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    limiter = ratelimit.ConcurrencyLimiter(16, maximum=64)
+    for _ in range(3):
+        limiter._try_acquire()
+    limiter.release(0.1, 2**20)
+    # uploads in flight fail together, only react once
+    limiter.release(failed=True)
+    limiter.release(failed=True)
+    assert limiter.limit == 8
+    now[0] += 2
+    limiter._try_acquire()
+    limiter.release(1.0, 2**20)
+    assert limiter.limit == 6
+    assert limiter.active == 0
+
+
+def test_concurrency_bounds_active_uploads():
+    import asyncio
+
+    limiter = ratelimit.ConcurrencyLimiter(2, maximum=2)
+    peak = []
+
+    async def upload():
+        await limiter.acquire_async()
+        peak.append(limiter.active)
+        await asyncio.sleep(0.02)
+        limiter.release(0.02, 2**20)
+
+    async def run():
+        await asyncio.gather(*[upload() for _ in range(6)])
+
+    asyncio.run(run())
+    assert max(peak) == 2
@@ -0,0 +1,256 @@
+"""Tests for the job storage layouts of `leruli.task`."""
+
+import asyncio
+import itertools
+import os
+import types
+
+import pytest
+from minio.error import S3Error
+
+from leruli import archive, blobs, internal, journal, ratelimit, task
+
+from .conftest import FakeResponse
+
+
+class StoreS3:
+    """Minio stand-in keeping objects in memory."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.created = []
+
+    def bucket_exists(self, bucket):
+        return bucket in self.buckets
+
+    def make_bucket(self, bucket):
+        self.created.append(bucket)
+        self.buckets[bucket] = {}
+
+    def put_object(self, bucket, key, data, length, part_size=None):
+        self.buckets[bucket][key] = data.read()
+
+    def list_objects(self, bucket, prefix=None, recursive=False):
+        if bucket not in self.buckets:
+            raise S3Error(None, "NoSuchBucket", "missing", bucket, None, None)
+        return [
+            types.SimpleNamespace(object_name=_)
+            for _ in sorted(self.buckets[bucket])
+            if _.startswith(prefix or "")
+        ]
+
+    def get_object(self, bucket, key):
+        data = self.buckets[bucket][key]
+        return types.SimpleNamespace(
+            read=lambda: data, close=lambda: None, release_conn=lambda: None
+        )
+
+    def remove_objects(self, bucket, objects):
+        for _ in objects:
+            del self.buckets[bucket][_.name]
+        return iter([])
+
+    def remove_bucket(self, bucket):
+        assert not self.buckets.pop(bucket)
+
+
+@pytest.fixture
+def store(monkeypatch, fake_client):
+    client = StoreS3()
+    monkeypatch.setenv("LERULI_API_SECRET", "secret")
+    monkeypatch.setattr(internal, "get_s3_client", lambda: client)
+    monkeypatch.setattr(task, "_pace", lambda group="s3": None)
+    monkeypatch.setattr(blobs, "_stored", set())
+    fake_client(FakeResponse(200, "job-1"), FakeResponse(200, "job-2"))
+    return client
+
+
+def _submit(tmp_path, name, bucket=None):
+    directory = tmp_path / name
+    (directory / "sub").mkdir(parents=True)
+    (directory / "sub" / "input.dat").write_text(name)
+    task.task_submit(str(directory), "code", "1", ["run"], bucket=bucket)
+    return (directory / "leruli.bucket").read_text().strip()
+
+
+def test_split_location():
+    assert task._split_location("bucket") == ("bucket", "")
+    assert task._split_location("bucket/prefix") == ("bucket", "prefix")
+
+
+def test_shared_bucket_stores_jobs_under_prefixes(tmp_path, store):
+    first = _submit(tmp_path, "a", "jobs-group")
+    second = _submit(tmp_path, "b", "jobs-group")
+
+    assert store.created == ["jobs-group"]
+    assert first.startswith("jobs-group/") and first != second
+    assert sorted(store.buckets["jobs-group"]) == sorted(
+        f"{task._split_location(_)[1]}/run.tgz" for _ in (first, second)
+    )
+
+
+def test_get_and_prune_with_prefix(tmp_path, store):
+    first = _submit(tmp_path, "a", "jobs-group")
+    second = _submit(tmp_path, "b", "jobs-group")
+    prefix = task._split_location(first)[1]
+    store.buckets["jobs-group"][f"{prefix}/out/result.log"] = b"done"
+
+    target = tmp_path / "download"
+    target.mkdir()
+    task.task_get(str(target), first)
+    assert sorted(os.listdir(target)) == ["out", "run.tgz"]
+    assert (target / "out" / "result.log").read_bytes() == b"done"
+
+    task.task_prune(first)
+    remaining = list(store.buckets["jobs-group"])
+    assert remaining == [f"{task._split_location(second)[1]}/run.tgz"]
+
+
+def test_prune_own_bucket(tmp_path, store):
+    location = _submit(tmp_path, "a")
+    assert "/" not in location and location in store.buckets
+    task.task_prune(location)
+    assert location not in store.buckets
+
+
+def test_resubmit_keeps_previous_location(tmp_path, store):
+    first = _submit(tmp_path, "a", "jobs-group")
+    directory = tmp_path / "a"
+    task.task_submit(
+        str(directory), "code", "1", ["run"], resubmit=True, bucket="jobs-group"
+    )
+    second = (directory / "leruli.bucket").read_text().strip()
+
+    assert second != first
+    assert task._task_previous_locations(str(directory)) == [first]
+    # finalizing again, e.g. on resume, records the earlier location once
+    task._task_submit_finalize(str(directory), "job-2", second)
+    assert task._task_previous_locations(str(directory)) == [first]
+    assert "leruli.bucket.previous" in archive.HANDLES
+
+
+def test_cleanup_removes_orphaned_uploads(tmp_path, store):
+    store.make_bucket("orphan")
+    store.buckets["orphan"]["run.tgz"] = b"a"
+    store.make_bucket("jobs-group")
+    store.buckets["jobs-group"].update({"p1/run.tgz": b"b", "p2/run.tgz": b"c"})
+    record = journal.Journal(str(tmp_path / "journal.sqlite"))
+    record.uploading(
+        [("a", "orphan", []), ("b", "jobs-group/p1", []), ("c", "never-created", [])]
+    )
+
+    task._task_submit_cleanup(record)
+    assert "orphan" not in store.buckets
+    assert list(store.buckets["jobs-group"]) == ["p2/run.tgz"]
+    assert len(record) == 0
+    record.close()
+
+
+def test_failing_directories_are_reported(monkeypatch):
+    def directories():
+        raise OSError("listing failed")
+        yield
+
+    monkeypatch.setenv("LERULI_API_SECRET", "secret")
+    jobs = [itertools.repeat(_) for _ in ("code", "1", ["run"], 1, 1000, 60)]
+    with pytest.raises(OSError, match="listing failed"):
+        task.task_submit_many(directories(), *jobs, processes=1)
+
+
+def test_resume_from_interrupted_upload_and_submission(tmp_path, monkeypatch):
+    monkeypatch.setenv("LERULI_API_SECRET", "secret")
+    for name in ("LERULI_S3_ACCESS", "LERULI_S3_SECRET", "LERULI_S3_SERVER"):
+        monkeypatch.delenv(name, raising=False)
+    uploading, submitting = str(tmp_path / "a"), str(tmp_path / "b")
+    path = str(tmp_path / "journal.sqlite")
+    record = journal.Journal(path)
+    record.uploading(
+        [(uploading, "bucket-a", ["code", "1"]), (submitting, "bucket-b", [])]
+    )
+    record.submitting([submitting])
+    with record._db:
+        record._db.execute("UPDATE jobs SET since = 0 WHERE state = 'submitting'")
+    record.close()
+
+    jobs = [itertools.repeat(_) for _ in ("code", "1", ["run"], 1, 1000, 60)]
+    failed = task.task_submit_many(
+        [uploading, submitting, uploading], *jobs, processes=1, journal=path
+    )
+    # without storage access the interrupted upload cannot be deleted
+    assert "could not be deleted" in failed[uploading]
+    assert "Given up" in failed[submitting]
+    record = journal.Journal(path)
+    assert record.get(uploading)["state"] == journal.UPLOADING
+    assert record.get(submitting) is None
+    record.close()
+
+
+class AsyncS3:
+    def __init__(self):
+        self.buckets = []
+
+    async def create_bucket(self, Bucket):
+        self.buckets.append(Bucket)
+
+
+def _stage(tmp_path, monkeypatch, failures):
+    """Runs the upload stage of one job whose first uploads fail."""
+
+    async def upload_async(*args, **kwargs):
+        if failures:
+            raise failures.pop(0)
+        return 100
+
+    async def pace(group="s3"):
+        pass
+
+    monkeypatch.setenv("LERULI_API_SECRET", "secret")
+    monkeypatch.setattr(archive, "upload_async", upload_async)
+    monkeypatch.setattr(task, "_pace_async", pace)
+    # no waiting between the attempts
+    delays = []
+    monkeypatch.setattr(
+        internal, "_retry_delay", lambda *args: delays.append(args) or 0
+    )
+    limiter = ratelimit.ConcurrencyLimiter(4, maximum=8)
+    client = AsyncS3()
+    result = asyncio.run(
+        task._async_object_stage(
+            client, str(tmp_path), "code", "1", ["run"], 1, 1000, 60, uploads=limiter
+        )
+    )
+    assert limiter.active == 0
+    return result, client, limiter, delays
+
+
+def test_upload_is_retried(tmp_path, monkeypatch):
+    result, client, limiter, delays = _stage(tmp_path, monkeypatch, [TimeoutError()])
+    assert result["bucketid"] == client.buckets[0]
+    assert len(client.buckets) == 1
+    assert limiter.limit == 2
+    assert delays == [(0, None)]
+
+
+def test_throttled_upload_waits(tmp_path, monkeypatch):
+    from botocore.exceptions import ClientError
+
+    monkeypatch.setenv("LERULI_RATELIMIT_S3", "100")
+    response = {
+        "Error": {"Code": "SlowDown", "Message": "Please reduce your request rate."},
+        "ResponseMetadata": {
+            "HTTPStatusCode": 503,
+            "HTTPHeaders": {"retry-after": "2"},
+        },
+    }
+    failures = [ClientError(response, "PutObject")]
+    result, client, limiter, delays = _stage(tmp_path, monkeypatch, failures)
+    assert "bucketid" in result
+    assert delays == [(0, "2")]
+    assert ratelimit.get_limiter("s3").rate == 50
+
+
+def test_failed_upload_is_reported(tmp_path, monkeypatch):
+    failures = [TimeoutError("slow")] * task.UPLOAD_ATTEMPTS
+    result, client, limiter, delays = _stage(tmp_path, monkeypatch, failures)
+    assert result == {"error": "Upload failed: slow", "directory": str(tmp_path)}
+    assert [_[0] for _ in delays] == list(range(task.UPLOAD_ATTEMPTS - 1))